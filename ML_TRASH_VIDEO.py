@@ -1,116 +1,108 @@
+import multiprocessing as mp
+import time
 import cv2
 import numpy as np
-from ultralytics import YOLO
-from sort import Sort
+from detection_cache import DetectionRecorder
+from ensemble import EnsembleDetector
+from live import LatencyStats
+from pipeline import DetectionPipeline, make_event
+from platform_stream import PlatformStream, enhance_contrast, remove_duplicates
+from scene_change import make_scene_stage
+from shm_pipeline import iter_events, run_inference_process
 from datetime import datetime
 from PySide6.QtCore import QThread, Signal
 
 class VideoProcessor(QThread):
     garbageDetected = Signal(str, str)
 
-    def __init__(self, video_path, model_path1, model_path2):
+    def __init__(self, video_path, model_path1, model_path2, decode_skip=False, threads=None, platform="Платформа №X",
+                 live=False, metrics=None, record=None, bus=None, backend="torch", int8=False, calibration=None,
+                 scene="diff"):
         super().__init__()
         self.video_path = video_path
-        self.model1 = YOLO(model_path1)
-        self.model2 = YOLO(model_path2)
-        self.tracker = Sort()
-        self.detected_objects = set()
+        # С event_bus.DetectionBus события идут в шину (GUI забирает их раз в такт), иначе — сигналом
+        self.bus = bus
+        # Обе модели работают параллельно на общем предобработанном кадре; backend — PyTorch,
+        # ONNX Runtime или OpenVINO (inference_backend), INT8 калибруется на этом же видео
+        self.detector = EnsembleDetector(model_path1, model_path2, imgsz=640, conf=(0.25, 0.25), threads=threads,
+                                         backend=backend, int8=int8, calibration=calibration or [video_path])
+        self.model1 = self.detector.model1
+        self.model2 = self.detector.model2
+
+        # Режим выборки: кадры между точками инференса только захватываются
+        # (cap.grab) без декодирования, CLAHE и перевода в оттенки серого
+        # В режиме live кадры читает отдельный поток захвата, а инференс берет самый свежий
+        # scene: "diff" — разница кадров, "mog2"/"average" — модель фона (scene_change.BackgroundModelStage)
+        self.stream = PlatformStream(video_path, platform, frame_interval=20, motion_threshold=50, decode_skip=decode_skip,
+                                     live=live, scene_stage=make_scene_stage(scene, 50))
+        self.alert_latency = LatencyStats()
+        # Запись сырых выходов моделей для повторного прогона фильтров и трекера (replay_cli.py)
+        if record is not None:
+            self.stream.recorder = DetectionRecorder(record, self.stream)
+
+        # Время этапов и счетчики (metrics.Metrics), например для MetricsServer
+        self.metrics = metrics
+        if metrics is not None:
+            self.detector.metrics = metrics
+            self.stream.metrics = metrics
+            metrics.register_stream(self.stream)
+            metrics.register_latency("capture_to_alert", self.alert_latency)
+        self.tracker = self.stream.tracker
+        self.static_objects = self.stream.static_objects
 
     def run(self):
-        cap = cv2.VideoCapture(self.video_path)
-        frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-        frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        fps = int(cap.get(cv2.CAP_PROP_FPS))
-
-        # Определите максимальную площадь объекта (0.5% от площади кадра)
-        max_object_area = frame_width * frame_height * 0.005
-
-        # Initialize variables for motion detection
-        prev_frame = None
-        motion_threshold = 50  # Adjust this threshold based on your needs
-
-        frame_interval = 20  # Process every 20th frame
-        frame_count = 0  # Frame counter
-
-        while cap.isOpened():
-            success, frame = cap.read()
-            if success:
-                # Улучшение контрастности кадра
-                frame = self.enhance_contrast(frame)
-
-                # Convert the frame to grayscale
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-                # Initialize prev_frame with the first frame
-                if prev_frame is None:
-                    prev_frame = gray
-                    frame_count += 1
-                    continue
-
-                # Compute the absolute difference between the current frame and previous frame
-                frame_diff = cv2.absdiff(prev_frame, gray)
-                _, motion_mask = cv2.threshold(frame_diff, motion_threshold, 255, cv2.THRESH_BINARY)
-
-                if frame_count % frame_interval == 0:
-                    results1 = self.model1(frame, conf=0.25, save=False, imgsz=640)
-                    results2 = self.model2(frame, conf=0.25, save=False, imgsz=640)
-
-                    boxes1 = results1[0].boxes.data.cpu().numpy()
-                    boxes2 = results2[0].boxes.data.cpu().numpy()
-                    combined_boxes = np.vstack((boxes1, boxes2))
-
-                    unique_boxes = self.remove_duplicates(combined_boxes)
-
-                    annotated_frame = frame.copy()
-                    detections = []
-
-                    if len(unique_boxes) > 0:
-                        for box in unique_boxes:
-                            x1, y1, x2, y2, conf, cls = box
-                            width = x2 - x1
-                            height = y2 - y1
-                            object_area = width * height
-
-                            # Игнорировать объекты, занимающие более 0.5% площади кадра
-                            if object_area > max_object_area:
-                                continue
-
-                            # Check if the object is NOT moving
-                            object_region = motion_mask[int(y1):int(y2), int(x1):int(x2)]
-                            if cv2.countNonZero(object_region) == 0:
-                                label = f'{"TRASH"} {conf:.2f}'
-                                cv2.rectangle(annotated_frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
-                                cv2.putText(annotated_frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-                                detections.append([x1, y1, x2, y2, conf])
-
-                    # Update tracker
-                    if detections:
-                        detections = np.array(detections)
-                        trackers = self.tracker.update(detections)
-
-                        # Check for new detections
-                        for track in trackers:
-                            x1, y1, x2, y2, obj_id = map(int, track)
-
-                            if obj_id not in self.detected_objects:
-                                self.detected_objects.add(obj_id)
-                                time_str = datetime.now().strftime("%H:%M")
-                                platform_str = "Платформа №X"  # Replace with actual data
-                                self.garbageDetected.emit(time_str, platform_str)
-
-                    cv2.imshow("YOLO Inference", annotated_frame)
-
-                prev_frame = gray
-                frame_count += 1
-
-                if cv2.waitKey(1) & 0xFF == ord("q"):
-                    break
-            else:
+        self.stream.open()
+
+        while True:
+            sample = self.stream.next_sample()
+            if sample is None:
+                break
+            frame, motion_mask = sample.frame, sample.motion_mask
+
+            started = time.perf_counter()
+            boxes = self.detector.detect(frame)
+            combined_boxes = np.vstack(boxes)
+            elapsed = time.perf_counter() - started
+            self.stream.metrics.observe("detect", elapsed)
+            if self.stream.scheduler is not None:
+                self.stream.scheduler.record_inference(elapsed)
+            if self.stream.recorder is not None:
+                self.stream.recorder.add(sample, *boxes)
+            annotated_frame, new_tracks = self.stream.process(combined_boxes, frame, motion_mask,
+                                                              mask_scale=sample.mask_scale,
+                                                              frame_index=sample.frame_index,
+                                                              static_mask=sample.static_mask)
+
+            for track in new_tracks:
+                # Время уведомления — время захвата кадра, а не окончания обработки
+                if self.bus is not None:
+                    self.bus.publish(make_event(self.stream, track, sample.captured_at))
+                else:
+                    time_str = datetime.fromtimestamp(sample.captured_at).strftime("%H:%M")
+                    self.garbageDetected.emit(time_str, self.stream.platform)
+                self.alert_latency.add(time.time() - sample.captured_at)
+
+            with self.stream.metrics.time("imshow"):
+                cv2.imshow("YOLO Inference", annotated_frame)
+
+            if cv2.waitKey(1) & 0xFF == ord("q"):
                 break
 
-        cap.release()
+        self.stream.release()
         cv2.destroyAllWindows()
+        if self.stream.recorder is not None:
+            self.stream.recorder.save()
+
+        print(self.frame_stats())
+        print(self.alert_latency.summary("capture-to-alert"))
+
+    def frame_stats(self):
+        """
+        Сводка по кадрам последнего запуска: сколько прочитано, декодировано и передано в модели.
+
+        :return: Строка со счетчиками кадров.
+        """
+        return self.stream.frame_stats()
 
     def enhance_contrast(self, image):
         """
@@ -119,29 +111,116 @@ class VideoProcessor(QThread):
         :param image: Входное изображение в формате BGR.
         :return: Изображение с улучшенной контрастностью.
         """
-        # Преобразуем изображение в цветовое пространство LAB
-        lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+        return enhance_contrast(image)
 
-        # Разделяем компоненты LAB
-        l, a, b = cv2.split(lab)
+    def remove_duplicates(self, boxes, iou_threshold=0.5, score_threshold=0.2):
+        return remove_duplicates(boxes, iou_threshold, score_threshold)
 
-        # Создаем объект CLAHE
-        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
 
-        # Применяем CLAHE к L-каналу
-        enhanced_l = clahe.apply(l)
+class VideoProcessorPool(QThread):
+    """
+    Обработка нескольких камер с общими моделями в фоновом потоке Qt.
 
-        # Объединяем улучшенный L-канал с оригинальными A и B каналами
-        enhanced_lab = cv2.merge((enhanced_l, a, b))
+    Сам цикл обработки — DetectionPipeline: выбранные кадры всех камер проходят через
+    модели одним пакетом за такт, а новые объекты приходят сюда и отправляются
+    в GUI сигналом garbageDetected с платформой своей камеры или, если задана
+    шина bus, публикуются в нее, и GUI забирает их пачкой раз в такт.
+    """
+    garbageDetected = Signal(str, str)
+    firstFrameProcessed = Signal(float)  # time.perf_counter() момента обработки первого кадра
 
-        # Преобразуем изображение обратно в цветовое пространство BGR
-        enhanced_image = cv2.cvtColor(enhanced_lab, cv2.COLOR_LAB2BGR)
+    def __init__(self, sources, model_path1=None, model_path2=None, decode_skip=True, threads=None, display=False,
+                 detector=None, scheduler=None, live=False, processes=False, metrics=None, bus=None,
+                 backend="torch", int8=False, calibration=None, scene="diff"):
+        """
+        :param sources: Список пар (источник, название платформы).
+        :param model_path1: Путь к весам первой модели.
+        :param model_path2: Путь к весам второй модели.
+        :param decode_skip: Пропускать промежуточные кадры без декодирования.
+        :param threads: Число intra-op потоков для каждой модели (n1, n2), см. EnsembleDetector.
+        :param display: Показывать размеченные кадры каждой камеры в отдельном окне.
+        :param detector: Уже загруженный EnsembleDetector (например, из ModelLoader);
+                         если задан, пути к моделям не нужны.
+        :param scheduler: scheduler.InferenceScheduler, общий для всех камер; без него
+                          инференс на каждом 20-м кадре.
+        :param live: Живые источники: обрабатывать самый свежий кадр, отбрасывая устаревшие.
+        :param processes: Декодирование каждой камеры и инференс в отдельных процессах
+                          (shm_pipeline); в GUI приходят только записи о событиях.
+                          Модели загружаются в процессе инференса, detector не используется.
+        :param metrics: metrics.Metrics для времени этапов и счетчиков (без processes).
+        :param bus: event_bus.DetectionBus: события объединяются и передаются в GUI
+                    пачками вместо сигнала на каждый трек.
+        :param backend: Бэкенд инференса: "torch", "onnxruntime" или "openvino".
+        :param int8: INT8-версии моделей (onnxruntime и openvino).
+        :param calibration: Видео для калибровки INT8 при первом экспорте; по умолчанию источники.
+        :param scene: Этап анализа сцены каждой камеры: "diff" — разница кадров,
+                      "mog2"/"average" — модель фона (scene_change.BackgroundModelStage).
+        """
+        super().__init__()
+        self.bus = bus
+        self.model_paths = (model_path1, model_path2)
+        self.threads = threads
+        self.processes = processes
+        self._stop_event = None
+        self.backend_options = {"backend": backend, "int8": int8,
+                                "calibration": calibration or [source for source, _ in sources]}
+        # Одна копия обеих моделей на все камеры
+        if detector is None and not processes:
+            detector = EnsembleDetector(model_path1, model_path2, imgsz=640, conf=(0.25, 0.25), threads=threads,
+                                        **self.backend_options)
+        self.detector = detector
+        self.streams = [
+            PlatformStream(source, platform, frame_interval=20, motion_threshold=50, decode_skip=decode_skip,
+                           scheduler=scheduler, live=live, scene_stage=make_scene_stage(scene, 50))
+            for source, platform in sources
+        ]
+        self.display = display
+        self.metrics = metrics
+        self.pipeline = None
+
+    def _emit_detection(self, event):
+        if self.bus is not None:
+            self.bus.publish(event)
+            return
+        time_str = datetime.fromisoformat(event["time"]).strftime("%H:%M")
+        self.garbageDetected.emit(time_str, event["platform"])
 
-        return enhanced_image
+    def run(self):
+        if self.processes:
+            self._run_processes()
+            return
+
+        self.pipeline = DetectionPipeline(self.streams, self.detector, display=self.display,
+                                          on_detection=self._emit_detection,
+                                          on_first_frame=self.firstFrameProcessed.emit, metrics=self.metrics)
+        self.pipeline.run()
+
+        for stream in self.streams:
+            print(stream.frame_stats())
+        print(self.pipeline.latency_summary())
+
+    def _run_processes(self):
+        ctx = mp.get_context("spawn")
+        events = ctx.Queue()
+        self._stop_event = ctx.Event()
+        # Не daemon: процесс инференса сам запускает процессы камер
+        process = ctx.Process(target=run_inference_process,
+                              args=(self.streams, *self.model_paths, events, self._stop_event, self.threads),
+                              kwargs={"backend_options": self.backend_options})
+        process.start()
+        for kind, payload in iter_events(events, process):
+            if kind == "detection":
+                self._emit_detection(payload)
+            elif kind == "first_frame":
+                self.firstFrameProcessed.emit(time.perf_counter())
+            elif kind == "stats":
+                for line in payload:
+                    print(line)
+        process.join()
+
+    def stop(self):
+        if self._stop_event is not None:
+            self._stop_event.set()
+        if self.pipeline is not None:
+            self.pipeline.stop()
 
-    def remove_duplicates(self, boxes, iou_threshold=0.5, score_threshold=0.2):
-        indices = cv2.dnn.NMSBoxes(boxes[:, :4], boxes[:, 4], score_threshold, iou_threshold)
-        if len(indices) > 0:
-            return boxes[indices.flatten()]
-        else:
-            return np.array([])
\ No newline at end of file
@@ -1,24 +1,29 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import cv2
 import numpy as np
-from ultralytics import YOLO
+from inference_backend import BACKENDS, export_model, load_backend_model
+from static_registry import StationaryRegistry
+
+VIDEO_EXTENSIONS = (".mkv", ".mp4", ".avi", ".mov")
 
-# Load the YOLO models
-model1 = YOLO('D:/ProjectVC/norm.pt')
-model2 = YOLO('D:/ProjectVC/yolov8m-seg.pt')
+# Определите интервал кадров
+frame_interval = 30  # Обрабатывать каждый 40-й кадр
 
-# Open the video file
-video_path = "Платформа Мусор-2.mkv"
-cap = cv2.VideoCapture(video_path)
+# Размер входа моделей
+imgsz = 1088
 
-frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-fps = cap.get(cv2.CAP_PROP_FPS)
-fps = int(fps)
+# Параметры реестра неподвижных объектов
+stationary_threshold = 2  # Number of frames to consider an object stationary
+coordinate_tolerance = 200  # Tolerance for coordinate changes
+stationary_ttl = 10 * frame_interval  # Объект забывается, если его не видели столько кадров
 
-# Define the codec and create VideoWriter object
-output_path = "predict_video.mp4"  # Specify the output file path and name
-fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Use 'mp4v' for .mp4 output (common codec)
-out = cv2.VideoWriter(output_path, fourcc, fps, (frame_width, frame_height))
 
 # Function to remove duplicate detections
 def remove_duplicates(boxes, iou_threshold=0.5, score_threshold=0.2):
@@ -28,90 +33,338 @@ def remove_duplicates(boxes, iou_threshold=0.5, score_threshold=0.2):
     else:
         return np.array([])
 
-# Определите интервал кадров
-frame_interval = 30  # Обрабатывать каждый 40-й кадр
-frame_count = 0  # Счетчик кадров
 
-# Определите максимальную площадь объекта (0.5% от площади кадра)
-max_object_area = frame_width * frame_height * 0.005
+def load_models(model_path1, model_path2, backend="torch", int8=False, calibration=None, threads=None):
+    # Load the YOLO models: PyTorch или экспортированные для ONNX Runtime / OpenVINO (inference_backend)
+    return tuple(load_backend_model(path, backend, imgsz, threads, int8, calibration)
+                 for path in (model_path1, model_path2))
 
-# Initialize a dictionary to store object positions
-object_positions = {}
-stationary_threshold = 2  # Number of frames to consider an object stationary
-coordinate_tolerance = 200  # Tolerance for coordinate changes
 
-# Loop through the video frames
-while cap.isOpened():
-    # Read a frame from the video
-    success, frame = cap.read()
-
-    if success:
-        # Обрабатываем только кадры, которые соответствуют интервалу
-        if frame_count % frame_interval == 0:
-            # Run YOLO inference on the frame using the first model
-            results1 = model1(frame, conf=0.20, save=False, imgsz=1088)
-
-            # Run YOLO inference on the frame using the second model
-            results2 = model2(frame, conf=0.25, save=False, imgsz=1088)
-
-            # Combine the results from both models
-            boxes1 = results1[0].boxes.data.cpu().numpy()
-            boxes2 = results2[0].boxes.data.cpu().numpy()
-            combined_boxes = np.vstack((boxes1, boxes2))
-
-            # Remove duplicate detections
-            unique_boxes = remove_duplicates(combined_boxes)
-
-            # Visualize the combined results on the frame
-            annotated_frame = frame.copy()
-            if len(unique_boxes) > 0:  # Check if there are any boxes to draw
-                for box in unique_boxes:
-                    x1, y1, x2, y2, conf, cls = box
-                    width = x2 - x1
-                    height = y2 - y1
-                    object_area = width * height
-
-                    # Игнорировать объекты, занимающие более 0.5% площади кадра
-                    if object_area > max_object_area:
-                        continue
-
-                    label = f'{"TRASH"} {conf:.2f}'
-                    cv2.rectangle(annotated_frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
-                    cv2.putText(annotated_frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-                    # Store the object position
-                    object_id = (int(x1), int(y1), int(x2), int(y2))
-                    if object_id not in object_positions:
-                        object_positions[object_id] = []
-                    object_positions[object_id].append((frame_count, (x1, y1, x2, y2)))
-
-                    # Check if the object has not moved for `stationary_threshold` frames
-                    if len(object_positions[object_id]) > stationary_threshold:
-                        positions = object_positions[object_id][-stationary_threshold:]
-                        # Calculate the average position change
-                        avg_position_change = np.mean([np.linalg.norm(np.array(pos[1]) - np.array(positions[0][1])) for pos in positions])
-                        if avg_position_change < coordinate_tolerance:  # Threshold for considering the object stationary
-                            cv2.rectangle(annotated_frame, (int(x1), int(y1)), (int(x2), int(y2)), (255, 0, 0), 2)
-                            cv2.putText(annotated_frame, "Stationary", (int(x1), int(y1) - 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+def make_registry():
+    # Объект считается неподвижным после stationary_threshold + 1 наблюдений
+    return StationaryRegistry(tolerance=coordinate_tolerance, history=stationary_threshold,
+                              stationary_hits=stationary_threshold + 1, max_idle=stationary_ttl)
+
+
+def annotate_frame(frame, frame_count, models, registry, max_object_area):
+    """
+    Запускает обе модели на кадре, рисует найденные объекты и отмечает неподвижные.
+
+    :param frame: Кадр в формате BGR.
+    :param frame_count: Номер кадра в видео.
+    :param models: Пара моделей YOLO.
+    :param registry: StationaryRegistry с историей позиций объектов (обновляется на месте).
+    :param max_object_area: Максимальная площадь объекта в пикселях.
+    :return: Кортеж (annotated_frame, detections) — размеченный кадр и список детекций.
+    """
+    model1, model2 = models
+
+    # Run YOLO inference on the frame using the first model
+    results1 = model1(frame, conf=0.20, save=False, imgsz=imgsz, verbose=False)
+
+    # Run YOLO inference on the frame using the second model
+    results2 = model2(frame, conf=0.25, save=False, imgsz=imgsz, verbose=False)
+
+    # Combine the results from both models
+    boxes1 = results1[0].boxes.data.cpu().numpy()
+    boxes2 = results2[0].boxes.data.cpu().numpy()
+    combined_boxes = np.vstack((boxes1, boxes2))
+
+    # Remove duplicate detections
+    unique_boxes = remove_duplicates(combined_boxes)
+
+    # Visualize the combined results on the frame
+    annotated_frame = frame.copy()
+    detections = []
+    if len(unique_boxes) > 0:  # Check if there are any boxes to draw
+        for box in unique_boxes:
+            x1, y1, x2, y2, conf, cls = box
+            width = x2 - x1
+            height = y2 - y1
+            object_area = width * height
+
+            # Игнорировать объекты, занимающие более 0.5% площади кадра
+            if object_area > max_object_area:
+                continue
+
+            label = f'{"TRASH"} {conf:.2f}'
+            cv2.rectangle(annotated_frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+            cv2.putText(annotated_frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+            # Store the object position: рамка сопоставляется с ближайшим объектом
+            # в пределах coordinate_tolerance, а не по точным координатам
+            _, stationary = registry.observe((x1, y1, x2, y2), frame_count)
+
+            # Check if the object has not moved for `stationary_threshold` frames
+            if stationary:
+                cv2.rectangle(annotated_frame, (int(x1), int(y1)), (int(x2), int(y2)), (255, 0, 0), 2)
+                cv2.putText(annotated_frame, "Stationary", (int(x1), int(y1) - 25), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 0), 2)
+
+            detections.append({
+                "box": [round(float(v), 1) for v in (x1, y1, x2, y2)],
+                "confidence": round(float(conf), 3),
+                "stationary": stationary,
+            })
+
+    return annotated_frame, detections
+
+
+def process_range(cap, models, start, end, max_object_area, out=None, display=False, warmup_start=None):
+    """
+    Обрабатывает кадры [start, end) видео: инференс на каждом frame_interval-м кадре.
+
+    :param cap: Открытый cv2.VideoCapture.
+    :param models: Пара моделей YOLO.
+    :param start: Первый кадр, который пишется в результат.
+    :param end: Кадр, на котором обработка останавливается (None — до конца видео).
+    :param max_object_area: Максимальная площадь объекта в пикселях.
+    :param out: cv2.VideoWriter для размеченных кадров или None.
+    :param display: Показывать размеченные кадры в окне.
+    :param warmup_start: Кадр, с которого начинается прогрев истории позиций (до start);
+                         кадры прогрева обрабатываются, но не пишутся в результат.
+    :return: Кортеж (log, frames_read) — записи о детекциях и число прочитанных кадров
+             начиная со start (кадры прогрева не считаются).
+    """
+    registry = make_registry()
+    log = []
+    frame_count = start if warmup_start is None else warmup_start
+    if frame_count > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
+    frames_read = 0
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+
+    # Loop through the video frames
+    while cap.isOpened() and (end is None or frame_count < end):
+        # Обрабатываем только кадры, которые соответствуют интервалу; остальные не декодируем
+        if frame_count % frame_interval != 0:
+            if not cap.grab():
+                break
+            frames_read += frame_count >= start
+            frame_count += 1
+            continue
+
+        # Read a frame from the video
+        success, frame = cap.read()
+        if not success:
+            # Break the loop if the end of the video is reached
+            break
+        frames_read += frame_count >= start
+
+        annotated_frame, detections = annotate_frame(frame, frame_count, models, registry, max_object_area)
+
+        if frame_count >= start:
+            for detection in detections:
+                log.append(dict(frame=frame_count, seconds=round(frame_count / fps, 2), **detection))
 
             # Display the annotated frame
-            cv2.imshow("YOLO Inference", annotated_frame)
+            if display:
+                cv2.imshow("YOLO Inference", annotated_frame)
 
             # Write the annotated frame to the output video
-            out.write(annotated_frame)
+            if out is not None:
+                out.write(annotated_frame)
 
         # Увеличиваем счетчик кадров
         frame_count += 1
 
         # Break the loop if 'q' is pressed
-        if cv2.waitKey(1) & 0xFF == ord("q"):
+        if display and cv2.waitKey(1) & 0xFF == ord("q"):
             break
+
+    return log, frames_read
+
+
+def open_writer(path, cap):
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = int(cap.get(cv2.CAP_PROP_FPS))
+    # Define the codec and create VideoWriter object
+    fourcc = cv2.VideoWriter_fourcc(*'mp4v')  # Use 'mp4v' for .mp4 output (common codec)
+    return cv2.VideoWriter(path, fourcc, fps, (frame_width, frame_height))
+
+
+def max_area(cap):
+    # Определите максимальную площадь объекта (0.5% от площади кадра)
+    return int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) * int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) * 0.005
+
+
+def write_log(path, log):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in log:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def run_serial(video_path, output_path, models, log_path=None, display=True):
+    # Open the video file
+    cap = cv2.VideoCapture(video_path)
+    out = open_writer(output_path, cap)
+
+    log, _ = process_range(cap, models, 0, None, max_area(cap), out=out, display=display)
+
+    # Release the video capture object and close the display window
+    cap.release()
+    out.release()
+    if display:
+        cv2.destroyAllWindows()
+    if log_path:
+        write_log(log_path, log)
+
+
+# -------------------------------
+# Пакетный режим: сегменты видео в пуле процессов
+# -------------------------------
+_worker_models = None
+
+
+def _init_worker(model_path1, model_path2, torch_threads, backend="torch", int8=False):
+    # Модели загружаются один раз на процесс-обработчик; экспорт уже сделан в главном процессе
+    global _worker_models
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+    _worker_models = load_models(model_path1, model_path2, backend, int8, threads=torch_threads)
+
+
+def _process_segment(video_path, index, start, end, segment_path):
+    started = time.perf_counter()
+    cap = cv2.VideoCapture(video_path)
+    out = open_writer(segment_path, cap)
+    # История позиций восстанавливается на нескольких точках инференса до начала сегмента,
+    # чтобы неподвижные объекты на стыке сегментов отмечались так же, как при последовательной обработке
+    warmup_start = max(0, start - (stationary_threshold + 1) * frame_interval)
+    log, frames_read = process_range(cap, _worker_models, start, end, max_area(cap), out=out, warmup_start=warmup_start)
+    cap.release()
+    out.release()
+    return {
+        "video": video_path,
+        "index": index,
+        "path": segment_path,
+        "log": log,
+        "frames": frames_read,
+        "seconds": time.perf_counter() - started,
+        "pid": os.getpid(),
+    }
+
+
+def split_segments(video_path, segment_seconds):
+    """
+    Делит видео на сегменты по времени. Границы кратны frame_interval,
+    поэтому инференс выполняется на тех же кадрах, что и при последовательной обработке.
+
+    :return: Список пар (start, end) номеров кадров.
+    """
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    cap.release()
+    length = max(frame_interval, int(segment_seconds * fps) // frame_interval * frame_interval)
+    return [(start, min(start + length, total)) for start in range(0, total, length)]
+
+
+def stitch(segment_paths, output_path):
+    # Склеиваем размеченные сегменты в одно видео в исходном порядке
+    out = None
+    for path in segment_paths:
+        cap = cv2.VideoCapture(path)
+        if out is None:
+            out = open_writer(output_path, cap)
+        while True:
+            success, frame = cap.read()
+            if not success:
+                break
+            out.write(frame)
+        cap.release()
+    if out is not None:
+        out.release()
+
+
+def run_batch(video_paths, output_dir, model_path1, model_path2, workers, segment_seconds, torch_threads=None,
+              backend="torch", int8=False):
+    if backend != "torch":
+        # Экспорт (и калибровка INT8) один раз до запуска пула, а не в каждом процессе
+        for model_path in (model_path1, model_path2):
+            export_model(model_path, backend, imgsz, int8, calibration=video_paths)
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix="egor_segments_")
+    started = time.perf_counter()
+
+    tasks = []
+    for video_path in video_paths:
+        for index, (start, end) in enumerate(split_segments(video_path, segment_seconds)):
+            stem = os.path.splitext(os.path.basename(video_path))[0]
+            segment_path = os.path.join(tmp_dir, f"{stem}_{index:05d}.mp4")
+            tasks.append((video_path, index, start, end, segment_path))
+
+    results = {}
+    worker_stats = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(model_path1, model_path2, torch_threads, backend, int8)) as pool:
+            futures = [pool.submit(_process_segment, *task) for task in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                results[(result["video"], result["index"])] = result
+                frames, seconds = worker_stats.get(result["pid"], (0, 0.0))
+                worker_stats[result["pid"]] = (frames + result["frames"], seconds + result["seconds"])
+                print("[%d/%d] %s #%d: %d frames in %.1f s (%.1f fps, worker %d)" % (
+                    done, len(tasks), os.path.basename(result["video"]), result["index"],
+                    result["frames"], result["seconds"], result["frames"] / max(result["seconds"], 1e-9),
+                    result["pid"]))
+
+        for video_path in video_paths:
+            segments = sorted((r for r in results.values() if r["video"] == video_path), key=lambda r: r["index"])
+            stem = os.path.splitext(os.path.basename(video_path))[0]
+            stitch([r["path"] for r in segments], os.path.join(output_dir, f"{stem}_predict.mp4"))
+            write_log(os.path.join(output_dir, f"{stem}_detections.jsonl"),
+                      [record for r in segments for record in r["log"]])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    total_frames = sum(frames for frames, _ in worker_stats.values())
+    for pid, (frames, seconds) in sorted(worker_stats.items()):
+        print("worker %d: %d frames, %.1f fps" % (pid, frames, frames / max(seconds, 1e-9)))
+    print("Total: %d frames in %.1f s (%.1f fps)" % (total_frames, elapsed, total_frames / max(elapsed, 1e-9)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Обработка записанного видео моделями YOLO")
+    parser.add_argument("input", nargs="?", default="Платформа Мусор-2.mkv",
+                        help="Видео или (в режиме --batch) папка с видео")
+    parser.add_argument("--output", default="predict_video.mp4",
+                        help="Размеченное видео; в режиме --batch — папка для результатов")
+    parser.add_argument("--model1", default="D:/ProjectVC/norm.pt")
+    parser.add_argument("--model2", default="D:/ProjectVC/yolov8m-seg.pt")
+    parser.add_argument("--log", default=None, help="Файл журнала детекций (JSON Lines) для последовательного режима")
+    parser.add_argument("--no-display", action="store_true", help="Не показывать кадры в окне")
+    parser.add_argument("--batch", action="store_true", help="Разбить видео на сегменты и обработать в пуле процессов")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Число процессов в пакетном режиме")
+    parser.add_argument("--segment-seconds", type=float, default=300.0, help="Длина сегмента в секундах [300]")
+    parser.add_argument("--torch-threads", type=int, default=None,
+                        help="intra-op потоков torch на процесс (по умолчанию ядра / workers)")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Бэкенд инференса; onnxruntime/openvino экспортируют модели в exports/ [torch]")
+    parser.add_argument("--int8", action="store_true",
+                        help="С --backend onnxruntime/openvino: INT8-квантизация, калибровка на входных видео")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.batch:
+        if os.path.isdir(args.input):
+            video_paths = sorted(os.path.join(args.input, name) for name in os.listdir(args.input)
+                                 if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            video_paths = [args.input]
+        torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+        output_dir = args.output if args.output != "predict_video.mp4" else "predict"
+        run_batch(video_paths, output_dir, args.model1, args.model2, args.workers, args.segment_seconds, torch_threads,
+                  backend=args.backend, int8=args.int8)
     else:
-        # Break the loop if the end of the video is reached
-        break
+        models = load_models(args.model1, args.model2, args.backend, args.int8, calibration=[args.input])
+        run_serial(args.input, args.output, models, log_path=args.log, display=not args.no_display)
 
-# Release the video capture object and close the display window
-cap.release()
-out.release()
-cv2.destroyAllWindows()
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Экспорт моделей для CPU-бэкендов и сравнение точности и задержки с PyTorch на наших кадрах.
+
+    python backend_cli.py --video snowplatform.mkv
+    python backend_cli.py --models norm.pt yolov8m-seg.pt --video snowplatform.mkv --int8 --frames 100 --json
+
+Экспортированные модели кэшируются в exports/ по хэшу весов; INT8-версии калибруются
+на кадрах --video (или --calibration), оценка идет на других кадрах тех же видео.
+"""
+import argparse
+import json
+
+from inference_backend import BACKENDS, DEFAULT_CACHE_DIR, compare_backends, read_frames
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Сравнение бэкендов инференса YOLO на CPU")
+    parser.add_argument("--models", nargs="+", default=["norm.pt", "yolov8m-seg.pt"], help="Веса PyTorch")
+    parser.add_argument("--video", nargs="+", required=True, help="Видео, на кадрах которых идет сравнение")
+    parser.add_argument("--calibration", nargs="+", default=None,
+                        help="Видео для калибровки INT8 (по умолчанию --video)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS[1:], default=list(BACKENDS[1:]),
+                        help="Бэкенды для сравнения с PyTorch")
+    parser.add_argument("--int8", action="store_true", help="Добавить INT8-варианты")
+    parser.add_argument("--frames", type=int, default=50, help="Кадров для оценки [50]")
+    parser.add_argument("--imgsz", type=int, default=640, help="Размер входа [640]")
+    parser.add_argument("--conf", type=float, default=0.25, help="Порог уверенности [0.25]")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op потоков рантайма")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Кэш экспортированных моделей [exports]")
+    parser.add_argument("--json", action="store_true", help="Результаты в JSON Lines вместо таблицы")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    frames = read_frames(args.video, args.frames)
+    variants = [(backend, False) for backend in args.backends]
+    if args.int8:
+        variants += [(backend, True) for backend in args.backends]
+
+    if not args.json:
+        print("%-18s %-12s %4s %8s %8s %8s %6s %9s %7s %9s" % (
+            "model", "backend", "int8", "p50 ms", "p90 ms", "mean ms", "dets", "precision", "recall", "conf diff"))
+    for model_path in args.models:
+        report = compare_backends(model_path, frames, variants, imgsz=args.imgsz, conf=args.conf,
+                                  threads=args.threads, cache_dir=args.cache_dir,
+                                  calibration=args.calibration or args.video)
+        for row in report:
+            if args.json:
+                print(json.dumps(row, ensure_ascii=False))
+            else:
+                print("%-18s %-12s %4s %8.1f %8.1f %8.1f %6d %9.3f %7.3f %9.4f" % (
+                    row["model"][-18:], row["backend"], "yes" if row["int8"] else "no", row["p50_ms"],
+                    row["p90_ms"], row["mean_ms"], row["detections"], row["precision"], row["recall"],
+                    row["conf_diff"]))
+
+
+if __name__ == "__main__":
+    main()
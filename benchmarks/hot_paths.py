@@ -0,0 +1,279 @@
+"""
+Benchmarks for the detection and tracking hot paths.
+
+Everything runs on synthetic frames and seeded detection arrays (or a recorded MOT det.txt),
+without GPU, network or model weights, so results are reproducible and can be compared
+between commits:
+
+    python benchmarks/hot_paths.py --output before.json
+    git checkout <other commit>
+    python benchmarks/hot_paths.py --output after.json --compare before.json
+
+Cases: enhance_contrast, motion masking (frame diff and background model), motion_free,
+remove_duplicates, iou_batch, associate_detections_to_trackers at 100/1000/5000 boxes, Sort/BatchSort.update at
+10/100/1000 tracks and end-to-end DetectionPipeline throughput with a stub detector.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+import cv2
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from platform_stream import PlatformStream, enhance_contrast, motion_free, remove_duplicates  # noqa: E402
+from scene_change import BackgroundModelStage, FrameDiffStage  # noqa: E402
+from sort import BatchSort, Sort, associate_detections_to_trackers, iou_batch  # noqa: E402
+
+
+def synthetic_frame(rng, width, height):
+    # Гладкий фон с шумом: CLAHE и сжатие ведут себя как на реальном кадре, а не на белом шуме
+    small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+    frame = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    noise = rng.integers(0, 8, frame.shape, dtype=np.uint8)
+    return cv2.add(frame, noise)
+
+
+def random_boxes(rng, n, width, height, min_size=10, max_size=80):
+    xy = rng.uniform(0, [width - max_size, height - max_size], (n, 2))
+    wh = rng.uniform(min_size, max_size, (n, 2))
+    scores = rng.uniform(0.2, 1.0, (n, 1))
+    return np.hstack((xy, xy + wh, scores))
+
+
+def track_sequence(rng, n_objects, n_frames, width=1920, height=1080, miss_rate=0.05):
+    """
+    Seeded detections of objects moving linearly with jitter and occasional misses.
+
+    :return: List of (k, 5) arrays [x1, y1, x2, y2, score], one per frame.
+    """
+    start = random_boxes(rng, n_objects, width, height)
+    velocity = rng.normal(0, 2, (n_objects, 2))
+    frames = []
+    for t in range(n_frames):
+        boxes = start.copy()
+        boxes[:, [0, 2]] += velocity[:, :1] * t
+        boxes[:, [1, 3]] += velocity[:, 1:] * t
+        boxes[:, :4] += rng.normal(0, 1, (n_objects, 4))
+        frames.append(boxes[rng.random(n_objects) >= miss_rate])
+    return frames
+
+
+def load_mot_detections(path):
+    """
+    :param path: MOT det.txt (frame, id, x, y, w, h, score, ...).
+    :return: List of per-frame arrays [x1, y1, x2, y2, score].
+    """
+    dets = np.loadtxt(path, delimiter=",")
+    frames = []
+    for frame in range(1, int(dets[:, 0].max()) + 1):
+        boxes = dets[dets[:, 0] == frame, 2:7].copy()
+        boxes[:, 2:4] += boxes[:, 0:2]
+        frames.append(boxes)
+    return frames
+
+
+def measure(fn, repeat, number):
+    """
+    :return: Dict with median/min per call in microseconds.
+    """
+    fn()  # прогрев: кэши, ленивые импорты, выделение памяти
+    times = [t / number for t in timeit.repeat(fn, repeat=repeat, number=number)]
+    return {"median_us": statistics.median(times) * 1e6, "min_us": min(times) * 1e6,
+            "repeat": repeat, "number": number}
+
+
+def bench_frames(args, rng, results):
+    frame = synthetic_frame(rng, args.width, args.height)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    prev = cv2.cvtColor(synthetic_frame(rng, args.width, args.height), cv2.COLOR_BGR2GRAY)
+
+    results["enhance_contrast"] = measure(lambda: enhance_contrast(frame), args.repeat, 10)
+
+    diff = FrameDiffStage()
+    results["motion_mask.frame_diff"] = measure(lambda: diff.update(gray, prev), args.repeat, 20)
+    for method in ("mog2", "average"):
+        stage = BackgroundModelStage(method=method)
+        frames = [gray, prev]
+        state = {"i": 0}
+
+        def step(stage=stage, frames=frames, state=state):
+            state["i"] += 1
+            stage.update(frames[state["i"] % 2])
+        results["motion_mask.background_%s" % method] = measure(step, args.repeat, 20)
+
+    _, motion_mask = cv2.threshold(cv2.absdiff(gray, prev), 50, 255, cv2.THRESH_BINARY)
+    boxes = random_boxes(rng, 50, args.width, args.height)
+    results["motion_free.50"] = measure(lambda: motion_free(boxes, motion_mask), args.repeat, 100)
+
+
+def bench_boxes(args, rng, results):
+    boxes = np.hstack((random_boxes(rng, 200, args.width, args.height), np.zeros((200, 1))))
+    results["remove_duplicates.200"] = measure(lambda: remove_duplicates(boxes), args.repeat, 100)
+
+    for n in (100, 1000, 5000):
+        a = random_boxes(rng, n, args.width, args.height)
+        b = random_boxes(rng, n, args.width, args.height)
+        if n <= 1000:
+            results["iou_batch.%dx%d" % (n, n)] = measure(lambda: iou_batch(a, b), args.repeat, 10)
+
+        # Треки — слегка смещенные детекции, как после предсказания фильтра Калмана
+        trackers = a.copy()
+        trackers[:, :4] += rng.normal(0, 2, (n, 4))
+        number = 10 if n <= 100 else 1
+        results["associate.%d" % n] = measure(lambda: associate_detections_to_trackers(a, trackers),
+                                              args.repeat, number)
+
+
+def bench_trackers(args, rng, results):
+    try:
+        import filterpy.kalman  # noqa: F401  Sort creates KalmanBoxTracker (filterpy)
+        tracker_classes = (("sort", Sort), ("batch_sort", BatchSort))
+    except ImportError:
+        results["sort.skipped"] = {"reason": "filterpy is not installed"}
+        tracker_classes = (("batch_sort", BatchSort),)
+
+    sequences = {n: track_sequence(rng, n, args.track_frames + 5) for n in (10, 100, 1000)}
+    if args.mot_det:
+        sequences["mot"] = load_mot_detections(args.mot_det)
+
+    for name, cls in tracker_classes:
+        for n, frames in sequences.items():
+            warmup, timed = frames[:5], frames[5:]
+            # Каждый повтор — новый трекер, прогретый вне замера; время берется только
+            # у установившегося режима на том же экземпляре
+            times = []
+            for _ in range(max(3, args.repeat // 2) + 1):
+                tracker = cls(max_age=1, min_hits=3, iou_threshold=0.3)
+                for dets in warmup:
+                    tracker.update(dets)
+                started = time.perf_counter()
+                for dets in timed:
+                    tracker.update(dets)
+                times.append((time.perf_counter() - started) / max(1, len(timed)))
+            times = times[1:]  # первый повтор — прогрев кэшей и ленивых импортов
+            results["%s.update.%s" % (name, n)] = {
+                "median_us": statistics.median(times) * 1e6, "min_us": min(times) * 1e6,
+                "frames": len(timed), "repeat": len(times), "unit": "frame"}
+
+
+class StubDetector:
+    """
+    Detector with the EnsembleDetector batch interface that returns fixed boxes instantly.
+    """
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+    def detect_batch(self, frames):
+        return [(self.boxes, self.boxes[:0]) for _ in frames]
+
+    def detect_tiled_batch(self, frames, change_masks, overlap=0.2):
+        return self.detect_batch(frames)
+
+
+def write_video(path, rng, width, height, frames, fps=25):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), fps, (width, height))
+    base = synthetic_frame(rng, width, height)
+    for t in range(frames):
+        frame = base.copy()
+        x = (t * 7) % (width - 60)
+        frame[100:160, x:x + 60] = 255  # движущийся объект
+        writer.write(frame)
+    writer.release()
+
+
+def bench_pipeline(args, rng, results):
+    from pipeline import DetectionPipeline
+
+    boxes = np.array([[300, 300, 340, 340, 0.9, 0], [600, 400, 640, 450, 0.8, 0]], dtype=np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "synthetic.avi")
+        write_video(path, rng, args.width, args.height, args.video_frames)
+        for name, kwargs in (("every_20th", {}), ("every_20th_no_skip", {"decode_skip": False}),
+                             ("every_2nd", {"frame_interval": 2})):
+            times = []
+            for _ in range(max(3, args.repeat // 2)):
+                stream = PlatformStream(path, "bench", **kwargs)
+                pipeline = DetectionPipeline([stream], StubDetector(boxes))
+                started = timeit.default_timer()
+                pipeline.run()
+                times.append(timeit.default_timer() - started)
+            median = statistics.median(times)
+            results["pipeline.%s" % name] = {
+                "median_us": median * 1e6 / stream.frames_total, "fps": stream.frames_total / median,
+                "frames": stream.frames_total, "inferred": stream.frames_inferred, "unit": "frame"}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+            "opencv": cv2.__version__, "machine": platform.machine(), "system": platform.system(),
+            "cpu_count": os.cpu_count(), "opencv_threads": cv2.getNumThreads()}
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+    print("%-36s %12s %12s %8s" % ("case", "baseline us", "current us", "ratio"))
+    for name, result in results.items():
+        old = baseline.get(name, {}).get("median_us")
+        new = result.get("median_us")
+        if old is None or new is None:
+            continue
+        print("%-36s %12.1f %12.1f %7.2fx" % (name, old, new, new / old if old else float("nan")))
+
+
+GROUPS = {"frames": bench_frames, "boxes": bench_boxes, "trackers": bench_trackers, "pipeline": bench_pipeline}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hot-path benchmarks")
+    parser.add_argument("--only", nargs="*", choices=sorted(GROUPS), help="Run only these groups")
+    parser.add_argument("--width", type=int, default=1920, help="Synthetic frame width [1920]")
+    parser.add_argument("--height", type=int, default=1080, help="Synthetic frame height [1080]")
+    parser.add_argument("--repeat", type=int, default=7, help="Timing repeats per case [7]")
+    parser.add_argument("--track-frames", type=int, default=50, help="Frames per tracker case [50]")
+    parser.add_argument("--video-frames", type=int, default=200, help="Frames in the synthetic video [200]")
+    parser.add_argument("--mot-det", help="Also benchmark trackers on a recorded MOT det.txt")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed [0]")
+    parser.add_argument("--output", help="Write JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON to compare against")
+    args = parser.parse_args()
+
+    # Однопоточный OpenCV — результаты не зависят от числа ядер машины
+    cv2.setNumThreads(1)
+
+    results = {}
+    for name in args.only or GROUPS:
+        GROUPS[name](args, np.random.default_rng(args.seed), results)
+        print("done: %s" % name, file=sys.stderr)
+
+    report = {"meta": metadata(), "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+              "results": results}
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Import-time benchmark for the tracker core.
+
+Imports each module in a fresh interpreter several times, reports the median wall time and
+fails (exit code 1) if it exceeds the startup budget or if a display-only dependency
+(matplotlib, scikit-image, tkinter) was pulled in by the import.
+
+    python benchmarks/import_time.py [--budget-ms 250] [--repeat 7] [module ...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must never be loaded just by importing the tracker
+FORBIDDEN = ("matplotlib", "skimage", "tkinter", "filterpy")
+
+PROBE = """
+import json, sys, time
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+loaded = sorted(m for m in {forbidden!r} if m in sys.modules)
+print(json.dumps({{"seconds": elapsed, "loaded": loaded}}))
+"""
+
+
+def measure(module, repeat):
+    samples = []
+    loaded = set()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", PROBE.format(module=module, forbidden=FORBIDDEN)],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout
+        result = json.loads(out.strip().splitlines()[-1])
+        samples.append(result["seconds"])
+        loaded.update(result["loaded"])
+    return statistics.median(samples), sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark")
+    parser.add_argument("modules", nargs="*", default=["sort"])
+    parser.add_argument("--budget-ms", type=float, default=250.0, help="Startup budget per module [250]")
+    parser.add_argument("--repeat", type=int, default=7, help="Fresh interpreters per module [7]")
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        median, loaded = measure(module, args.repeat)
+        over = median * 1000 > args.budget_ms
+        failed |= over or bool(loaded)
+        print("%-12s %7.1f ms (budget %.0f ms)%s%s" % (
+            module, median * 1000, args.budget_ms,
+            "  OVER BUDGET" if over else "",
+            "  loaded: " + ", ".join(loaded) if loaded else ""))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
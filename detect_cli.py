@@ -0,0 +1,131 @@
+"""
+Headless-режим обнаружения мусора без Qt.
+
+Обрабатывает одну или несколько камер и пишет события о новых объектах
+(время захвата кадра, платформа, id трека, рамка, уверенность) в формате JSON Lines.
+
+    python detect_cli.py --stream snowplatform.mkv "Платформа №1" --stream rtsp://... "Платформа №2"
+    python detect_cli.py --stream snowplatform.mkv "Платформа №1" --output events.jsonl
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+
+from detection_cache import DetectionRecorder
+from ensemble import EnsembleDetector
+from inference_backend import BACKENDS
+from metrics import Metrics, MetricsLogger, MetricsServer
+from pipeline import DetectionPipeline
+from platform_stream import PlatformStream
+from scene_change import make_scene_stage
+from shm_pipeline import SharedMemoryPipeline
+from scheduler import InferenceScheduler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Headless обнаружение мусора с выводом событий в JSON Lines")
+    parser.add_argument("--stream", nargs=2, action="append", required=True, metavar=("SOURCE", "PLATFORM"),
+                        help="Источник видео и название платформы (можно указать несколько раз)")
+    parser.add_argument("--output", default="-", help="Файл для событий ('-' — stdout) [-]")
+    parser.add_argument("--model1", default="norm.pt", help="Веса первой модели [norm.pt]")
+    parser.add_argument("--model2", default="yolov8m-seg.pt", help="Веса второй модели [yolov8m-seg.pt]")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch",
+                        help="Бэкенд инференса; onnxruntime/openvino экспортируют модели в exports/ [torch]")
+    parser.add_argument("--int8", action="store_true",
+                        help="С --backend onnxruntime/openvino: INT8-квантизация, калибровка на кадрах видео")
+    parser.add_argument("--calibration", nargs="+", default=None,
+                        help="Видео для калибровки INT8 (по умолчанию источники --stream)")
+    parser.add_argument("--frame-interval", type=int, default=20, help="Инференс на каждом N-м кадре [20]")
+    parser.add_argument("--motion-threshold", type=int, default=50, help="Порог маски движения [50]")
+    parser.add_argument("--no-decode-skip", action="store_true", help="Декодировать все кадры, а не только выбранные")
+    parser.add_argument("--tiled", action="store_true",
+                        help="Инференс по плиткам в исходном разрешении, только на изменившихся участках")
+    parser.add_argument("--scene", choices=("diff", "mog2", "average"), default="diff",
+                        help="Этап анализа сцены: diff — модели на каждом выбранном кадре; mog2/average — "
+                             "модель фона, модели только при появлении нового неподвижного объекта [diff]")
+    parser.add_argument("--scene-scale", type=float, default=0.25, help="Масштаб модели фона [0.25]")
+    parser.add_argument("--refresh", type=int, default=None,
+                        help="С моделью фона: запускать модели не реже чем раз в N выбранных кадров")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Адаптивный интервал инференса вместо --frame-interval")
+    parser.add_argument("--min-interval", type=int, default=5, help="С --adaptive: интервал активной сцены [5]")
+    parser.add_argument("--max-interval", type=int, default=100, help="С --adaptive: интервал статичной сцены [100]")
+    parser.add_argument("--budget", type=float, default=0.8,
+                        help="С --adaptive: доля времени, доступная моделям для всех камер [0.8]")
+    parser.add_argument("--live", action="store_true",
+                        help="Живые источники: брать самый свежий кадр и отбрасывать устаревшие "
+                             "(видеофайлы читаются со своей частотой кадров)")
+    parser.add_argument("--processes", action="store_true",
+                        help="Декодировать каждую камеру в отдельном процессе с передачей кадров "
+                             "через разделяемую память (несовместимо с --adaptive)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Порт локального HTTP-эндпоинта /metrics (формат Prometheus)")
+    parser.add_argument("--metrics-log", type=float, default=None, metavar="SECONDS",
+                        help="Печатать в stderr время этапов и счетчики кадров каждые N секунд")
+    parser.add_argument("--record", metavar="DIR",
+                        help="Сохранять сырые выходы моделей в DIR/streamN.npz для replay_cli.py")
+    parser.add_argument("--record-exact", action="store_true",
+                        help="С --record: разница кадров в масштабе масок, без пулинга — replay_cli.py "
+                             "повторяет живой прогон точно (файлы больше)")
+    parser.add_argument("--display", action="store_true", help="Показывать размеченные кадры (нужен дисплей)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    scheduler = None
+    if args.adaptive:
+        scheduler = InferenceScheduler(min_interval=args.min_interval, max_interval=args.max_interval,
+                                       budget=args.budget)
+    streams = [
+        PlatformStream(source, platform, frame_interval=args.frame_interval,
+                       motion_threshold=args.motion_threshold, decode_skip=not args.no_decode_skip,
+                       tiled=args.tiled,
+                       scene_stage=make_scene_stage(args.scene, args.motion_threshold, args.scene_scale, args.refresh),
+                       scheduler=scheduler, live=args.live)
+        for source, platform in args.stream
+    ]
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+        for i, stream in enumerate(streams):
+            stream.recorder = DetectionRecorder(os.path.join(args.record, "stream%d.npz" % i), stream,
+                                                diff_scale=None if args.record_exact else 0.125)
+    detector = EnsembleDetector(args.model1, args.model2, imgsz=640, conf=(0.25, 0.25), backend=args.backend,
+                                int8=args.int8, calibration=args.calibration or [source for source, _ in args.stream])
+
+    out = sys.stdout if args.output == "-" else open(args.output, "a", encoding="utf-8")
+
+    def write_event(event):
+        out.write(json.dumps(event, ensure_ascii=False) + "\n")
+        out.flush()
+
+    metrics = Metrics() if args.metrics_port is not None or args.metrics_log else None
+    pipeline_class = SharedMemoryPipeline if args.processes else DetectionPipeline
+    pipeline = pipeline_class(streams, detector, display=args.display, on_detection=write_event, metrics=metrics)
+    server = MetricsServer(metrics, args.metrics_port).start() if args.metrics_port is not None else None
+    logger = MetricsLogger(metrics, args.metrics_log).start() if args.metrics_log else None
+    # SIGTERM/SIGINT останавливают обработку после текущего такта
+    signal.signal(signal.SIGTERM, lambda *_: pipeline.stop())
+    signal.signal(signal.SIGINT, lambda *_: pipeline.stop())
+
+    try:
+        pipeline.run()
+    finally:
+        if server is not None:
+            server.stop()
+        if logger is not None:
+            logger.stop()
+        detector.close()
+        if out is not sys.stdout:
+            out.close()
+
+    for stream in streams:
+        print(stream.frame_stats(), file=sys.stderr)
+    print(pipeline.latency_summary(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
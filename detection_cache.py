@@ -0,0 +1,209 @@
+"""
+Кэш выходов моделей и повторный прогон фильтрации и трекинга без YOLO.
+
+DetectionRecorder сохраняет для каждого кадра, на котором запускались модели,
+сырые детекции обеих моделей (boxes.data) и уменьшенную разницу кадров, из которой
+строится маска движения, а с моделью фона — и маску неподвижных областей. Файл — сжатый .npz с отдельным массивом на каждый столбец.
+
+Разница кадров хранится уменьшенной max-пулингом (по умолчанию 1/8 кадра): блок считается
+движущимся, если порог превышен хотя бы в одном его пикселе, а границы рамок округляются
+до блоков. Поэтому replay() с пулингом лишь приближает живой прогон — рамка, край которой
+попал в блок с движением, может отсеяться иначе. Для точного повтора запись ведется
+в масштабе масок потока (diff_scale=None).
+
+replay() прогоняет кэш через remove_duplicates, фильтр по площади, проверку движения
+и трекер PlatformStream с любыми параметрами — тысячи кадров в секунду, поэтому
+перебор max_area_fraction, motion_threshold, порогов NMS и параметров Sort интерактивен.
+"""
+import json
+import time
+
+import cv2
+import numpy as np
+
+from platform_stream import PlatformStream
+
+BOX_COLUMNS = ("x1", "y1", "x2", "y2", "conf", "cls")
+FORMAT_VERSION = 1
+
+
+def max_pool(image, factor):
+    """
+    Уменьшает изображение в factor раз, сохраняя максимум каждого блока: порог по
+    уменьшенной разнице срабатывает, если его превышает хотя бы один пиксель блока.
+    """
+    if factor <= 1:
+        # Копия: маски из FrameRing — представления слота, который процесс камеры перезапишет
+        return image.copy()
+    height, width = image.shape[:2]
+    pad_h, pad_w = -height % factor, -width % factor
+    if pad_h or pad_w:
+        image = cv2.copyMakeBorder(image, 0, pad_h, 0, pad_w, cv2.BORDER_CONSTANT, value=0)
+    height, width = image.shape[:2]
+    return image.reshape(height // factor, factor, width // factor, factor).max(axis=(1, 3))
+
+
+class DetectionRecorder:
+    """
+    Накапливает выходы моделей одного потока и записывает их в .npz.
+    """
+
+    def __init__(self, path, stream, diff_scale=0.125):
+        """
+        :param path: Файл кэша (.npz).
+        :param stream: PlatformStream, выходы которого записываются.
+        :param diff_scale: Масштаб сохраняемой разницы кадров относительно кадра; None — масштаб
+                           масок потока, без пулинга (точный повтор, файл больше).
+        """
+        self.path = path
+        self.stream = stream
+        self.diff_scale = diff_scale
+        self._frame_index = []
+        self._captured_at = []
+        self._diffs = []
+        self._statics = []
+        self._diff_scale = None
+        self._boxes = []
+        self._box_sample = []
+        self._box_model = []
+
+    def __len__(self):
+        return len(self._frame_index)
+
+    def add(self, sample, boxes1, boxes2):
+        """
+        :param sample: Sample, на котором запускались модели.
+        :param boxes1: Детекции первой модели (boxes.data, в координатах кадра).
+        :param boxes2: Детекции второй модели.
+        """
+        position = len(self._frame_index)
+        self._frame_index.append(sample.frame_index)
+        self._captured_at.append(sample.captured_at)
+
+        # Без разницы кадров (например, в live-режиме на первом кадре) движение не проверить
+        diff = sample.frame_diff if sample.frame_diff is not None else sample.motion_mask
+        factor = 1 if self.diff_scale is None else max(1, int(round(sample.mask_scale / self.diff_scale)))
+        pooled = max_pool(diff, factor)
+        if self._diff_scale is None:
+            self._diff_scale = sample.mask_scale / factor
+        if self._diffs and pooled.shape != self._diffs[0].shape:
+            raise ValueError("Размер разницы кадров изменился во время записи")
+        self._diffs.append(pooled)
+        # Этап анализа сцены у потока один, поэтому маска неподвижных областей есть либо у всех выборок, либо ни у одной
+        if (sample.static_mask is not None) != bool(self._statics) and position:
+            raise ValueError("Маска неподвижных областей появилась или пропала во время записи")
+        if sample.static_mask is not None:
+            self._statics.append(max_pool(sample.static_mask, factor))
+
+        for model, boxes in ((1, boxes1), (2, boxes2)):
+            if len(boxes):
+                self._boxes.append(np.asarray(boxes, dtype=np.float32)[:, :6])
+                self._box_sample.append(np.full(len(boxes), position, dtype=np.int32))
+                self._box_model.append(np.full(len(boxes), model, dtype=np.uint8))
+
+    def save(self):
+        """
+        Записывает кэш на диск.
+
+        :return: Путь к файлу.
+        """
+        boxes = np.concatenate(self._boxes) if self._boxes else np.empty((0, 6), dtype=np.float32)
+        stream = self.stream
+        meta = {
+            "version": FORMAT_VERSION,
+            "source": str(stream.source),
+            "platform": stream.platform,
+            "frame_size": list(stream.frame_size),
+            "frame_interval": stream.frame_interval,
+            "decode_skip": stream.decode_skip,
+            "motion_threshold": stream.motion_threshold,
+            "scene_stage": type(stream.scene_stage).__name__,
+            "diff_scale": self._diff_scale or self.diff_scale or 1.0,
+        }
+        columns = {name: boxes[:, i] for i, name in enumerate(BOX_COLUMNS)}
+        np.savez_compressed(
+            self.path,
+            meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            frame_index=np.asarray(self._frame_index, dtype=np.int64),
+            captured_at=np.asarray(self._captured_at, dtype=np.float64),
+            diff=np.stack(self._diffs) if self._diffs else np.empty((0, 0, 0), dtype=np.uint8),
+            **({"static": np.stack(self._statics)} if self._statics else {}),
+            sample=np.concatenate(self._box_sample) if self._box_sample else np.empty(0, dtype=np.int32),
+            model=np.concatenate(self._box_model) if self._box_model else np.empty(0, dtype=np.uint8),
+            **columns,
+        )
+        return self.path
+
+
+class DetectionCache:
+    """
+    Загруженный кэш: метаданные, столбцы детекций и разницы кадров.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.meta = json.loads(str(data["meta"]))
+            self.frame_index = data["frame_index"]
+            self.captured_at = data["captured_at"]
+            self.diff = data["diff"]
+            # Маски неподвижных областей есть только в записях с моделью фона
+            self.static = data["static"] if "static" in data.files else None
+            self.sample = data["sample"]
+            self.model = data["model"]
+            self.boxes = np.stack([data[name] for name in BOX_COLUMNS], axis=1)
+        # Детекции записаны по порядку выборок — границы выборок находим один раз
+        self._bounds = np.searchsorted(self.sample, np.arange(len(self.frame_index) + 1))
+
+    def __len__(self):
+        return len(self.frame_index)
+
+    def boxes_at(self, position):
+        """
+        :return: Кортеж (boxes1, boxes2) для выборки с порядковым номером position.
+        """
+        start, end = self._bounds[position], self._bounds[position + 1]
+        boxes, model = self.boxes[start:end], self.model[start:end]
+        return boxes[model == 1], boxes[model == 2]
+
+    def make_stream(self, **params):
+        """
+        PlatformStream для повторного прогона: параметры как у записи, кроме переданных.
+        """
+        stream = PlatformStream(self.meta["source"], self.meta["platform"],
+                                frame_interval=self.meta["frame_interval"],
+                                motion_threshold=params.pop("motion_threshold", self.meta["motion_threshold"]),
+                                decode_skip=self.meta["decode_skip"], **params)
+        stream.set_frame_size(*self.meta["frame_size"])
+        return stream
+
+
+def replay(cache, on_track=None, **params):
+    """
+    Прогоняет записанные детекции через фильтры и трекер PlatformStream.
+
+    :param cache: DetectionCache.
+    :param on_track: Вызывается с (frame_index, track) для каждого нового объекта.
+    :param params: Параметры PlatformStream: motion_threshold, max_area_fraction,
+                   nms_iou_threshold, nms_score_threshold, tracker_params.
+    :return: Словарь: число новых объектов, выборок и скорость (выборок/с).
+    """
+    stream = cache.make_stream(**params)
+    scale = cache.meta["diff_scale"]
+    threshold = stream.motion_threshold
+    new_objects = 0
+    started = time.perf_counter()
+    for position in range(len(cache)):
+        boxes1, boxes2 = cache.boxes_at(position)
+        # Маска движения — та же, что cv2.threshold(diff, threshold, 255, THRESH_BINARY)
+        motion_mask = (cache.diff[position] > threshold).view(np.uint8)
+        static_mask = cache.static[position] if cache.static is not None else None
+        _, new_tracks = stream.process(np.vstack((boxes1, boxes2)), None, motion_mask, annotate=False,
+                                       mask_scale=scale, frame_index=int(cache.frame_index[position]),
+                                       static_mask=static_mask)
+        new_objects += len(new_tracks)
+        if on_track is not None:
+            for track in new_tracks:
+                on_track(int(cache.frame_index[position]), track)
+    elapsed = time.perf_counter() - started
+    return {"new_objects": new_objects, "samples": len(cache),
+            "samples_per_second": len(cache) / elapsed if elapsed else float("inf")}
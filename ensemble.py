@@ -0,0 +1,227 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.data.augment import LetterBox
+from ultralytics.utils import ops
+
+from inference_backend import load_backend_model
+from metrics import NULL_METRICS
+
+
+# Загруженные модели переиспользуются между запусками обработки: веса читаются один раз
+_model_cache = {}
+_model_cache_lock = threading.Lock()
+# Общая модель может понадобиться нескольким EnsembleDetector сразу (например, пулу и еще
+# не завершившемуся старому потоку), а предиктор ultralytics и запрос OpenVINO хранят
+# состояние вызова — поэтому у каждой модели свой замок на время инференса
+_model_locks = {}
+
+
+def load_model(model_path, backend="torch", imgsz=640, threads=None, int8=False, calibration=None):
+    """
+    Возвращает модель из кэша, загружая веса только при первом обращении.
+
+    :param model_path: Путь к весам модели.
+    :param backend: "torch", "onnxruntime" или "openvino" (см. inference_backend).
+    :param imgsz: Размер входа экспортированной модели.
+    :param threads: Число intra-op потоков рантайма экспортированной модели.
+    :param int8: Использовать INT8-версию экспортированной модели.
+    :param calibration: Видео для калибровки INT8 при первом экспорте.
+    :return: Экземпляр YOLO или inference_backend.ExportedModel.
+    """
+    key = (os.path.abspath(model_path), backend, int8, threads if backend != "torch" else None,
+           imgsz if backend != "torch" else None)
+    with _model_cache_lock:
+        if key not in _model_cache:
+            model = load_backend_model(model_path, backend, imgsz, threads, int8, calibration)
+            _model_cache[key] = model
+            _model_locks[id(model)] = threading.Lock()
+        return _model_cache[key]
+
+
+def model_lock(model):
+    """
+    :return: Замок, под которым вызывается модель из load_model (общий для всех ее пользователей).
+    """
+    with _model_cache_lock:
+        return _model_locks.setdefault(id(model), threading.Lock())
+
+
+def tile_grid(height, width, tile, overlap=0.2):
+    """
+    Левые верхние углы перекрывающихся плиток tile x tile, покрывающих кадр.
+    Последняя плитка в ряду прижимается к краю кадра.
+
+    :return: Список пар (x, y).
+    """
+    def starts(size):
+        if size <= tile:
+            return [0]
+        step = max(1, int(tile * (1 - overlap)))
+        positions = list(range(0, size - tile, step))
+        positions.append(size - tile)
+        return positions
+
+    return [(x, y) for y in starts(height) for x in starts(width)]
+
+
+class EnsembleDetector:
+    """
+    Ансамбль из двух моделей YOLO (norm.pt и yolov8m-seg.pt).
+
+    Кадр проходит letterbox и перевод в тензор один раз, после чего обе модели
+    запускаются параллельно, каждая в своем потоке. Модели работают в PyTorch либо
+    в ONNX Runtime / OpenVINO (backend); у экспортированных моделей число intra-op
+    потоков свое для каждой сессии, у PyTorch оно одно на процесс.
+    """
+
+    def __init__(self, model_path1, model_path2, imgsz=640, conf=(0.25, 0.25), threads=None, backend="torch",
+                 int8=False, calibration=None):
+        """
+        :param model_path1: Путь к весам первой модели.
+        :param model_path2: Путь к весам второй модели.
+        :param imgsz: Размер входа моделей (сторона квадрата после letterbox).
+        :param conf: Порог уверенности для каждой из моделей.
+        :param threads: Число intra-op потоков для каждой модели (n1, n2). Для onnxruntime
+                        и openvino задается в сессии каждой модели; для torch число потоков
+                        общее на процесс, и обе модели используют max(n1, n2).
+                        По умолчанию ядра делятся между моделями поровну.
+        :param backend: "torch", "onnxruntime" или "openvino".
+        :param int8: INT8-версии моделей (только onnxruntime и openvino).
+        :param calibration: Видео для калибровки INT8 при первом экспорте.
+        """
+        if threads is None:
+            half = max(1, (os.cpu_count() or 2) // 2)
+            threads = (half, half)
+        self.threads = threads
+        self.backend = backend
+        self.model1 = load_model(model_path1, backend, imgsz, threads[0], int8, calibration)
+        self.model2 = load_model(model_path2, backend, imgsz, threads[1], int8, calibration)
+        self._locks = (model_lock(self.model1), model_lock(self.model2))
+        self.imgsz = imgsz
+        self.conf = conf
+        self.letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=False, stride=32)
+        self.metrics = NULL_METRICS  # metrics.Metrics: время preprocess/model1/model2
+
+        # torch.set_num_threads действует на весь процесс, поэтому задается один раз:
+        # разделить потоки между моделями PyTorch в одном процессе нельзя
+        if backend == "torch":
+            torch.set_num_threads(max(threads))
+
+        # По одному однопоточному исполнителю на модель: модели работают параллельно
+        self._executors = [ThreadPoolExecutor(max_workers=1) for _ in threads]
+
+    def preprocess(self, frame):
+        """
+        Letterbox кадра и перевод в нормированный тензор BCHW, общий для обеих моделей.
+
+        :param frame: Кадр в формате BGR.
+        :return: Тензор формы (1, 3, imgsz, imgsz) со значениями 0..1.
+        """
+        img = self.letterbox(image=frame)
+        img = img[..., ::-1].transpose(2, 0, 1)  # BGR -> RGB, HWC -> CHW
+        tensor = torch.from_numpy(np.ascontiguousarray(img)).float().div_(255.0)
+        return tensor.unsqueeze(0)
+
+    def _predict(self, model, lock, tensor, conf, frame_shapes, stage):
+        with self.metrics.time(stage), lock:
+            results = model(tensor, conf=conf, save=False, imgsz=self.imgsz, verbose=False)
+        batch_boxes = []
+        for result, frame_shape in zip(results, frame_shapes):
+            boxes = result.boxes.data.cpu().numpy().copy()
+            # Координаты возвращаются в системе letterbox-кадра — переводим в исходную
+            boxes[:, :4] = ops.scale_boxes(tensor.shape[2:], boxes[:, :4], frame_shape[:2])
+            batch_boxes.append(boxes)
+        return batch_boxes
+
+    def detect_batch(self, frames):
+        """
+        Запускает обе модели на пакете кадров: по одному вызову каждой модели на весь пакет.
+
+        :param frames: Список кадров в формате BGR (могут быть разного размера).
+        :return: Список кортежей (boxes1, boxes2) — по одному на кадр, в порядке frames.
+        """
+        if not frames:
+            return []
+        with self.metrics.time("preprocess"):
+            tensor = torch.cat([self.preprocess(frame) for frame in frames])
+        frame_shapes = [frame.shape for frame in frames]
+        futures = [
+            executor.submit(self._predict, model, lock, tensor, conf, frame_shapes, stage)
+            for executor, model, lock, conf, stage in zip(self._executors, (self.model1, self.model2), self._locks,
+                                                          self.conf, ("model1", "model2"))
+        ]
+        boxes1, boxes2 = (future.result() for future in futures)
+        return list(zip(boxes1, boxes2))
+
+    def detect_tiled_batch(self, frames, change_masks, overlap=0.2):
+        """
+        Инференс по плиткам в исходном разрешении: кадр режется на перекрывающиеся плитки
+        imgsz x imgsz, и модели запускаются только на плитках, где маска изменений не пуста.
+        Плитки всех кадров идут в модели одним пакетом, рамки переводятся в координаты кадра.
+
+        :param frames: Список кадров в формате BGR.
+        :param change_masks: Маски изменений (любого разрешения) или None — тогда все плитки.
+        :param overlap: Доля перекрытия соседних плиток.
+        :return: Список кортежей (boxes1, boxes2) — по одному на кадр, в порядке frames.
+        """
+        tile = self.imgsz
+        crops, owners = [], []
+        for i, (frame, mask) in enumerate(zip(frames, change_masks)):
+            height, width = frame.shape[:2]
+            if mask is not None:
+                sx, sy = mask.shape[1] / width, mask.shape[0] / height
+            for x, y in tile_grid(height, width, tile, overlap):
+                if mask is not None:
+                    region = mask[int(y * sy):int(np.ceil((y + tile) * sy)), int(x * sx):int(np.ceil((x + tile) * sx))]
+                    if cv2.countNonZero(region) == 0:
+                        continue
+                crops.append(frame[y:y + tile, x:x + tile])
+                owners.append((i, x, y))
+
+        per_frame = [([], []) for _ in frames]
+        for (i, x, y), tile_boxes in zip(owners, self.detect_batch(crops)):
+            for model_boxes, boxes in zip(per_frame[i], tile_boxes):
+                boxes[:, [0, 2]] += x
+                boxes[:, [1, 3]] += y
+                model_boxes.append(boxes)
+
+        empty = np.empty((0, 6), dtype=np.float32)
+        return [tuple(np.vstack(b) if b else empty for b in boxes) for boxes in per_frame]
+
+    def detect(self, frame):
+        """
+        Запускает обе модели на кадре и возвращает их детекции по отдельности.
+
+        :param frame: Кадр в формате BGR.
+        :return: Кортеж (boxes1, boxes2) массивов [x1, y1, x2, y2, conf, cls].
+        """
+        return self.detect_batch([frame])[0]
+
+    def __call__(self, frame):
+        """
+        Объединенные детекции обеих моделей, готовые для remove_duplicates.
+
+        :param frame: Кадр в формате BGR.
+        :return: Массив (N, 6) в формате [x1, y1, x2, y2, conf, cls].
+        """
+        return np.vstack(self.detect(frame))
+
+    def warmup(self, frame_shape=None):
+        """
+        Прогоняет обе модели на пустом кадре, чтобы первый настоящий кадр
+        не платил за ленивую инициализацию (создание предиктора, fuse слоев).
+
+        :param frame_shape: Форма пустого кадра (по умолчанию imgsz x imgsz x 3).
+        """
+        if frame_shape is None:
+            frame_shape = (self.imgsz, self.imgsz, 3)
+        self.detect(np.zeros(frame_shape, dtype=np.uint8))
+
+    def close(self):
+        for executor in self._executors:
+            executor.shutdown(wait=False)
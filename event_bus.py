@@ -0,0 +1,125 @@
+"""
+Шина событий обнаружения между потоками обработки и GUI.
+
+Потоки обработки вызывают publish() на каждый новый трек, GUI раз в такт таймера
+забирает накопленное одним вызовом drain(). Между ними:
+- события одной платформы, рамки которых пересекаются (с запасом margin пикселей)
+  с рамкой первого события области и пришли не позже window секунд после него,
+  сливаются в одно: пакет, распавшийся на несколько рамок, дает одно уведомление.
+  Область не растет и не продлевается при слиянии, поэтому на оживленной платформе
+  не поглощает постепенно соседний мусор;
+- очередь ограничена max_pending; при переполнении событие либо сливается с самым старым
+  ожидающим событием той же платформы (overflow="merge"), либо отбрасывается ("drop").
+  События других платформ никогда не вытесняются: если у платформы нет ожидающего
+  события, новое отбрасывается и учитывается в счетчике dropped.
+
+Шина не зависит от Qt, поэтому publish() можно вызывать из любого потока.
+"""
+import threading
+import time
+from collections import deque
+
+
+class Region:
+    """
+    Область кадра, в которой недавно было событие.
+    """
+    __slots__ = ("box", "created", "pending")
+
+    def __init__(self, box, created, pending):
+        self.box = box  # рамка первого события области
+        self.created = created
+        self.pending = pending  # событие, еще не забранное GUI, или None
+
+
+def _near(a, b, margin):
+    return a[0] - margin <= b[2] and b[0] - margin <= a[2] and a[1] - margin <= b[3] and b[1] - margin <= a[3]
+
+
+class DetectionBus:
+    """
+    Потокобезопасная очередь событий с объединением дублей и ограничением размера.
+    """
+
+    def __init__(self, window=30.0, margin=50, max_pending=100, overflow="merge", max_regions=200):
+        """
+        :param window: Сколько секунд после первого события области новые события в ней считаются дублями.
+        :param margin: Запас в пикселях при проверке пересечения рамок.
+        :param max_pending: Максимум событий, ожидающих GUI.
+        :param overflow: Что делать при переполнении: "merge" или "drop".
+        :param max_regions: Сколько недавних областей помнить на платформу.
+        """
+        if overflow not in ("merge", "drop"):
+            raise ValueError("overflow должен быть 'merge' или 'drop'")
+        self.window = window
+        self.margin = margin
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.max_regions = max_regions
+        self._lock = threading.Lock()
+        self._pending = []
+        self._regions = {}
+        self.published = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.delivered = 0
+
+    def publish(self, event, now=None):
+        """
+        :param event: Словарь события (pipeline.make_event): time, platform, box, ...
+        :param now: Монотонное время публикации; по умолчанию time.monotonic().
+        :return: True, если событие попадет в GUI отдельной записью.
+        """
+        now = time.monotonic() if now is None else now
+        box = event.get("box")
+        with self._lock:
+            self.published += 1
+            regions = self._regions.get(event["platform"])
+            if regions is None:
+                regions = self._regions[event["platform"]] = deque(maxlen=self.max_regions)
+
+            if box is not None:
+                for region in regions:
+                    if now - region.created <= self.window and _near(region.box, box, self.margin):
+                        if region.pending is not None:
+                            region.pending["count"] += 1
+                        self.coalesced += 1
+                        return False
+
+            if len(self._pending) >= self.max_pending:
+                if self.overflow == "merge":
+                    for pending in self._pending:
+                        if pending["platform"] == event["platform"]:
+                            pending["count"] += 1
+                            if box is not None:
+                                # Повторы в этом месте тоже засчитываются в то же уведомление
+                                regions.append(Region(list(box), now, pending))
+                            self.coalesced += 1
+                            return False
+                self.dropped += 1
+                return False
+
+            pending = dict(event, count=1)
+            self._pending.append(pending)
+            if box is not None:
+                # Устаревшие области вытесняются deque(maxlen) и проверкой window
+                regions.append(Region(list(box), now, pending))
+            return True
+
+    def drain(self):
+        """
+        Забирает все ожидающие события (для одного обновления GUI).
+
+        :return: Список событий от старых к новым; count — сколько детекций объединено.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            for regions in self._regions.values():
+                for region in regions:
+                    region.pending = None
+            self.delivered += len(pending)
+        return pending
+
+    def stats(self):
+        return "События: опубликовано %d, объединено %d, отброшено %d, передано в GUI %d" % (
+            self.published, self.coalesced, self.dropped, self.delivered)
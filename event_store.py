@@ -0,0 +1,211 @@
+"""
+Постоянное хранилище уведомлений об обнаружениях (SQLite в режиме WAL).
+
+Запись асинхронная: add()/mark_cleared()/dismiss() только ставят операцию в очередь,
+фоновый поток пишет накопленное одной транзакцией — пачками до batch_size или раз в
+flush_interval секунд. Id выдаются сразу при добавлении (продолжают максимальный id
+в базе), поэтому GUI может ссылаться на событие до того, как оно записано.
+
+Чтение (page(), response_times()) идет через отдельное соединение в потоке вызывающего;
+WAL позволяет читать параллельно с записью. Индексы по платформе, времени и статусу
+делают выборки истории и отчеты о времени уборки дешевыми запросами.
+"""
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    detected_at REAL NOT NULL,
+    time_str TEXT NOT NULL,
+    platform TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'new',
+    cleared_at REAL,
+    dismissed INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS events_platform_time ON events (platform, detected_at);
+CREATE INDEX IF NOT EXISTS events_time ON events (detected_at);
+CREATE INDEX IF NOT EXISTS events_status ON events (status, detected_at);
+"""
+
+COLUMNS = "id, detected_at, time_str, platform, status, cleared_at, count"
+
+
+class EventStore:
+    """
+    Журнал событий обнаружения с пакетной фоновой записью.
+    """
+
+    def __init__(self, path="events.db", batch_size=100, flush_interval=0.5):
+        """
+        :param path: Файл базы SQLite.
+        :param batch_size: Сколько операций записывать одной транзакцией.
+        :param flush_interval: Максимальная задержка записи, в секундах.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        self._id_lock = threading.Lock()
+
+        connection = self._connect()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        # Базы, созданные до появления столбца count (число объединенных обнаружений)
+        if "count" not in [row[1] for row in connection.execute("PRAGMA table_info(events)")]:
+            connection.execute("ALTER TABLE events ADD COLUMN count INTEGER NOT NULL DEFAULT 1")
+        self._next_id = connection.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM events").fetchone()[0]
+
+        self._writer = threading.Thread(target=self._write_loop, name="event-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        # Соединение SQLite нельзя делить между потоками — у каждого потока свое
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    # ---------- Запись ----------
+
+    def add(self, time_str, platform, detected_at=None, count=1):
+        """
+        Добавляет новое событие.
+
+        :param time_str: Время для отображения (HH:MM).
+        :param platform: Платформа.
+        :param detected_at: Время обнаружения (time.time()); по умолчанию — текущее.
+        :param count: Сколько обнаружений объединено в событие (event_bus.DetectionBus).
+        :return: Кортеж (id, detected_at).
+        """
+        detected_at = time.time() if detected_at is None else detected_at
+        with self._id_lock:
+            event_id = self._next_id
+            self._next_id += 1
+        self._queue.put(("INSERT INTO events (id, detected_at, time_str, platform, count) VALUES (?, ?, ?, ?, ?)",
+                         (event_id, detected_at, time_str, platform, count)))
+        return event_id, detected_at
+
+    def mark_cleared(self, event_id, cleared_at=None):
+        """
+        Отмечает уборку и сохраняет ее время.
+
+        :return: Время уборки (time.time()).
+        """
+        cleared_at = time.time() if cleared_at is None else cleared_at
+        self._queue.put(("UPDATE events SET status = 'cleared', cleared_at = ? WHERE id = ? AND status = 'new'",
+                         (cleared_at, event_id)))
+        return cleared_at
+
+    def dismiss(self, up_to_id=None):
+        """
+        Скрывает из списка уведомлений события с id <= up_to_id (по умолчанию — все
+        выданные). История и отчеты их по-прежнему видят.
+        """
+        if up_to_id is None:
+            with self._id_lock:
+                up_to_id = self._next_id - 1
+        self._queue.put(("UPDATE events SET dismissed = 1 WHERE id <= ? AND dismissed = 0", (up_to_id,)))
+
+    def _write_loop(self):
+        connection = self._connect()
+        while True:
+            operation = self._queue.get()
+            if operation is None:
+                self._queue.task_done()
+                break
+            batch = [operation]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            # Добираем очередь до batch_size или до истечения flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    operation = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if operation is None:
+                    stop = True
+                    break
+                batch.append(operation)
+            try:
+                with connection:
+                    for sql, params in batch:
+                        connection.execute(sql, params)
+            except sqlite3.Error as e:
+                print("Ошибка записи событий:", e)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                break
+        connection.close()
+
+    def flush(self):
+        """
+        Ждет, пока все поставленные операции будут записаны.
+        """
+        self._queue.join()
+
+    def close(self):
+        """
+        Дописывает очередь и останавливает фоновый поток.
+        """
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    # ---------- Чтение ----------
+
+    def page(self, before_id=None, limit=50, platform=None, since=None, include_dismissed=False):
+        """
+        Страница событий от новых к старым.
+
+        :param before_id: Вернуть события с id меньше этого (продолжение предыдущей страницы).
+        :param limit: Размер страницы.
+        :param platform: Только эта платформа.
+        :param since: Только события не раньше этого времени (time.time()).
+        :param include_dismissed: Включать события, скрытые кнопкой очистки.
+        :return: Список кортежей (id, detected_at, time_str, platform, status, cleared_at, count).
+        """
+        where, params = [], []
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(before_id)
+        if platform is not None:
+            where.append("platform = ?")
+            params.append(platform)
+        if since is not None:
+            where.append("detected_at >= ?")
+            params.append(since)
+        if not include_dismissed:
+            where.append("dismissed = 0")
+        sql = "SELECT %s FROM events" % COLUMNS
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY id DESC LIMIT ?"
+        return self._connect().execute(sql, params + [limit]).fetchall()
+
+    def response_times(self, since=None, until=None):
+        """
+        Время от обнаружения до уборки по платформам.
+
+        :param since: Начало периода (time.time()), по умолчанию — вся история.
+        :param until: Конец периода.
+        :return: Словарь platform -> {"detected", "cleared", "mean_s", "max_s"}.
+        """
+        params = [since if since is not None else float("-inf"), until if until is not None else float("inf")]
+        rows = self._connect().execute(
+            "SELECT platform, COUNT(*), COUNT(cleared_at), AVG(cleared_at - detected_at), "
+            "MAX(cleared_at - detected_at) FROM events WHERE detected_at >= ? AND detected_at <= ? "
+            "GROUP BY platform", params).fetchall()
+        return {platform: {"detected": detected, "cleared": cleared, "mean_s": mean_s, "max_s": max_s}
+                for platform, detected, cleared, mean_s, max_s in rows}
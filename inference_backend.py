@@ -0,0 +1,411 @@
+"""
+Бэкенды инференса YOLO для CPU: PyTorch (как раньше), ONNX Runtime и OpenVINO.
+
+Модель экспортируется один раз в ONNX (динамический размер пакета) и кладется в кэш
+exports/<имя>-<хэш весов>-<imgsz>/; при смене весов хэш меняется и экспорт повторяется.
+По желанию из ONNX делается INT8-версия (статическая квантизация ONNX Runtime в формате
+QDQ, калибровка на кадрах наших видео), которую читают оба рантайма. Для OpenVINO
+ONNX конвертируется в IR (.xml/.bin) там же.
+
+ExportedModel вызывается как объект YOLO (model(source, conf=..., imgsz=...)) и возвращает
+результаты с boxes.data, поэтому подставляется в EnsembleDetector и ML_TRASH_VIDEO_EGOR.py
+без изменений остального кода. compare_backends() сравнивает точность и задержку бэкендов
+с путем PyTorch на одних и тех же кадрах (backend_cli.py).
+"""
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.data.augment import LetterBox
+from ultralytics.utils import ops
+
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:  # ultralytics до 8.3.1xx
+    from ultralytics.utils.ops import non_max_suppression
+
+from platform_stream import enhance_contrast
+
+BACKENDS = ("torch", "onnxruntime", "openvino")
+DEFAULT_CACHE_DIR = "exports"
+
+
+def check_backend(backend, int8=False):
+    """
+    Проверяет, что установлены пакеты, нужные бэкенду: onnx для экспорта, рантайм
+    и onnxruntime для INT8-квантизации (ее используют оба рантайма).
+
+    :raise ValueError: Неизвестный бэкенд.
+    :raise ImportError: Не хватает пакетов; в сообщении — что установить.
+    """
+    if backend not in BACKENDS:
+        raise ValueError("Неизвестный бэкенд: %s (доступны: %s)" % (backend, ", ".join(BACKENDS)))
+    if backend == "torch":
+        return
+    required = ["onnx", backend] + (["onnxruntime"] if int8 else [])
+    missing = []
+    for package in dict.fromkeys(required):
+        try:
+            importlib.import_module(package)
+        except ImportError:
+            missing.append(package)
+    if missing:
+        raise ImportError("Для бэкенда %s%s нужны пакеты: %s (pip install %s)" % (
+            backend, " с INT8" if int8 else "", ", ".join(missing), " ".join(missing)))
+
+
+def weights_hash(path, length=16):
+    """
+    :return: Начало sha256 файла весов — ключ кэша экспортированных моделей.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:length]
+
+
+def letterbox_batch(frames, imgsz, auto=False):
+    """
+    Letterbox кадров BGR и перевод в массив NCHW float32 0..1 (RGB), как при инференсе YOLO.
+
+    :param auto: Дополнять только до кратного 32 (как predict YOLO), а не до квадрата imgsz;
+                 кадры должны быть одного размера.
+    """
+    letterbox = LetterBox(new_shape=(imgsz, imgsz), auto=auto, stride=32)
+    batch = np.stack([letterbox(image=frame)[..., ::-1].transpose(2, 0, 1) for frame in frames])
+    return np.ascontiguousarray(batch, dtype=np.float32) / 255.0
+
+
+def read_frames(sources, count, offset=0.0, enhance=True):
+    """
+    Равномерно выбирает count кадров из видео (поровну из каждого источника).
+
+    :param sources: Пути к видео.
+    :param count: Сколько кадров нужно всего.
+    :param offset: Сдвиг выборки в долях шага (0..1): разные offset дают непересекающиеся кадры.
+    :param enhance: Применять enhance_contrast, как PlatformStream перед инференсом.
+    :return: Список кадров BGR.
+    """
+    frames = []
+    per_source = max(1, -(-count // len(sources)))
+    for source in sources:
+        cap = cv2.VideoCapture(source)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, total // per_source)
+        for i in range(per_source):
+            position = int((i + offset) * step)
+            if total and position >= total:
+                break
+            cap.set(cv2.CAP_PROP_POS_FRAMES, position)
+            ok, frame = cap.read()
+            if not ok:
+                break
+            frames.append(enhance_contrast(frame) if enhance else frame)
+        cap.release()
+    if not frames:
+        raise ValueError("Не удалось прочитать кадры из %s" % ", ".join(map(str, sources)))
+    return frames[:count]
+
+
+def _atomic_move(src, dst):
+    tmp = dst + ".tmp"
+    shutil.move(src, tmp)
+    os.replace(tmp, dst)
+
+
+def _export_onnx(model_path, onnx_path, imgsz):
+    from ultralytics import YOLO
+
+    model = YOLO(model_path)
+    # Экспорт пишет файл рядом с весами — делаем его из копии во временной папке
+    with tempfile.TemporaryDirectory() as tmp:
+        weights = os.path.join(tmp, os.path.basename(model_path))
+        shutil.copy2(model_path, weights)
+        exported = YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=True, simplify=True, verbose=False)
+        _atomic_move(str(exported), onnx_path)
+    return {"names": {int(k): v for k, v in model.names.items()}, "task": model.task,
+            "stride": int(max(model.model.stride)) if hasattr(model.model, "stride") else 32}
+
+
+def _quantize_int8(onnx_path, int8_path, frames, imgsz):
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    import onnxruntime
+
+    input_name = onnxruntime.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self._frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self._frames, None)
+            return None if frame is None else {input_name: letterbox_batch([frame], imgsz)}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepared = os.path.join(tmp, "prepared.onnx")
+        # Символьный вывод форм не справляется с динамическим входом YOLO — хватает вывода форм ONNX
+        quant_pre_process(onnx_path, prepared, skip_symbolic_shape=True)
+        output = os.path.join(tmp, "int8.onnx")
+        # Квантуются только свертки и матричные умножения: декодирование рамок
+        # в голове детектора остается в float, иначе страдает точность координат
+        quantize_static(prepared, output, FrameReader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        op_types_to_quantize=["Conv", "MatMul"])
+        _atomic_move(output, int8_path)
+
+
+def export_model(model_path, backend="onnxruntime", imgsz=640, int8=False, calibration=None,
+                 cache_dir=DEFAULT_CACHE_DIR, calibration_frames=64):
+    """
+    Экспортирует модель для бэкенда, если ее еще нет в кэше.
+
+    :param model_path: Веса PyTorch (.pt).
+    :param backend: "onnxruntime" или "openvino".
+    :param imgsz: Размер входа.
+    :param int8: Нужна INT8-версия.
+    :param calibration: Видео для калибровки INT8 (нужны только при первом экспорте).
+    :param cache_dir: Папка кэша экспортированных моделей.
+    :param calibration_frames: Сколько кадров использовать для калибровки.
+    :return: Кортеж (путь к модели для рантайма, метаданные).
+    """
+    if backend not in BACKENDS[1:]:
+        raise ValueError("Неизвестный бэкенд экспорта: %s" % backend)
+    check_backend(backend, int8)
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    directory = os.path.join(cache_dir, "%s-%s-%d" % (stem, weights_hash(model_path), imgsz))
+    os.makedirs(directory, exist_ok=True)
+    meta_path = os.path.join(directory, "metadata.json")
+    onnx_path = os.path.join(directory, "model.onnx")
+
+    if not os.path.exists(onnx_path) or not os.path.exists(meta_path):
+        meta = _export_onnx(model_path, onnx_path, imgsz)
+        meta.update(source=os.path.abspath(model_path), imgsz=imgsz)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=1)
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["names"] = {int(k): v for k, v in meta["names"].items()}
+
+    source = onnx_path
+    if int8:
+        source = os.path.join(directory, "model-int8.onnx")
+        if not os.path.exists(source):
+            if not calibration:
+                raise ValueError("Для INT8-экспорта %s нужны видео для калибровки" % model_path)
+            _quantize_int8(onnx_path, source, read_frames(calibration, calibration_frames, offset=0.5), imgsz)
+            meta["calibration"] = [os.path.abspath(path) for path in calibration]
+            with open(meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=1)
+
+    if backend == "openvino":
+        xml_path = os.path.splitext(source)[0] + ".xml"
+        if not os.path.exists(xml_path):
+            import openvino as ov
+
+            with tempfile.TemporaryDirectory(dir=directory) as tmp:
+                tmp_xml = os.path.join(tmp, "model.xml")
+                # read_model, а не convert_model: после преобразований convert_model
+                # INT8-граф QDQ не компилируется плагином CPU
+                ov.save_model(ov.Core().read_model(source), tmp_xml, compress_to_fp16=False)
+                os.replace(os.path.join(tmp, "model.bin"), os.path.splitext(xml_path)[0] + ".bin")
+                os.replace(tmp_xml, xml_path)
+        source = xml_path
+    return source, meta
+
+
+class BackendBoxes:
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class BackendResult:
+    """
+    Результат ExportedModel с тем же доступом к рамкам, что у ultralytics Results: result.boxes.data.
+    """
+    __slots__ = ("boxes",)
+
+    def __init__(self, data):
+        self.boxes = BackendBoxes(data)
+
+
+class ExportedModel:
+    """
+    Экспортированная модель YOLO в ONNX Runtime или OpenVINO с интерфейсом вызова YOLO.
+
+    Принимает кадр BGR (или список кадров) — тогда рамки возвращаются в координатах кадра —
+    либо уже подготовленный тензор NCHW 0..1, как EnsembleDetector, — тогда в координатах тензора.
+    """
+
+    def __init__(self, model_path, backend="onnxruntime", imgsz=640, threads=None, int8=False, calibration=None,
+                 cache_dir=DEFAULT_CACHE_DIR, iou=0.7, max_det=300):
+        """
+        :param model_path: Веса PyTorch (.pt).
+        :param backend: "onnxruntime" или "openvino".
+        :param imgsz: Размер входа.
+        :param threads: Число intra-op потоков рантайма (по умолчанию — решает рантайм).
+        :param int8: Использовать INT8-версию.
+        :param calibration: Видео для калибровки INT8 при первом экспорте.
+        :param cache_dir: Папка кэша экспортированных моделей.
+        :param iou: Порог IoU для NMS (как у predict YOLO по умолчанию).
+        :param max_det: Максимум детекций на кадр.
+        """
+        path, meta = export_model(model_path, backend, imgsz, int8, calibration, cache_dir)
+        self.path = path
+        self.backend = backend
+        self.imgsz = imgsz
+        self.int8 = int8
+        self.names = meta["names"]
+        self.task = meta["task"]
+        self.iou = iou
+        self.max_det = max_det
+
+        if backend == "onnxruntime":
+            import onnxruntime
+
+            options = onnxruntime.SessionOptions()
+            options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if threads:
+                options.intra_op_num_threads = threads
+            session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+            input_name = session.get_inputs()[0].name
+            self._run = lambda batch: session.run(None, {input_name: batch})
+        else:
+            import openvino as ov
+
+            config = {"PERFORMANCE_HINT": "LATENCY"}
+            if threads:
+                config["INFERENCE_NUM_THREADS"] = threads
+            compiled = ov.Core().compile_model(path, "CPU", config)
+            request = compiled.create_infer_request()
+            outputs = compiled.outputs
+            self._run = lambda batch: [request.infer({0: batch})[output] for output in outputs]
+
+    def __call__(self, source, conf=0.25, imgsz=None, **kwargs):
+        """
+        :param source: Кадр BGR, список кадров или тензор (N, 3, imgsz, imgsz).
+        :param conf: Порог уверенности.
+        :param imgsz: Игнорируется: используется размер, заданный при экспорте.
+        :return: Список BackendResult, по одному на кадр.
+        """
+        if isinstance(source, torch.Tensor):
+            batch, shapes = source.cpu().numpy().astype(np.float32, copy=False), None
+        else:
+            frames = [source] if isinstance(source, np.ndarray) else list(source)
+            shapes = [frame.shape for frame in frames]
+            # Вход экспортирован с динамическими размерами — как predict YOLO, не дополняем до квадрата
+            batch = letterbox_batch(frames, self.imgsz, auto=len(set(shapes)) == 1)
+
+        outputs = [torch.from_numpy(np.asarray(output)) for output in self._run(batch)]
+        # nc нужен для сегментационных моделей: после классов идут коэффициенты масок
+        output = non_max_suppression(outputs[0], conf, self.iou, max_det=self.max_det, nc=len(self.names))
+        results = []
+        for i, detections in enumerate(output):
+            if self.task == "segment" and len(detections):
+                # Как SegmentationPredictor: рамки с пустой маской отбрасываются
+                masks = ops.process_mask(outputs[1][i], detections[:, 6:], detections[:, :4], batch.shape[2:],
+                                         upsample=True)
+                detections = detections[masks.amax((-2, -1)) > 0]
+            boxes = detections[:, :6].clone()
+            if shapes is not None:
+                boxes[:, :4] = ops.scale_boxes(batch.shape[2:], boxes[:, :4], shapes[i][:2])
+            results.append(BackendResult(boxes))
+        return results
+
+
+def load_backend_model(model_path, backend="torch", imgsz=640, threads=None, int8=False, calibration=None,
+                       cache_dir=DEFAULT_CACHE_DIR):
+    """
+    :return: YOLO для backend="torch", иначе ExportedModel.
+    :raise ImportError: Не установлены пакеты выбранного бэкенда.
+    """
+    check_backend(backend, int8 and backend != "torch")
+    if backend == "torch":
+        if int8:
+            raise ValueError("INT8 поддерживается только для onnxruntime и openvino")
+        from ultralytics import YOLO
+
+        return YOLO(model_path)
+    return ExportedModel(model_path, backend, imgsz, threads, int8, calibration, cache_dir)
+
+
+def _match(reference, candidate, iou_threshold=0.5):
+    """
+    Жадное сопоставление рамок одного класса по IoU.
+
+    :return: Кортеж (число совпадений, суммарная разница уверенности).
+    """
+    if not len(reference) or not len(candidate):
+        return 0, 0.0
+    from sort import iou_batch
+
+    iou = iou_batch(reference[:, :4], candidate[:, :4])
+    iou[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0.0
+    matched, conf_diff = 0, 0.0
+    used = np.zeros(len(candidate), dtype=bool)
+    for i in np.argsort(-reference[:, 4]):
+        row = np.where(used, 0.0, iou[i])
+        j = int(np.argmax(row))
+        if row[j] >= iou_threshold:
+            used[j] = True
+            matched += 1
+            conf_diff += abs(float(reference[i, 4]) - float(candidate[j, 4]))
+    return matched, conf_diff
+
+
+def compare_backends(model_path, frames, variants, imgsz=640, conf=0.25, threads=None, cache_dir=DEFAULT_CACHE_DIR,
+                     calibration=None, repeat=1):
+    """
+    Запускает модель во всех вариантах на одних и тех же кадрах и сравнивает с PyTorch.
+
+    :param model_path: Веса PyTorch (.pt).
+    :param frames: Кадры BGR для оценки.
+    :param variants: Список пар (backend, int8).
+    :param calibration: Видео для калибровки INT8.
+    :param repeat: Сколько раз прогонять кадры для замера задержки.
+    :return: Список словарей: вариант, задержка p50/p90/среднее (мс на кадр), число детекций,
+             precision/recall относительно PyTorch (IoU >= 0.5, тот же класс) и средняя
+             разница уверенности совпавших рамок.
+    """
+    outputs = {}
+    report = []
+    for backend, int8 in [("torch", False)] + [v for v in variants if v != ("torch", False)]:
+        model = load_backend_model(model_path, backend, imgsz, threads, int8, calibration, cache_dir)
+        model(frames[0], conf=conf, imgsz=imgsz, verbose=False)  # прогрев
+        times, boxes = [], []
+        for _ in range(repeat):
+            boxes = []
+            for frame in frames:
+                started = time.perf_counter()
+                result = model(frame, conf=conf, imgsz=imgsz, save=False, verbose=False)[0]
+                times.append(time.perf_counter() - started)
+                boxes.append(result.boxes.data.cpu().numpy()[:, :6])
+        outputs[(backend, int8)] = boxes
+        ms = np.array(times) * 1000.0
+        row = {"model": os.path.basename(model_path), "backend": backend, "int8": int8,
+               "p50_ms": float(np.percentile(ms, 50)), "p90_ms": float(np.percentile(ms, 90)),
+               "mean_ms": float(ms.mean()), "detections": int(sum(len(b) for b in boxes))}
+
+        reference = outputs[("torch", False)]
+        matched = conf_diff = 0
+        for ref, cand in zip(reference, boxes):
+            m, d = _match(ref, cand)
+            matched += m
+            conf_diff += d
+        total_ref = sum(len(b) for b in reference)
+        row.update(precision=matched / row["detections"] if row["detections"] else 1.0,
+                   recall=matched / total_ref if total_ref else 1.0,
+                   conf_diff=conf_diff / matched if matched else 0.0)
+        report.append(row)
+    return report
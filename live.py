@@ -0,0 +1,116 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class LatestFrameReader:
+    """
+    Поток захвата для живого источника: непрерывно читает кадры и хранит только последний.
+
+    Если инференс медленнее камеры, промежуточные кадры отбрасываются, а не копятся
+    в буфере захвата, поэтому обработка всегда берет самый свежий кадр.
+    """
+
+    def __init__(self, cap, pace_fps=None):
+        """
+        :param cap: Открытый cv2.VideoCapture.
+        :param pace_fps: Для видеофайлов — читать не быстрее этой частоты, имитируя камеру.
+        """
+        self.cap = cap
+        self.pace_fps = pace_fps
+        self.frames_read = 0
+        self._frame = None
+        self._captured_at = None
+        self._index = -1
+        self._ended = False
+        self._running = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        period = 1.0 / self.pace_fps if self.pace_fps else 0.0
+        next_time = time.perf_counter()
+        while self._running:
+            if period:
+                delay = next_time - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_time += period
+            success, frame = self.cap.read()
+            captured_at = time.time()
+            with self._cond:
+                if not success:
+                    self._ended = True
+                    self._cond.notify_all()
+                    break
+                self._frame, self._captured_at = frame, captured_at
+                self._index += 1
+                self.frames_read += 1
+                self._cond.notify_all()
+
+    def read_latest(self, min_index=0, timeout=None):
+        """
+        Ждет кадр с номером не меньше min_index и возвращает самый свежий.
+
+        :param min_index: Минимальный номер кадра (с начала захвата).
+        :param timeout: Максимальное время ожидания в секундах.
+        :return: Кортеж (index, frame, captured_at) или None, если поток закончился
+                 (или истек timeout). captured_at — time.time() в момент захвата.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._index >= min_index or self._ended, timeout):
+                return None
+            if self._index < min_index:
+                return None
+            return self._index, self._frame, self._captured_at
+
+    def stop(self):
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+
+class LatencyStats:
+    """
+    Скользящая выборка задержек (в секундах) для расчета перцентилей.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._values = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, seconds):
+        with self._lock:
+            self._values.append(seconds)
+            self.count += 1
+
+    def percentiles(self, q=(50, 90, 99)):
+        """
+        :return: Словарь {"p50": мс, ...} по последним значениям или пустой словарь.
+        """
+        with self._lock:
+            if not self._values:
+                return {}
+            values = np.percentile(np.fromiter(self._values, dtype=float), q)
+        return {"p%g" % p: round(v * 1000.0, 1) for p, v in zip(q, values)}
+
+    def summary(self, name):
+        """
+        :return: Строка вида "name: p50=12.0 ms, p90=... (N samples)".
+        """
+        stats = self.percentiles()
+        if not stats:
+            return "%s: no samples" % name
+        return "%s: %s (%d samples)" % (
+            name, ", ".join("%s=%.1f ms" % item for item in stats.items()), self.count)
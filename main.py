@@ -1,12 +1,18 @@
 import sys
 import time
 import threading
+
+# Момент запуска приложения — от него считается время до первого обработанного кадра
+APP_START = time.perf_counter()
+
 from datetime import datetime, timedelta
-from ML_TRASH_VIDEO import VideoProcessor # ---------------------------------------------------------------
 from huggingface_hub import hf_hub_download
 
-from PySide6.QtCore import Qt, QPropertyAnimation, QEasingCurve, QTimer, Signal, QObject
-from PySide6.QtGui import QPixmap, QFont
+from event_bus import DetectionBus
+from event_store import EventStore
+
+from PySide6.QtCore import Qt, QTimer, Signal, QObject, QThread, QAbstractListModel, QModelIndex, QRect, QSize, QEvent
+from PySide6.QtGui import QPixmap, QFont, QColor, QPainter
 from PySide6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -15,20 +21,34 @@ from PySide6.QtWidgets import (
     QPushButton,
     QVBoxLayout,
     QHBoxLayout,
-    QScrollArea,
-    QSizePolicy
+    QSizePolicy,
+    QListView,
+    QAbstractItemView,
+    QStyledItemDelegate,
+    QStyle,
+    QFrame,
+    QStackedWidget
 )
 
 # -------------------------------
 # Данные уведомления
 # -------------------------------
 class NotificationData:
-    def __init__(self, nid, time_str, platform, status):
-        self.nid = nid
+    def __init__(self, nid, time_str, platform, status, detected_at=None, cleared_at=None, count=1):
+        self.nid = nid  # id события в EventStore
+        self.count = count  # сколько обнаружений объединено в уведомление
         self.time_str = time_str
         self.platform = platform
         self.status = status  # "new" или "cleared"
-        self.cleared_time = None  # время, когда мусор убран (HH:MM)
+        self.detected_at = detected_at
+        self.cleared_at = cleared_at
+        # время, когда мусор убран (HH:MM)
+        self.cleared_time = time.strftime("%H:%M", time.localtime(cleared_at)) if cleared_at else None
+
+    @classmethod
+    def from_row(cls, row):
+        nid, detected_at, time_str, platform, status, cleared_at, count = row
+        return cls(nid, time_str, platform, status, detected_at, cleared_at, count)
 
 # -------------------------------
 # Сигналы для обнаружения мусора
@@ -53,114 +73,231 @@ class DetectorSignals(QObject):
 #         signals.garbageDetected.emit(current_time, platform_str)
 
 # -------------------------------
-# Виджет карточки уведомления
+# Модель списка уведомлений
 # -------------------------------
-class NotificationCard(QWidget):
-    def __init__(self, data: NotificationData, parent=None):
-        super().__init__(parent)
-        self.data = data
-        self.initUI()
-        self.fadeIn()
-
-    def initUI(self):
-        self.setAttribute(Qt.WidgetAttribute.WA_StyledBackground, True)
-        self.setMinimumHeight(120)
+class NotificationModel(QAbstractListModel):
+    """
+    Список уведомлений для QListView: новые добавляются в начало по одному,
+    без пересоздания остальных строк.
 
-        # Цвета
-        self.rzdRed = "#EE3523"   # Фирменный красный
-        self.grayColor = "#9E9E9E"
+    История хранится в EventStore и подгружается страницами (canFetchMore/fetchMore)
+    по мере прокрутки вниз, поэтому в памяти только просмотренная часть списка.
+    """
+    DataRole = Qt.ItemDataRole.UserRole + 1
 
-        # Определяем фон карточки
-        bg_color = self.rzdRed if self.data.status == "new" else self.grayColor
-        self.setStyleSheet(f"""
-            QWidget {{
-                background-color: {bg_color};
-                border-radius: 10px;
-            }}
-        """)
+    def __init__(self, store=None, page_size=50, parent=None):
+        super().__init__(parent)
+        self._items = []
+        self.store = store
+        self.page_size = page_size
+        self._exhausted = store is None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._items)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        notif = self._items[index.row()]
+        if role == self.DataRole:
+            return notif
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"{notif.time_str} {notif.platform}"
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if not self.canFetchMore(parent):
+            return
+        # Новые события добавляются сверху, поэтому следующая страница — старше последней строки
+        before_id = self._items[-1].nid if self._items else None
+        rows = self.store.page(before_id=before_id, limit=self.page_size)
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        if not rows:
+            return
+        first = len(self._items)
+        self.beginInsertRows(QModelIndex(), first, first + len(rows) - 1)
+        self._items.extend(NotificationData.from_row(row) for row in rows)
+        self.endInsertRows()
+
+    def addEvent(self, time_str, platform, detected_at=None):
+        """
+        Записывает новое событие в хранилище и показывает его первым в списке.
+        """
+        self.addEvents([(time_str, platform, detected_at, 1)])
+
+    def addEvents(self, events):
+        """
+        Добавляет пачку событий (time_str, platform, detected_at, count) от старых к новым одной вставкой строк.
+        detected_at — время захвата кадра (time.time()); None — время добавления.
+        count — сколько обнаружений объединено в событие.
+        """
+        notifs = []
+        for time_str, platform, detected_at, count in events:
+            if self.store is not None:
+                nid, detected_at = self.store.add(time_str, platform, detected_at, count)
+            else:
+                last = notifs[-1] if notifs else (self._items[0] if self._items else None)
+                nid = last.nid + 1 if last else 1
+                detected_at = time.time() if detected_at is None else detected_at
+            notifs.append(NotificationData(nid, time_str, platform, "new", detected_at, count=count))
+        if notifs:
+            self.prependMany(notifs[::-1])
+
+    def prepend(self, notif):
+        self.prependMany([notif])
+
+    def prependMany(self, notifs):
+        self.beginInsertRows(QModelIndex(), 0, len(notifs) - 1)
+        self._items[:0] = notifs
+        self.endInsertRows()
+
+    def clear(self):
+        # События скрываются из списка, но остаются в истории для отчетов
+        if self.store is not None:
+            self.store.dismiss()
+        self.beginResetModel()
+        self._items.clear()
+        self._exhausted = True
+        self.endResetModel()
+
+    def confirmCleanup(self, row):
+        notif = self._items[row]
+        if notif.status != "new":
+            return
+        # Меняем статус и сохраняем время уборки (HH:MM)
+        notif.status = "cleared"
+        notif.cleared_at = self.store.mark_cleared(notif.nid) if self.store is not None else time.time()
+        notif.cleared_time = time.strftime("%H:%M", time.localtime(notif.cleared_at))
+        index = self.index(row)
+        self.dataChanged.emit(index, index)
 
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(10, 10, 10, 10)
-        layout.setSpacing(6)
+# -------------------------------
+# Отрисовка карточки уведомления
+# -------------------------------
+class NotificationDelegate(QStyledItemDelegate):
+    """
+    Рисует карточку уведомления прямо в QListView: виджеты на строку не создаются,
+    отрисовываются только видимые строки.
+    """
+    rzdRed = QColor("#EE3523")   # Фирменный красный
+    grayColor = QColor("#9E9E9E")
+
+    cardHeight = 150
+    clearedCardHeight = 110
+    padding = 10
+    buttonHeight = 35
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.timeFont = QFont()
+        self.timeFont.setPixelSize(18)
+        self.timeFont.setBold(True)
+        self.titleFont = QFont()
+        self.titleFont.setPixelSize(16)
+        self.titleFont.setBold(True)
+        self.platformFont = QFont()
+        self.platformFont.setPixelSize(14)
+        self.buttonFont = QFont()
+        self.buttonFont.setPixelSize(14)
+        self.buttonFont.setBold(True)
+
+    def sizeHint(self, option, index):
+        notif = index.data(NotificationModel.DataRole)
+        height = self.cardHeight if notif.status == "new" else self.clearedCardHeight
+        return QSize(option.rect.width(), height)
+
+    def buttonRect(self, rect):
+        return QRect(rect.left() + self.padding, rect.bottom() - self.padding - self.buttonHeight,
+                     rect.width() - 2 * self.padding, self.buttonHeight)
+
+    def paint(self, painter, option, index):
+        notif = index.data(NotificationModel.DataRole)
+        rect = option.rect
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
 
-        # Метка времени (изначальное время обнаружения)
-        self.timeLabel = QLabel(self.data.time_str)
-        self.timeLabel.setAlignment(Qt.AlignCenter)
-        self.timeLabel.setStyleSheet("color: white; font-size: 18px; font-weight: bold;")
-        layout.addWidget(self.timeLabel)
+        # Определяем фон карточки
+        bg_color = self.rzdRed if notif.status == "new" else self.grayColor
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(bg_color)
+        painter.drawRoundedRect(rect, 10, 10)
 
         # Заголовок уведомления
-        # Если статус уже "cleared", проверяем cleared_time
-        if self.data.status == "cleared" and self.data.cleared_time:
-            title_text = f"МУСОР УСПЕШНО УБРАН в {self.data.cleared_time}"
-        elif self.data.status == "cleared":
+        if notif.status == "cleared" and notif.cleared_time:
+            title_text = f"МУСОР УСПЕШНО УБРАН в {notif.cleared_time}"
+        elif notif.status == "cleared":
             # Если почему-то cleared_time не установлено
             title_text = "МУСОР УСПЕШНО УБРАН"
         else:
             title_text = "ОБНАРУЖЕН НОВЫЙ МУСОР!"
 
-        self.titleLabel = QLabel(title_text)
-        self.titleLabel.setAlignment(Qt.AlignCenter)
-        self.titleLabel.setWordWrap(True)
-        self.titleLabel.setStyleSheet("color: white; font-size: 16px; font-weight: bold;")
-        layout.addWidget(self.titleLabel)
-
-        # Платформа
-        self.platformLabel = QLabel(self.data.platform)
-        self.platformLabel.setAlignment(Qt.AlignCenter)
-        self.platformLabel.setWordWrap(True)
-        self.platformLabel.setStyleSheet("color: white; font-size: 14px;")
-        layout.addWidget(self.platformLabel)
-
-        # Если статус "new" — показываем кнопку подтверждения
-        if self.data.status == "new":
-            self.confirmButton = QPushButton("Подтвердить уборку")
-            self.confirmButton.setStyleSheet("""
-                QPushButton {
-                    background-color: rgba(255, 255, 255, 0.9);
-                    color: #000000;
-                    border: none;
-                    border-radius: 5px;
-                    padding: 8px 15px;
-                    font-weight: bold;
-                    font-size: 14px;
-                    min-height: 35px;
-                }
-                QPushButton:hover {
-                    background-color: rgba(255, 255, 255, 1.0);
-                }
-            """)
-            self.confirmButton.clicked.connect(self.confirmCleanup)
-            layout.addWidget(self.confirmButton)
-
-    def fadeIn(self):
-        from PySide6.QtCore import QPropertyAnimation
-        self.setWindowOpacity(0)
-        self.anim = QPropertyAnimation(self, b"windowOpacity")
-        self.anim.setDuration(400)
-        self.anim.setStartValue(0)
-        self.anim.setEndValue(1)
-        self.anim.setEasingCurve(QEasingCurve.InOutQuad)
-        self.anim.start()
-
-    def confirmCleanup(self):
-        # Меняем статус, цвет карточки, скрываем кнопку
-        self.data.status = "cleared"
-        # Сохраняем время уборки (HH:MM)
-        self.data.cleared_time = time.strftime("%H:%M")
-
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #9E9E9E;
-                border-radius: 10px;
-            }
-        """)
-        if hasattr(self, "confirmButton"):
-            self.confirmButton.hide()
+        platform_text = notif.platform
+        if notif.count > 1:
+            platform_text += f" · обнаружений: {notif.count}"
+
+        painter.setPen(QColor("white"))
+        text_rect = rect.adjusted(self.padding, self.padding, -self.padding, -self.padding)
+        y = text_rect.top()
+        for font, text, height in ((self.timeFont, notif.time_str, 24),
+                                   (self.titleFont, title_text, 22),
+                                   (self.platformFont, platform_text, 20)):
+            painter.setFont(font)
+            painter.drawText(QRect(text_rect.left(), y, text_rect.width(), height),
+                             Qt.AlignmentFlag.AlignCenter | Qt.TextFlag.TextWordWrap, text)
+            y += height + 6
+
+        # Если статус "new" — рисуем кнопку подтверждения
+        if notif.status == "new":
+            button_rect = self.buttonRect(rect)
+            hovered = bool(option.state & QStyle.StateFlag.State_MouseOver)
+            painter.setBrush(QColor(255, 255, 255, 255 if hovered else 230))
+            painter.setPen(Qt.PenStyle.NoPen)
+            painter.drawRoundedRect(button_rect, 5, 5)
+            painter.setPen(QColor("#000000"))
+            painter.setFont(self.buttonFont)
+            painter.drawText(button_rect, Qt.AlignmentFlag.AlignCenter, "Подтвердить уборку")
+
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        # Нажатие на нарисованную кнопку подтверждает уборку
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            notif = index.data(NotificationModel.DataRole)
+            if notif.status == "new" and self.buttonRect(option.rect).contains(event.position().toPoint()):
+                model.confirmCleanup(index.row())
+                return True
+        return super().editorEvent(event, model, option, index)
+
+# -------------------------------
+# Фоновая загрузка моделей
+# -------------------------------
+class ModelLoader(QThread):
+    """
+    Загружает обе модели и прогревает их на пустом кадре в фоне, чтобы главное окно
+    появлялось сразу. torch и ultralytics тоже импортируются в этом потоке.
+    """
+    modelsReady = Signal(object, float)  # EnsembleDetector, время загрузки и прогрева в секундах
+    loadFailed = Signal(str)
+
+    def __init__(self, model_path1, model_path2, parent=None):
+        super().__init__(parent)
+        self.model_path1 = model_path1
+        self.model_path2 = model_path2
 
-        # Обновляем заголовок с учётом времени
-        self.titleLabel.setText(f"МУСОР УСПЕШНО УБРАН в {self.data.cleared_time}")
-        self.repaint()
+    def run(self):
+        start = time.perf_counter()
+        try:
+            from ensemble import EnsembleDetector
+            detector = EnsembleDetector(self.model_path1, self.model_path2, imgsz=640, conf=(0.25, 0.25))
+            detector.warmup()
+        except Exception as e:
+            self.loadFailed.emit(str(e))
+            return
+        self.modelsReady.emit(detector, time.perf_counter() - start)
 
 # -------------------------------
 # Главное окно
@@ -171,23 +308,40 @@ class MainWindow(QMainWindow):
         super().__init__()
         self.setWindowTitle("Система обнаружения мусора")
         self.setMinimumSize(450, 650)
+        # История уведомлений переживает перезапуск; в список подгружаются только видимые страницы
+        self.event_store = EventStore("events.db")
+        # Обнаружения копятся в шине и забираются одной пачкой раз в такт таймера
+        self.event_bus = DetectionBus()
         self.initUI()
 
-        # Изначально уведомлений нет
-        self.notifications = []
-
         # Инициализация модели и обработчика видео
         model_path1 = "norm.pt"
         model_path2 = "yolov8m-seg.pt"
-        video_path = "snowplatform.mkv"  # Путь к видео ГОЙДАААААААААААААААААААААААААААААААААААААААААААААА
-        self.video_processor = VideoProcessor(video_path, model_path1, model_path2)  # Ваш класс VideoProcessor
-        self.video_processor.garbageDetected.connect(self.handleNewGarbage)
+        # Пары (источник видео, название платформы) — все камеры обрабатываются одним пулом
+        self.sources = [
+            ("snowplatform.mkv", "Платформа №1"),  # Путь к видео ГОЙДАААААААААААААААААААААААААААААААААААААААААААААА
+        ]
+        # Этап анализа сцены: "diff" — разница кадров, "mog2"/"average" — модель фона
+        self.scene = "mog2"
+        self.video_processor = None
+
+        # Модели загружаются и прогреваются в фоне; кнопка поиска включится, когда они будут готовы
+        self.start_button.setEnabled(False)
+        self.start_button.setText("Загрузка моделей...")
+        self.model_loader = ModelLoader(model_path1, model_path2, self)
+        self.model_loader.modelsReady.connect(self.onModelsReady)
+        self.model_loader.loadFailed.connect(self.onModelsFailed)
+        self.model_loader.start()
 
         # Запуск обновления времени в заголовке каждую секунду
         self.updateTimeTimer = QTimer(self)
         self.updateTimeTimer.timeout.connect(self.updateTime)
         self.updateTimeTimer.start(1000)
 
+        self.detectionTimer = QTimer(self)
+        self.detectionTimer.timeout.connect(self.flushDetections)
+        self.detectionTimer.start(250)
+
     def initUI(self):
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -232,10 +386,22 @@ class MainWindow(QMainWindow):
         main_layout.addWidget(header_widget)
 
         # ---------- Прокручиваемая область уведомлений ----------
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setStyleSheet("""
-            background-color: #FFFFFF;
+        # Виртуализированный список: отрисовываются только видимые карточки
+        self.notification_model = NotificationModel(self.event_store, parent=self)
+        self.notification_view = QListView()
+        self.notification_view.setModel(self.notification_model)
+        self.notification_view.setItemDelegate(NotificationDelegate(self.notification_view))
+        self.notification_view.setUniformItemSizes(False)
+        self.notification_view.setSpacing(7)
+        self.notification_view.setMouseTracking(True)
+        self.notification_view.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.notification_view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.notification_view.setFrameShape(QFrame.Shape.NoFrame)
+        self.notification_view.setStyleSheet("""
+            QListView {
+                background-color: #FFFFFF;
+                padding: 8px;
+            }
             QScrollBar:vertical {
                 width: 0px;
                 background: transparent;
@@ -261,13 +427,25 @@ class MainWindow(QMainWindow):
                 background: transparent;
             }
         """)
-        self.scroll_content = QWidget()
-        self.scroll_layout = QVBoxLayout(self.scroll_content)
-        self.scroll_layout.setContentsMargins(15, 15, 15, 15)
-        self.scroll_layout.setSpacing(15)
-        self.scroll_content.setLayout(self.scroll_layout)
-        self.scroll_area.setWidget(self.scroll_content)
-        main_layout.addWidget(self.scroll_area, 1)
+
+        self.empty_label = QLabel(
+            "На платформах чисто!\nВ данный момент мусор не обнаружен\n\n"
+            "Вы можете отслеживать ситуацию в реальном времени\n"
+            "и получать уведомления, когда мусор будет найден"
+        )
+        self.empty_label.setStyleSheet("font-size: 16px; color: #000; background-color: #FFFFFF;")
+        self.empty_label.setAlignment(Qt.AlignCenter)
+
+        # Пока уведомлений нет, вместо списка показываем заглушку
+        self.notification_stack = QStackedWidget()
+        self.notification_stack.addWidget(self.empty_label)
+        self.notification_stack.addWidget(self.notification_view)
+        main_layout.addWidget(self.notification_stack, 1)
+
+        self.notification_model.rowsInserted.connect(self.updateEmptyState)
+        self.notification_model.modelReset.connect(self.updateEmptyState)
+        # Первая страница истории: пока список скрыт заглушкой, сам он ее не запросит
+        self.notification_model.fetchMore()
 
         # ---------- Нижняя панель (только одна кнопка) ----------
         bottom_widget = QWidget()
@@ -304,52 +482,44 @@ class MainWindow(QMainWindow):
                 padding: 10px;
             }
             QPushButton:hover { background-color: #45a049; }
+            QPushButton:disabled { background-color: #9E9E9E; }
         """)
         self.start_button.clicked.connect(self.start_video_processing)
         bottom_layout.addWidget(self.start_button)
 
         main_layout.addWidget(bottom_widget)
 
+    def onModelsReady(self, detector, load_seconds):
+        from ML_TRASH_VIDEO import VideoProcessorPool  # torch уже импортирован загрузчиком
+
+        print(f"Модели загружены и прогреты за {load_seconds:.2f} с")
+        # Пул получает уже загруженные модели; повторный запуск их не перезагружает
+        self.video_processor = VideoProcessorPool(self.sources, decode_skip=True, detector=detector, scene=self.scene,
+                                                  bus=self.event_bus)
+        self.video_processor.firstFrameProcessed.connect(self.onFirstFrame, Qt.ConnectionType.SingleShotConnection)
+        self.start_button.setText("Начать поиск")
+        self.start_button.setEnabled(True)
+
+    def onModelsFailed(self, error):
+        print("Ошибка загрузки моделей:", error)
+        self.start_button.setText("Модели не загружены")
+
+    def onFirstFrame(self, timestamp):
+        print(f"От запуска до первого обработанного кадра: {timestamp - APP_START:.2f} с")
+
     def start_video_processing(self):
         # Запускаем обработку видео в отдельном потоке
-        self.video_processor.start()
+        if self.video_processor is not None and not self.video_processor.isRunning():
+            self.video_processor.start()
 
     def updateTime(self):
         # Обновление метки времени (HH:MM, без секунд)
         current_time = time.strftime("%H:%M")
         self.timeLabel.setText(current_time)
 
-    def populateNotifications(self):
-        # Удаляем все виджеты из scroll_layout
-        for i in reversed(range(self.scroll_layout.count())):
-            widget = self.scroll_layout.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-
-        if not self.notifications:
-            empty_label = QLabel(
-                "На платформах чисто!\nВ данный момент мусор не обнаружен\n\n"
-                "Вы можете отслеживать ситуацию в реальном времени\n"
-                "и получать уведомления, когда мусор будет найден"
-            )
-            empty_label.setStyleSheet("font-size: 16px; color: #000;")
-            empty_label.setAlignment(Qt.AlignCenter)
-            empty_label.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-            self.scroll_layout.addWidget(empty_label)
-        else:
-            for i, notif in enumerate(self.notifications):
-                card = NotificationCard(notif)
-                # Эффект "отъезжания" для старых уведомлений
-                if i > 0:
-                    opacity = max(0.5, 1.0 - i * 0.1)
-                    card.setWindowOpacity(opacity)
-                    base_height = 120
-                    new_height = max(60, base_height - i * 10)
-                    card.setMinimumHeight(new_height)
-                self.scroll_layout.addWidget(card)
-
-        self.scroll_layout.addStretch()
-        self.scroll_area.verticalScrollBar().setValue(0)
+    def updateEmptyState(self):
+        has_items = self.notification_model.rowCount() > 0
+        self.notification_stack.setCurrentWidget(self.notification_view if has_items else self.empty_label)
 
     def clearNotifications(self):
         # Отключаем сигнал, чтобы новые уведомления не добавлялись
@@ -357,14 +527,31 @@ class MainWindow(QMainWindow):
             self.signals.garbageDetected.disconnect(self.handleNewGarbage)
         except Exception as e:
             print("Ошибка отключения сигнала:", e)
-        self.notifications.clear()
-        self.populateNotifications()
+        self.notification_model.clear()
 
     def handleNewGarbage(self, time_str, platform_str):
-        new_id = str(len(self.notifications) + 1)
-        new_notif = NotificationData(new_id, time_str, platform_str, "new")
-        self.notifications.insert(0, new_notif)
-        self.populateNotifications()
+        self.notification_model.addEvent(time_str, platform_str)
+        # Новое уведомление появляется сверху — возвращаемся к началу списка
+        self.notification_view.scrollToTop()
+
+    def flushDetections(self):
+        # Одно обновление списка за такт, сколько бы обнаружений ни пришло
+        events = self.event_bus.drain()
+        if not events:
+            return
+        # Время уборки считается от захвата кадра, а не от такта GUI
+        moments = [datetime.fromisoformat(event["time"]) for event in events]
+        self.notification_model.addEvents(
+            [(moment.strftime("%H:%M"), event["platform"], moment.timestamp(), event["count"])
+             for moment, event in zip(moments, events)])
+        self.notification_view.scrollToTop()
+
+    def closeEvent(self, event):
+        # Дописываем очередь событий на диск перед выходом
+        self.flushDetections()
+        print(self.event_bus.stats())
+        self.event_store.close()
+        super().closeEvent(event)
 
 def main():
     app = QApplication(sys.argv)
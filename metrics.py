@@ -0,0 +1,279 @@
+"""
+Метрики конвейера обнаружения: гистограммы времени по этапам, счетчики кадров,
+детекций и треков. Отдаются в текстовом формате Prometheus через локальный
+HTTP-эндпоинт (/metrics) и, по желанию, периодической строкой в лог.
+
+Замер этапа — два вызова perf_counter и bisect по границам корзин под блокировкой,
+поэтому инструментирование можно не отключать в работе.
+"""
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин гистограмм, в секундах
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Счетчики кадров PlatformStream, которые экспортируются как saygex_frames_total{kind=...}
+FRAME_COUNTERS = (("read", "frames_total"), ("decoded", "frames_decoded"), ("inferred", "frames_inferred"),
+                  ("gated", "frames_gated"), ("stale", "frames_stale"))
+
+
+class Histogram:
+    """
+    Накопительная гистограмма длительностей с фиксированными корзинами.
+    """
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class NullMetrics:
+    """
+    Метрики по умолчанию: ничего не записывают.
+    """
+
+    @contextmanager
+    def time(self, stage):
+        yield
+
+    def observe(self, stage, seconds):
+        pass
+
+    def count(self, name, platform, value=1):
+        pass
+
+    def tick(self):
+        pass
+
+    def register_stream(self, stream):
+        pass
+
+    def register_latency(self, name, stats):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+class Metrics(NullMetrics):
+    """
+    Реестр метрик конвейера.
+
+    Этапы (decode, enhance_contrast, scene, model1, model2, remove_duplicates, filter,
+    tracker, draw, imshow, ...) пишутся в гистограммы через time()/observe().
+    Счетчики кадров и число живых треков читаются из зарегистрированных потоков
+    в момент запроса, поэтому на каждом кадре не стоят ничего.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._streams = []
+        self._latencies = {}
+        self.ticks = 0
+
+    def register_stream(self, stream):
+        with self._lock:
+            if stream not in self._streams:
+                self._streams.append(stream)
+
+    def register_latency(self, name, stats):
+        """
+        :param name: Имя задержки (метка kind).
+        :param stats: live.LatencyStats.
+        """
+        self._latencies[name] = stats
+
+    @contextmanager
+    def time(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name, platform, value=1):
+        with self._lock:
+            key = (name, platform)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def tick(self):
+        with self._lock:
+            self.ticks += 1
+
+    def snapshot(self):
+        """
+        :return: Словарь stage -> (count, sum) для расчета средних за интервал.
+        """
+        with self._lock:
+            return {stage: (h.count, h.sum) for stage, h in self._stages.items()}
+
+    def render(self):
+        """
+        :return: Текст метрик в формате Prometheus.
+        """
+        with self._lock:
+            stages = {stage: (list(h.counts), h.sum, h.count) for stage, h in self._stages.items()}
+            counters = dict(self._counters)
+            streams = list(self._streams)
+            ticks = self.ticks
+
+        lines = ["# HELP saygex_stage_seconds Время этапа конвейера.",
+                 "# TYPE saygex_stage_seconds histogram"]
+        for stage, (counts, total, count) in sorted(stages.items()):
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS + (float("inf"),), counts):
+                cumulative += bucket
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append('saygex_stage_seconds_bucket{stage="%s",le="%s"} %d' % (stage, le, cumulative))
+            lines.append('saygex_stage_seconds_sum{stage="%s"} %.6f' % (stage, total))
+            lines.append('saygex_stage_seconds_count{stage="%s"} %d' % (stage, count))
+
+        lines += ["# HELP saygex_ticks_total Тактов конвейера (пакетных вызовов моделей).",
+                  "# TYPE saygex_ticks_total counter",
+                  "saygex_ticks_total %d" % ticks,
+                  "# HELP saygex_frames_total Кадров по видам обработки.",
+                  "# TYPE saygex_frames_total counter"]
+        for stream in streams:
+            for kind, attr in FRAME_COUNTERS:
+                lines.append('saygex_frames_total{platform="%s",kind="%s"} %d' % (
+                    _escape(stream.platform), kind, getattr(stream, attr, 0)))
+
+        for name, help_text in (("detections", "Детекций, прошедших фильтры."),
+                                ("new_tracks", "Новых объектов (уведомлений).")):
+            lines += ["# HELP saygex_%s_total %s" % (name, help_text), "# TYPE saygex_%s_total counter" % name]
+            for stream in streams:
+                lines.append('saygex_%s_total{platform="%s"} %d' % (
+                    name, _escape(stream.platform), counters.get((name, stream.platform), 0)))
+
+        lines += ["# HELP saygex_active_tracks Живых треков в трекере.", "# TYPE saygex_active_tracks gauge"]
+        lines += ['saygex_active_tracks{platform="%s"} %d' % (_escape(stream.platform), len(stream.tracker))
+                  for stream in streams]
+        lines += ["# HELP saygex_static_objects Известных неподвижных объектов в реестре.",
+                  "# TYPE saygex_static_objects gauge"]
+        lines += ['saygex_static_objects{platform="%s"} %d' % (_escape(stream.platform), len(stream.static_objects))
+                  for stream in streams]
+
+        scheduled = [stream for stream in streams if getattr(stream, "scheduler", None) is not None]
+        if scheduled:
+            lines += ["# HELP saygex_inference_interval Текущий интервал инференса, кадров.",
+                      "# TYPE saygex_inference_interval gauge"]
+            lines += ['saygex_inference_interval{platform="%s"} %d' % (_escape(stream.platform), stream.frame_interval)
+                      for stream in scheduled]
+
+        if self._latencies:
+            lines += ["# HELP saygex_latency_quantile_seconds Задержка от захвата кадра по последним значениям.",
+                      "# TYPE saygex_latency_quantile_seconds gauge"]
+            for name, stats in self._latencies.items():
+                for quantile, ms in stats.percentiles().items():
+                    lines.append('saygex_latency_quantile_seconds{kind="%s",quantile="%s"} %.4f' % (
+                        name, int(quantile[1:]) / 100.0, ms / 1000.0))
+        return "\n".join(lines) + "\n"
+
+    def log_line(self, previous=None):
+        """
+        Строка для периодического лога: среднее время этапов (с момента previous)
+        и счетчики кадров по потокам.
+
+        :param previous: Результат snapshot() в начале интервала.
+        :return: Кортеж (строка, новый snapshot).
+        """
+        current = self.snapshot()
+        previous = previous or {}
+        parts = []
+        for stage, (count, total) in sorted(current.items()):
+            prev_count, prev_total = previous.get(stage, (0, 0.0))
+            if count > prev_count:
+                parts.append("%s=%.1fms" % (stage, 1000.0 * (total - prev_total) / (count - prev_count)))
+        streams = ["%s %d/%d/%d" % (stream.platform, stream.frames_total, stream.frames_decoded,
+                                    stream.frames_inferred) for stream in self._streams]
+        line = "stages: %s | read/decoded/inferred: %s" % (" ".join(parts) or "-", ", ".join(streams) or "-")
+        return line, current
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsServer:
+    """
+    Локальный HTTP-эндпоинт /metrics в фоновом потоке.
+    """
+
+    def __init__(self, metrics, port=9108, host="127.0.0.1"):
+        self.metrics = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(handler):
+                if handler.path.split("?")[0] != "/metrics":
+                    handler.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                handler.send_response(200)
+                handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                handler.send_header("Content-Length", str(len(body)))
+                handler.end_headers()
+                handler.wfile.write(body)
+
+            def log_message(handler, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsLogger:
+    """
+    Периодически печатает Metrics.log_line() (по умолчанию в stderr).
+    """
+
+    def __init__(self, metrics, interval=60.0, file=None):
+        self.metrics = metrics
+        self.interval = interval
+        self.file = file
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        previous = None
+        while not self._stop.wait(self.interval):
+            line, previous = self.metrics.log_line(previous)
+            print(line, file=self.file or sys.stderr, flush=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
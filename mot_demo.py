@@ -0,0 +1,188 @@
+"""
+    SORT MOT benchmark demo, split out of sort.py so that importing the tracker core
+    does not load matplotlib (TkAgg) or scikit-image. Display dependencies are only
+    imported when the demo runs with --display.
+
+    Detections are grouped by frame once per sequence, sequences are tracked in parallel
+    worker processes and each output file is written in one go. Per-sequence and aggregate
+    tracking FPS are reported so tracker changes can be compared on large MOT datasets.
+
+    Usage: python mot_demo.py [--display] [--seq_path data] [--phase train] [--workers N] [--tracker sort|batch]
+"""
+from __future__ import print_function
+
+import os
+import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+# imported up front so that KalmanBoxTracker's lazy import is not counted as tracking time
+import filterpy.kalman
+
+from sort import BatchSort, KalmanBoxTracker, Sort
+
+TRACKERS = {'sort': Sort, 'batch': BatchSort}
+
+
+def load_display():
+  """
+  Imports the visualisation dependencies on demand and returns (plt, patches, io).
+  """
+  import matplotlib
+  matplotlib.use('TkAgg')
+  import matplotlib.pyplot as plt
+  import matplotlib.patches as patches
+  from skimage import io
+  return plt, patches, io
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description='SORT demo')
+    parser.add_argument('--display', dest='display', help='Display online tracker output (slow) [False]',action='store_true')
+    parser.add_argument("--seq_path", help="Path to detections.", type=str, default='data')
+    parser.add_argument("--phase", help="Subdirectory in seq_path.", type=str, default='train')
+    parser.add_argument("--max_age",
+                        help="Maximum number of frames to keep alive a track without associated detections.",
+                        type=int, default=1)
+    parser.add_argument("--min_hits",
+                        help="Minimum number of associated detections before track is initialised.",
+                        type=int, default=3)
+    parser.add_argument("--iou_threshold", help="Minimum IOU for match.", type=float, default=0.3)
+    parser.add_argument("--tracker", help="Tracker implementation [sort].", choices=sorted(TRACKERS), default='sort')
+    parser.add_argument("--workers", help="Sequences tracked in parallel, 0 = one per CPU [0].", type=int, default=0)
+    args = parser.parse_args()
+    return args
+
+
+def load_sequence(seq_dets_fn):
+  """
+  Loads a MOT det.txt and groups it by frame once, instead of scanning all detections
+    for every frame. Returns a list whose item i holds the [x1,y1,x2,y2,score] rows of frame i+1.
+  """
+  seq_dets = np.loadtxt(seq_dets_fn, delimiter=',', ndmin=2)
+  if len(seq_dets) == 0:
+    return []
+  seq_dets = seq_dets[np.argsort(seq_dets[:, 0], kind='stable')]
+  dets = seq_dets[:, 2:7].copy()
+  dets[:, 2:4] += dets[:, 0:2] #convert to [x1,y1,w,h] to [x1,y1,x2,y2]
+  n_frames = int(seq_dets[:, 0].max())
+  bounds = np.searchsorted(seq_dets[:, 0], np.arange(1, n_frames + 2)) #detection and frame numbers begin at 1
+  return [dets[bounds[i]:bounds[i + 1]] for i in range(n_frames)]
+
+
+def run_sequence(seq, seq_dets_fn, output_dir, tracker='sort', tracker_params=None, on_frame=None):
+  """
+  Tracks one sequence and writes output_dir/<seq>.txt.
+
+  on_frame(frame, trackers) is called after every update (used by --display).
+  Returns (seq, frames, tracking seconds); only the tracker updates are timed.
+  """
+  # ids start from 1 in every sequence, so the output does not depend on the number of workers
+  KalmanBoxTracker.count = 0
+  mot_tracker = TRACKERS[tracker](**(tracker_params or {})) #create instance of the SORT tracker
+  frames = load_sequence(seq_dets_fn)
+  rows = []
+  total_time = 0.0
+  for frame, dets in enumerate(frames, 1):
+    start_time = time.perf_counter()
+    trackers = mot_tracker.update(dets)
+    total_time += time.perf_counter() - start_time
+
+    if len(trackers):
+      rows.append(np.column_stack((np.full(len(trackers), frame), trackers[:, 4], trackers[:, 0:2],
+                                   trackers[:, 2:4] - trackers[:, 0:2])))
+    if on_frame is not None:
+      on_frame(frame, trackers)
+
+  # the whole file is formatted and written at once instead of one print per track
+  rows = np.concatenate(rows) if rows else np.empty((0, 6))
+  with open(os.path.join(output_dir, '%s.txt'%(seq)),'w') as out_file:
+    np.savetxt(out_file, rows, fmt='%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1')
+  return seq, len(frames), total_time
+
+
+def make_display(phase):
+  """
+  Returns an on_frame callback factory that draws tracks over the MOT benchmark images.
+  """
+  if not os.path.exists('mot_benchmark'):
+    print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
+    exit()
+  plt, patches, io = load_display()
+  np.random.seed(0)
+  colours = np.random.rand(32, 3) #used only for display
+  plt.ion()
+  fig = plt.figure()
+  ax1 = fig.add_subplot(111, aspect='equal')
+
+  def for_sequence(seq):
+    def on_frame(frame, trackers):
+      fn = os.path.join('mot_benchmark', phase, seq, 'img1', '%06d.jpg'%(frame))
+      im =io.imread(fn)
+      ax1.imshow(im)
+      plt.title(seq + ' Tracked Targets')
+      for d in trackers:
+        d = d.astype(np.int32)
+        ax1.add_patch(patches.Rectangle((d[0],d[1]),d[2]-d[0],d[3]-d[1],fill=False,lw=3,ec=colours[d[4]%32,:]))
+      fig.canvas.flush_events()
+      plt.draw()
+      ax1.cla()
+    return on_frame
+  return for_sequence
+
+
+def report(seq, frames, seconds):
+  print("%s: %d frames in %.3f seconds (%.1f FPS)" % (seq, frames, seconds, frames / seconds if seconds else float('inf')))
+
+
+def main():
+  # all train
+  args = parse_args()
+  phase = args.phase
+  tracker_params = {'max_age': args.max_age, 'min_hits': args.min_hits, 'iou_threshold': args.iou_threshold}
+
+  if not os.path.exists('output'):
+    os.makedirs('output')
+  pattern = os.path.join(args.seq_path, phase, '*', 'det', 'det.txt')
+  sequences = [(seq_dets_fn[pattern.find('*'):].split(os.path.sep)[0], seq_dets_fn)
+               for seq_dets_fn in glob.glob(pattern)]
+  # the longest sequences go first so that no worker is left with a big one at the end
+  sequences.sort(key=lambda item: os.path.getsize(item[1]), reverse=True)
+
+  workers = 1 if args.display else min(args.workers or os.cpu_count() or 1, max(1, len(sequences)))
+  results = []
+  wall_start = time.perf_counter()
+  if workers == 1:
+    display = make_display(phase) if args.display else None
+    for seq, seq_dets_fn in sequences:
+      print("Processing %s."%(seq))
+      result = run_sequence(seq, seq_dets_fn, 'output', args.tracker, tracker_params,
+                            on_frame=display(seq) if display else None)
+      report(*result)
+      results.append(result)
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      futures = [pool.submit(run_sequence, seq, seq_dets_fn, 'output', args.tracker, tracker_params)
+                 for seq, seq_dets_fn in sequences]
+      for future in as_completed(futures):
+        result = future.result()
+        report(*result)
+        results.append(result)
+  wall_time = time.perf_counter() - wall_start
+
+  total_frames = sum(frames for _, frames, _ in results)
+  total_time = sum(seconds for _, _, seconds in results)
+  print("Total Tracking took: %.3f seconds for %d frames or %.1f FPS" % (
+    total_time, total_frames, total_frames / total_time if total_time else float('inf')))
+  print("Wall clock (%d sequences, %d workers): %.3f seconds or %.1f FPS" % (
+    len(results), workers, wall_time, total_frames / wall_time if wall_time else float('inf')))
+
+  if(args.display):
+    print("Note: to get real runtime results run without the option: --display")
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,217 @@
+import threading
+import time
+from datetime import datetime
+from queue import Empty, Full, Queue
+
+import cv2
+import numpy as np
+from live import LatencyStats
+from metrics import NULL_METRICS
+
+
+def make_event(stream, track, captured_at=None):
+    """
+    Запись об обнаружении нового объекта.
+
+    :param stream: PlatformStream, на котором найден объект.
+    :param track: Строка трекера [x1, y1, x2, y2, id, conf].
+    :param captured_at: Время захвата кадра (time.time()); по умолчанию — текущее время.
+    :return: Словарь с временем захвата кадра, платформой, id трека, рамкой и уверенностью.
+    """
+    x1, y1, x2, y2, obj_id, conf = track
+    moment = datetime.now() if captured_at is None else datetime.fromtimestamp(captured_at)
+    return {
+        "time": moment.isoformat(timespec="milliseconds"),
+        "platform": stream.platform,
+        "track_id": int(obj_id),
+        "box": [round(float(v), 1) for v in (x1, y1, x2, y2)],
+        "confidence": round(float(conf), 3),
+    }
+
+
+class DetectionPipeline:
+    """
+    Цикл обработки нескольких камер без зависимости от Qt.
+
+    Каждый поток декодируется в собственном рабочем потоке, а выбранные кадры всех
+    камер собираются в один пакет и проходят через модели одним вызовом за такт.
+    Детекции возвращаются в трекер своей камеры, а о новых объектах сообщает on_detection.
+
+    Для каждого обработанного кадра и каждого события измеряется задержка от захвата
+    кадра до результата (frame_latency) и до уведомления (alert_latency).
+    """
+
+    def __init__(self, streams, detector, display=False, on_detection=None, on_first_frame=None, metrics=None):
+        """
+        :param streams: Список PlatformStream.
+        :param detector: EnsembleDetector, общий для всех камер.
+        :param display: Размечать кадры и показывать их в окне каждой камеры.
+        :param on_detection: Вызывается с записью make_event для каждого нового объекта.
+        :param on_first_frame: Вызывается с time.perf_counter() после обработки первого пакета.
+        :param metrics: metrics.Metrics для времени этапов и счетчиков; без него замеров нет.
+        """
+        self.streams = streams
+        self.detector = detector
+        self.display = display
+        self.on_detection = on_detection
+        self.on_first_frame = on_first_frame
+        self._running = False
+        self.frame_latency = LatencyStats()
+        self.alert_latency = LatencyStats()
+
+        self.metrics = metrics or NULL_METRICS
+        if metrics is not None:
+            detector.metrics = metrics
+            for stream in streams:
+                stream.metrics = metrics
+                metrics.register_stream(stream)
+            metrics.register_latency("capture_to_result", self.frame_latency)
+            metrics.register_latency("capture_to_alert", self.alert_latency)
+
+    def _decode(self, stream, queue):
+        # Рабочий поток камеры: читает поток до точек инференса и передает выборки в очередь.
+        # cv2 отпускает GIL на время декодирования, поэтому камеры декодируются параллельно.
+        stream.open()
+        try:
+            while self._running:
+                sample = stream.next_sample()
+                if stream.live and sample is not None:
+                    # Живой источник: в очереди держим только самый свежий кадр
+                    try:
+                        queue.put_nowait(sample)
+                    except Full:
+                        try:
+                            queue.get_nowait()
+                            stream.frames_stale += 1
+                        except Empty:
+                            pass
+                        queue.put(sample)
+                    continue
+                queue.put(sample)
+                if sample is None:
+                    break
+        finally:
+            stream.release()
+
+    def detect(self, batch):
+        """
+        Один пакетный вызов моделей на такт. Кадры камер в режиме tiled режутся на плитки
+        и проходят только изменившимися плитками, остальные кадры — целиком.
+
+        :param batch: Список пар (stream, sample).
+        :return: Список кортежей (boxes1, boxes2) в порядке batch.
+        """
+        full = [i for i, (stream, _) in enumerate(batch) if not stream.tiled]
+        tiled = [i for i, (stream, _) in enumerate(batch) if stream.tiled]
+        results = [None] * len(batch)
+        if full:
+            for i, boxes in zip(full, self.detector.detect_batch([batch[i][1].frame for i in full])):
+                results[i] = boxes
+        if tiled:
+            frames = [batch[i][1].frame for i in tiled]
+            masks = [batch[i][1].change_mask for i in tiled]
+            for i, boxes in zip(tiled, self.detector.detect_tiled_batch(frames, masks)):
+                results[i] = boxes
+        return results
+
+    def _open_sources(self):
+        """
+        Запускает чтение всех камер.
+
+        :return: Словарь stream -> источник выборок с методом get(), который блокируется
+                 до следующего Sample и возвращает None в конце потока.
+        """
+        self._queues = {}
+        self._workers = []
+        for stream in self.streams:
+            queue = Queue(maxsize=1 if stream.live else 2)
+            worker = threading.Thread(target=self._decode, args=(stream, queue), daemon=True)
+            worker.start()
+            self._queues[stream] = queue
+            self._workers.append(worker)
+        return self._queues
+
+    def _release(self, stream, sample):
+        """
+        Вызывается, когда выборка обработана и ее кадр больше не нужен.
+        """
+
+    def _close_sources(self, active):
+        for stream in active:
+            # Освобождаем рабочие потоки, ожидающие места в очереди
+            while not self._queues[stream].empty():
+                self._queues[stream].get_nowait()
+        for worker in self._workers:
+            worker.join(timeout=1.0)
+
+    def run(self):
+        self._running = True
+        sources = self._open_sources()
+
+        active = list(self.streams)
+        first_frame = True
+        while self._running and active:
+            # Собираем по одному выбранному кадру от каждой живой камеры
+            batch = []
+            for stream in list(active):
+                sample = sources[stream].get()
+                if sample is None:
+                    active.remove(stream)
+                    continue
+                batch.append((stream, sample))
+            if not batch:
+                break
+
+            started = time.perf_counter()
+            results = self.detect(batch)
+            elapsed = time.perf_counter() - started
+            self.metrics.observe("detect", elapsed)
+            self.metrics.tick()
+            # Стоимость инференса для адаптивных планировщиков камер
+            for scheduler in {stream.scheduler for stream, _ in batch if stream.scheduler is not None}:
+                scheduler.record_inference(elapsed, len(batch))
+
+            for (stream, sample), boxes in zip(batch, results):
+                if stream.recorder is not None:
+                    stream.recorder.add(sample, *boxes)
+                annotated_frame, new_tracks = stream.process(np.vstack(boxes), sample.frame, sample.motion_mask,
+                                                             annotate=self.display, mask_scale=sample.mask_scale,
+                                                             frame_index=sample.frame_index,
+                                                             static_mask=sample.static_mask)
+
+                self.frame_latency.add(time.time() - sample.captured_at)
+                if self.on_detection is not None:
+                    for track in new_tracks:
+                        self.on_detection(make_event(stream, track, sample.captured_at))
+                        self.alert_latency.add(time.time() - sample.captured_at)
+
+                if self.display:
+                    with self.metrics.time("imshow"):
+                        cv2.imshow(stream.platform, annotated_frame)
+                self._release(stream, sample)
+
+            if first_frame:
+                first_frame = False
+                if self.on_first_frame is not None:
+                    self.on_first_frame(time.perf_counter())
+
+            if self.display and cv2.waitKey(1) & 0xFF == ord("q"):
+                break
+
+        self._running = False
+        self._close_sources(active)
+        for stream in self.streams:
+            if stream.recorder is not None:
+                stream.recorder.save()
+        if self.display:
+            cv2.destroyAllWindows()
+
+    def latency_summary(self):
+        """
+        :return: Перцентили задержки от захвата кадра до результата и до уведомления.
+        """
+        return "%s; %s" % (self.frame_latency.summary("capture-to-result"),
+                           self.alert_latency.summary("capture-to-alert"))
+
+    def stop(self):
+        self._running = False
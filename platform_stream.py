@@ -0,0 +1,438 @@
+import os
+import time
+
+import cv2
+import numpy as np
+from live import LatestFrameReader
+from metrics import NULL_METRICS
+from scene_change import FrameDiffStage
+from sort import BatchSort, iou_batch
+from static_registry import StaticObjectRegistry
+
+
+def enhance_contrast(image):
+    """
+    Улучшает контрастность изображения с использованием CLAHE.
+
+    :param image: Входное изображение в формате BGR.
+    :return: Изображение с улучшенной контрастностью.
+    """
+    # Преобразуем изображение в цветовое пространство LAB
+    lab = cv2.cvtColor(image, cv2.COLOR_BGR2LAB)
+
+    # Разделяем компоненты LAB
+    l, a, b = cv2.split(lab)
+
+    # Создаем объект CLAHE
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+    # Применяем CLAHE к L-каналу
+    enhanced_l = clahe.apply(l)
+
+    # Объединяем улучшенный L-канал с оригинальными A и B каналами
+    enhanced_lab = cv2.merge((enhanced_l, a, b))
+
+    # Преобразуем изображение обратно в цветовое пространство BGR
+    enhanced_image = cv2.cvtColor(enhanced_lab, cv2.COLOR_LAB2BGR)
+
+    return enhanced_image
+
+
+def remove_duplicates(boxes, iou_threshold=0.5, score_threshold=0.2):
+    indices = cv2.dnn.NMSBoxes(boxes[:, :4], boxes[:, 4], score_threshold, iou_threshold)
+    if len(indices) > 0:
+        return boxes[indices.flatten()]
+    else:
+        return np.array([])
+
+
+def mask_sums(boxes, mask, scale=1.0):
+    """
+    Сумма маски внутри каждого бокса.
+
+    Таблица сумм (integral image) маски строится один раз на кадр, после чего
+    сумма по любому прямоугольнику считается по четырем угловым значениям
+    сразу для всех боксов.
+
+    :param boxes: Массив боксов [x1, y1, x2, y2, ...].
+    :param mask: Бинарная маска.
+    :param scale: Масштаб маски относительно кадра, в координатах которого заданы боксы.
+    :return: Массив сумм, по одной на бокс.
+    """
+    height, width = mask.shape[:2]
+    # int32 хватает даже для 4K: 3840 * 2160 * 255 < 2**31
+    sat = cv2.integral(mask, sdepth=cv2.CV_32S)
+
+    # Те же границы, что и у среза mask[int(y1):int(y2), int(x1):int(x2)]
+    coords = (boxes[:, :4] * scale if scale != 1.0 else boxes[:, :4]).astype(np.int64)
+    x1 = np.clip(coords[:, 0], 0, width)
+    y1 = np.clip(coords[:, 1], 0, height)
+    x2 = np.clip(coords[:, 2], x1, width)
+    y2 = np.clip(coords[:, 3], y1, height)
+
+    return sat[y2, x2] - sat[y1, x2] - sat[y2, x1] + sat[y1, x1]
+
+
+def motion_free(boxes, motion_mask, scale=1.0):
+    """
+    Проверяет, что внутри каждого бокса нет ни одного пикселя движения.
+
+    :param boxes: Массив боксов [x1, y1, x2, y2, ...].
+    :param motion_mask: Бинарная маска движения.
+    :param scale: Масштаб маски относительно кадра, в координатах которого заданы боксы.
+    :return: Булев массив: True для неподвижных объектов.
+    """
+    return mask_sums(boxes, motion_mask, scale) == 0
+
+
+def overlaps_mask(boxes, mask, scale=1.0):
+    """
+    Проверяет, что внутри каждого бокса есть хотя бы один пиксель маски.
+
+    :return: Булев массив: True для боксов, пересекающих маску.
+    """
+    return mask_sums(boxes, mask, scale) > 0
+
+
+class Sample:
+    """
+    Кадр, выбранный для инференса, вместе с масками, посчитанными при чтении потока.
+    """
+    __slots__ = ("frame", "motion_mask", "change_mask", "frame_index", "mask_scale", "captured_at", "frame_diff",
+                 "static_mask")
+
+    def __init__(self, frame, motion_mask, change_mask=None, frame_index=0, mask_scale=1.0, captured_at=None,
+                 frame_diff=None, static_mask=None):
+        """
+        :param frame: Кадр после улучшения контраста (BGR).
+        :param motion_mask: Маска движения относительно предыдущего кадра.
+        :param change_mask: Маска изменений относительно фона (для режима tiled) или None.
+        :param frame_index: Номер кадра в потоке.
+        :param mask_scale: Масштаб масок относительно кадра.
+        :param captured_at: Время захвата кадра (time.time()).
+        :param frame_diff: Разница с предыдущим кадром в оттенках серого (в масштабе mask_scale),
+                           из которой получена маска движения; нужна для записи детекций.
+        :param static_mask: Маска неподвижного переднего плана (BackgroundModelStage) или None.
+        """
+        self.frame = frame
+        self.motion_mask = motion_mask
+        self.change_mask = change_mask
+        self.frame_index = frame_index
+        self.mask_scale = mask_scale
+        self.captured_at = time.time() if captured_at is None else captured_at
+        self.frame_diff = frame_diff
+        self.static_mask = static_mask
+
+
+class PlatformStream:
+    """
+    Состояние одного видеопотока платформы: захват кадров, детектор движения и трекер.
+
+    Не зависит от Qt и от моделей: выдает выбранные для инференса кадры
+    и принимает готовые детекции, возвращая id новых объектов.
+    """
+
+    def __init__(self, source, platform, frame_interval=20, motion_threshold=50, decode_skip=True,
+                 tiled=False, change_threshold=25, background_rate=0.05, scene_stage=None, scheduler=None,
+                 live=False, max_area_fraction=0.005, nms_iou_threshold=0.5, nms_score_threshold=0.2,
+                 tracker_params=None, static_params=None):
+        """
+        :param source: Путь к видеофайлу или адрес потока камеры.
+        :param platform: Название платформы для уведомлений.
+        :param frame_interval: Инференс выполняется на каждом N-м кадре (если нет scheduler).
+        :param motion_threshold: Порог яркости для маски движения.
+        :param decode_skip: Пропускать промежуточные кадры через grab() без декодирования.
+        :param tiled: Режим плиток: модели запускаются только на плитках кадра в исходном
+                      разрешении, изменившихся относительно опорного фона.
+        :param change_threshold: Порог яркости для маски изменений относительно фона.
+        :param background_rate: Скорость обновления опорного фона (доля нового кадра).
+        :param scene_stage: Этап анализа сцены (scene_change.FrameDiffStage или
+                            BackgroundModelStage): строит маски и решает, нужен ли инференс.
+                            По умолчанию — разница соседних кадров, модели на каждом выбранном кадре.
+        :param scheduler: Общий для потоков scheduler.InferenceScheduler: интервал между выбранными
+                          кадрами меняется по активности сцены в пределах общего бюджета.
+        :param live: Режим живого источника: отдельный поток захвата хранит только последний
+                     кадр, и инференс всегда берет самый свежий, пропуская устаревшие.
+                     Видеофайлы в этом режиме читаются с их собственной частотой кадров.
+        :param max_area_fraction: Объекты больше этой доли площади кадра игнорируются.
+        :param nms_iou_threshold: Порог IoU для удаления дубликатов детекций двух моделей.
+        :param nms_score_threshold: Минимальная уверенность детекции для NMS.
+        :param tracker_params: Параметры BatchSort (max_age, min_hits, iou_threshold).
+        :param static_params: Параметры static_registry.StaticObjectRegistry (iou_threshold,
+                              centroid_tolerance, ttl, max_objects).
+        """
+        self.source = source
+        self.platform = platform
+        self.frame_interval = frame_interval
+        self.motion_threshold = motion_threshold
+        self.decode_skip = decode_skip
+        self.tiled = tiled
+        self.change_threshold = change_threshold
+        self.background_rate = background_rate
+        if scene_stage is None:
+            scene_stage = FrameDiffStage(motion_threshold, change_threshold, background_rate, track_changes=tiled)
+        self.scene_stage = scene_stage
+        self.scheduler = scheduler
+        self.live = live
+        self.reader = None
+        self.metrics = NULL_METRICS  # metrics.Metrics задается конвейером
+
+        self.max_area_fraction = max_area_fraction
+        self.nms_iou_threshold = nms_iou_threshold
+        self.nms_score_threshold = nms_score_threshold
+        self.tracker = BatchSort(**(tracker_params or {}))
+        self.recorder = None  # detection_cache.DetectionRecorder для записи выходов моделей
+        # Идентификаторы мусора, переживающие смерть и перерождение треков, с ограниченной памятью
+        self.static_objects = StaticObjectRegistry(**(static_params or {}))
+
+        self.cap = None
+        self.prev_frame = None
+        self.frame_count = 0
+        self.next_index = frame_interval  # Номер следующего выбранного кадра
+        self.max_object_area = 0
+        self.frame_size = (0, 0)
+
+        self.frames_total = 0  # Всего кадров прочитано из потока
+        self.frames_decoded = 0  # Кадров полностью декодировано
+        self.frames_inferred = 0  # Кадров, на которых запускались модели
+        self.frames_gated = 0  # Выбранных кадров, пропущенных этапом анализа сцены
+        self.frames_stale = 0  # Выбранных кадров live-режима, вытесненных более свежими до инференса
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.source)
+        self.set_frame_size(int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        if self.scheduler is not None:
+            self.frame_interval = self.scheduler.register(self, self.cap.get(cv2.CAP_PROP_FPS))
+
+        self.prev_frame = None
+        self.scene_stage.reset()
+        self.frame_count = 0
+        self.next_index = self.frame_interval
+        self.frames_total = 0
+        self.frames_decoded = 0
+        self.frames_inferred = 0
+        self.frames_gated = 0
+        self.frames_stale = 0
+
+        if self.live:
+            pace_fps = self.cap.get(cv2.CAP_PROP_FPS) if os.path.isfile(str(self.source)) else None
+            self.reader = LatestFrameReader(self.cap, pace_fps=pace_fps)
+            self.reader.start()
+        return self.cap
+
+    def __getstate__(self):
+        # Метрики (с блокировкой) остаются в своем процессе
+        state = self.__dict__.copy()
+        state["metrics"] = NULL_METRICS
+        return state
+
+    def set_frame_size(self, frame_width, frame_height):
+        """
+        Задает размер кадра потока для фильтра по площади (нужно, если кадры приходят
+        не через open(), например из другого процесса).
+        """
+        # Определите максимальную площадь объекта (по умолчанию 0.5% от площади кадра)
+        self.frame_size = (frame_width, frame_height)
+        self.max_object_area = frame_width * frame_height * self.max_area_fraction
+
+    def release(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.reader = None
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+    def next_sample(self):
+        """
+        Читает поток до следующей точки инференса.
+
+        :return: Sample для кадра, на котором нужно запустить модели,
+                 или None, если поток закончился.
+        """
+        if self.live:
+            return self._next_live_sample()
+
+        while self.cap.isOpened():
+            # В режиме выборки промежуточные кадры пропускаем через grab():
+            # демультиплексирование без декодирования и предобработки.
+            # Детектор движения при этом сравнивает соседние выбранные кадры.
+            if self.decode_skip and self.prev_frame is not None and self.frame_count < self.next_index:
+                with self.metrics.time("grab"):
+                    grabbed = self.cap.grab()
+                if not grabbed:
+                    return None
+                self.frames_total += 1
+                self.frame_count += 1
+                continue
+
+            with self.metrics.time("decode"):
+                success, frame = self.cap.read()
+            if not success:
+                return None
+            captured_at = time.time()
+            self.frames_total += 1
+            self.frames_decoded += 1
+
+            # Улучшение контрастности кадра
+            with self.metrics.time("enhance_contrast"):
+                frame = enhance_contrast(frame)
+
+            # Convert the frame to grayscale
+            with self.metrics.time("grayscale"):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            # Initialize prev_frame with the first frame
+            if self.prev_frame is None:
+                self.prev_frame = gray
+                self.frame_count += 1
+                continue
+
+            sampled = self.frame_count >= self.next_index
+            change = None
+            if sampled:
+                with self.metrics.time("scene"):
+                    change = self.scene_stage.update(gray, self.prev_frame)
+
+            self.prev_frame = gray
+            self.frame_count += 1
+
+            if sampled:
+                # Интервал мог измениться планировщиком после предыдущего выбранного кадра
+                self.next_index = self.frame_count - 1 + self.frame_interval
+                if not change.infer:
+                    # Сцена не изменилась: модели на этом кадре не нужны
+                    self.frames_gated += 1
+                    continue
+                self.frames_inferred += 1
+                return Sample(frame, change.motion_mask, change.change_mask, self.frame_count - 1, change.scale,
+                              captured_at, change.frame_diff, change.static_mask)
+        return None
+
+    def _next_live_sample(self):
+        # Живой источник: кадры читает поток захвата, здесь берется самый свежий кадр
+        # не раньше следующей точки инференса, а пропущенные кадры просто отбрасываются
+        while True:
+            min_index = 0 if self.prev_frame is None else self.next_index
+            latest = self.reader.read_latest(min_index)
+            if latest is None:
+                return None
+            index, frame, captured_at = latest
+            self.frames_total = self.frames_decoded = self.reader.frames_read
+            self.frame_count = index + 1
+
+            with self.metrics.time("enhance_contrast"):
+                frame = enhance_contrast(frame)
+            with self.metrics.time("grayscale"):
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            change = None
+            if self.prev_frame is not None:
+                with self.metrics.time("scene"):
+                    change = self.scene_stage.update(gray, self.prev_frame)
+            self.prev_frame = gray
+            self.next_index = index + self.frame_interval
+            if change is None:
+                continue
+            if not change.infer:
+                self.frames_gated += 1
+                continue
+            self.frames_inferred += 1
+            return Sample(frame, change.motion_mask, change.change_mask, index, change.scale, captured_at,
+                          change.frame_diff, change.static_mask)
+
+    def process(self, combined_boxes, frame, motion_mask, annotate=True, mask_scale=1.0, frame_index=None,
+                static_mask=None):
+        """
+        Фильтрует детекции моделей, обновляет трекер и находит новые объекты.
+
+        :param combined_boxes: Объединенные детекции моделей [x1, y1, x2, y2, conf, cls].
+        :param frame: Кадр, на котором выполнялся инференс.
+        :param motion_mask: Маска движения для этого кадра.
+        :param annotate: Рисовать ли рамки на копии кадра.
+        :param mask_scale: Масштаб маски движения относительно кадра.
+        :param frame_index: Номер кадра (для срока жизни объектов); по умолчанию — последний прочитанный.
+        :param static_mask: Маска неподвижного переднего плана (в масштабе mask_scale) или None;
+                            если задана, неподвижным считается только объект, пересекающий ее.
+        :return: Кортеж (annotated_frame, new_tracks), где new_tracks — строки трекера
+                 [x1, y1, x2, y2, id, conf] для впервые увиденных объектов
+                 (id — постоянный id объекта, conf — уверенность детекции, сопоставленной с треком).
+        """
+        with self.metrics.time("remove_duplicates"):
+            unique_boxes = remove_duplicates(combined_boxes, self.nms_iou_threshold, self.nms_score_threshold)
+
+        annotated_frame = frame.copy() if annotate else None
+        static_boxes = np.empty((0, 6))
+
+        if len(unique_boxes) > 0:
+            with self.metrics.time("filter"):
+                # Игнорировать объекты, занимающие более max_area_fraction площади кадра
+                areas = (unique_boxes[:, 2] - unique_boxes[:, 0]) * (unique_boxes[:, 3] - unique_boxes[:, 1])
+                unique_boxes = unique_boxes[areas <= self.max_object_area]
+
+                # Check if the object is NOT moving
+                still = motion_free(unique_boxes, motion_mask, mask_scale)
+                if static_mask is not None:
+                    # Модель фона: объект должен лежать в области, переставшей меняться
+                    still &= overlaps_mask(unique_boxes, static_mask, mask_scale)
+                static_boxes = unique_boxes[still]
+
+        if annotate:
+            with self.metrics.time("draw"):
+                for x1, y1, x2, y2, conf, cls in static_boxes:
+                    label = f'{"TRASH"} {conf:.2f}'
+                    cv2.rectangle(annotated_frame, (int(x1), int(y1)), (int(x2), int(y2)), (0, 0, 255), 2)
+                    cv2.putText(annotated_frame, label, (int(x1), int(y1) - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
+
+        detections = static_boxes[:, :5]
+        self.metrics.count("detections", self.platform, len(detections))
+
+        new_tracks = []
+        known = 0
+
+        frame_index = self.frame_count if frame_index is None else frame_index
+
+        # Трекер обновляется на каждом кадре инференса, в том числе без детекций,
+        # иначе треки не стареют; пропавший и вернувшийся мусор узнает static_objects
+        with self.metrics.time("tracker"):
+            trackers = self.tracker.update(detections)
+
+        # Check for new detections
+        for track in trackers:
+            obj_id, is_new = self.static_objects.observe(int(track[4]), track[:4], frame_index)
+            if is_new:
+                # Возвращенные трекером объекты обновлены на этом кадре —
+                # уверенность берем у наиболее перекрывающейся детекции
+                conf = detections[np.argmax(iou_batch(track[None, :4], detections[:, :4])[0]), 4]
+                new_tracks.append(np.array([*track[:4], obj_id + 1, conf]))
+            else:
+                known += 1
+        self.metrics.count("new_tracks", self.platform, len(new_tracks))
+
+        if self.scheduler is not None:
+            activity = cv2.countNonZero(motion_mask) / motion_mask.size
+            # Детекции, не объясненные уже найденными объектами, — кандидаты, которые трекеру
+            # нужно подтвердить несколькими кадрами подряд
+            candidates = max(0, len(detections) - len(new_tracks) - known)
+            self.frame_interval = self.scheduler.update(self, activity, candidates, len(new_tracks))
+
+        return annotated_frame, new_tracks
+
+    def frame_stats(self):
+        """
+        Сводка по кадрам последнего запуска: сколько прочитано, декодировано, передано в модели
+        и пропущено этапом анализа сцены.
+
+        :return: Строка со счетчиками кадров.
+        """
+        stats = "%s: %d read, %d decoded, %d inferred, %d gated (decode_skip=%s)" % (
+            self.platform, self.frames_total, self.frames_decoded, self.frames_inferred, self.frames_gated,
+            self.decode_skip)
+        if self.live:
+            stats += ", %d stale" % self.frames_stale
+        if self.scheduler is not None:
+            stats += ", " + self.scheduler.stats(self)
+        stats += ", %d static objects (%d reidentified)" % (len(self.static_objects),
+                                                            self.static_objects.reidentified)
+        return stats
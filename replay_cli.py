@@ -0,0 +1,71 @@
+"""
+Повторный прогон фильтрации и трекинга по кэшу детекций (detect_cli.py --record DIR)
+без запуска моделей. Для каждого сочетания параметров печатается число новых объектов.
+
+    python replay_cli.py records/stream0.npz --motion-threshold 30 50 70 --max-area-fraction 0.002 0.005
+    python replay_cli.py records/stream0.npz --min-hits 2 3 --events
+"""
+import argparse
+import itertools
+import json
+import sys
+
+from detection_cache import DetectionCache, replay
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Перебор параметров фильтрации и трекинга по кэшу детекций")
+    parser.add_argument("caches", nargs="+", help="Файлы кэша .npz")
+    parser.add_argument("--motion-threshold", type=int, nargs="+", default=[None],
+                        help="Порог маски движения (по умолчанию — как при записи)")
+    parser.add_argument("--max-area-fraction", type=float, nargs="+", default=[0.005],
+                        help="Максимальная доля площади кадра [0.005]")
+    parser.add_argument("--nms-iou", type=float, nargs="+", default=[0.5], help="Порог IoU для NMS [0.5]")
+    parser.add_argument("--nms-score", type=float, nargs="+", default=[0.2], help="Порог уверенности NMS [0.2]")
+    parser.add_argument("--max-age", type=int, nargs="+", default=[1], help="Sort max_age [1]")
+    parser.add_argument("--min-hits", type=int, nargs="+", default=[3], help="Sort min_hits [3]")
+    parser.add_argument("--track-iou", type=float, nargs="+", default=[0.3], help="Sort iou_threshold [0.3]")
+    parser.add_argument("--events", action="store_true", help="Печатать новые объекты (JSON Lines)")
+    parser.add_argument("--json", action="store_true", help="Результаты в JSON Lines вместо таблицы")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    caches = [(path, DetectionCache(path)) for path in args.caches]
+
+    grid = itertools.product(args.motion_threshold, args.max_area_fraction, args.nms_iou, args.nms_score,
+                             args.max_age, args.min_hits, args.track_iou)
+    if not args.json:
+        print("%-28s %6s %8s %6s %6s %4s %4s %5s %8s %10s" % (
+            "cache", "motion", "area", "nms", "score", "age", "hits", "iou", "objects", "samples/s"))
+    for motion, area, nms_iou, nms_score, max_age, min_hits, track_iou in grid:
+        params = {
+            "max_area_fraction": area,
+            "nms_iou_threshold": nms_iou,
+            "nms_score_threshold": nms_score,
+            "tracker_params": {"max_age": max_age, "min_hits": min_hits, "iou_threshold": track_iou},
+        }
+        if motion is not None:
+            params["motion_threshold"] = motion
+        for path, cache in caches:
+            def print_event(frame_index, track, cache=cache):
+                x1, y1, x2, y2, obj_id, conf = track
+                print(json.dumps({"platform": cache.meta["platform"], "frame": frame_index, "track_id": int(obj_id),
+                                  "box": [round(float(v), 1) for v in (x1, y1, x2, y2)],
+                                  "confidence": round(float(conf), 3)}, ensure_ascii=False))
+
+            result = replay(cache, on_track=print_event if args.events else None, **dict(params))
+            motion_used = motion if motion is not None else cache.meta["motion_threshold"]
+            if args.json:
+                print(json.dumps({"cache": path, "motion_threshold": motion_used, **params, **result},
+                                 ensure_ascii=False))
+            else:
+                print("%-28s %6d %8.4f %6.2f %6.2f %4d %4d %5.2f %8d %10.0f" % (
+                    path[-28:], motion_used, area, nms_iou, nms_score, max_age, min_hits, track_iou,
+                    result["new_objects"], result["samples_per_second"]))
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+import cv2
+import numpy as np
+
+
+class SceneChange:
+    """
+    Результат этапа анализа сцены для выбранного кадра.
+    """
+    __slots__ = ("motion_mask", "change_mask", "static_mask", "infer", "scale", "frame_diff")
+
+    def __init__(self, motion_mask, change_mask=None, static_mask=None, infer=True, scale=1.0, frame_diff=None):
+        """
+        :param motion_mask: Маска движения — по ней проверяется, что объект не движется.
+        :param change_mask: Маска отличий от фона (для выбора плиток) или None.
+        :param static_mask: Маска неподвижного переднего плана или None. Если задана, объект
+                            считается неподвижным, только если его рамка ее пересекает.
+        :param infer: Нужно ли запускать модели на этом кадре.
+        :param scale: Масштаб масок относительно кадра (маска = кадр * scale).
+        :param frame_diff: Разница кадров, из которой получена маска движения (тот же масштаб).
+        """
+        self.motion_mask = motion_mask
+        self.change_mask = change_mask
+        self.static_mask = static_mask
+        self.infer = infer
+        self.scale = scale
+        self.frame_diff = frame_diff
+
+
+class FrameDiffStage:
+    """
+    Исходная логика: маска движения — разница текущего и предыдущего кадра
+    в полном разрешении, модели запускаются на каждом выбранном кадре.
+    Для режима плиток дополнительно ведется опорный фон (скользящее среднее).
+    """
+
+    def __init__(self, motion_threshold=50, change_threshold=25, background_rate=0.05, track_changes=False):
+        """
+        :param motion_threshold: Порог яркости для маски движения.
+        :param change_threshold: Порог яркости для маски изменений относительно фона.
+        :param background_rate: Скорость обновления опорного фона (доля нового кадра).
+        :param track_changes: Считать маску изменений относительно фона (нужна для плиток).
+        """
+        self.motion_threshold = motion_threshold
+        self.change_threshold = change_threshold
+        self.background_rate = background_rate
+        self.track_changes = track_changes
+        self.background = None
+
+    def reset(self):
+        self.background = None
+
+    def update(self, gray, prev_gray):
+        """
+        :param gray: Выбранный кадр в оттенках серого.
+        :param prev_gray: Предыдущий декодированный кадр в оттенках серого.
+        :return: SceneChange.
+        """
+        # Compute the absolute difference between the current frame and previous frame
+        frame_diff = cv2.absdiff(prev_gray, gray)
+        _, motion_mask = cv2.threshold(frame_diff, self.motion_threshold, 255, cv2.THRESH_BINARY)
+        change_mask = self.update_background(gray) if self.track_changes else None
+        return SceneChange(motion_mask, change_mask, frame_diff=frame_diff)
+
+    def update_background(self, gray):
+        """
+        Сравнивает кадр с опорным фоном (скользящее среднее выбранных кадров) и обновляет фон.
+
+        :param gray: Кадр в оттенках серого.
+        :return: Маска пикселей, отличающихся от фона больше чем на change_threshold.
+                 На первом кадре фона еще нет, и изменившимся считается весь кадр.
+        """
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+            return np.full_like(gray, 255)
+        diff = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        _, change_mask = cv2.threshold(diff, self.change_threshold, 255, cv2.THRESH_BINARY)
+        cv2.accumulateWeighted(gray, self.background, self.background_rate)
+        return change_mask
+
+
+class BackgroundModelStage:
+    """
+    Инкрементальная модель фона в уменьшенном разрешении.
+
+    Передний план — пиксели, отличающиеся от фона (MOG2 или скользящее среднее).
+    Пиксель переднего плана, не менявшийся между выбранными кадрами static_samples раз
+    подряд, становится «неподвижным». Модели запускаются, только пока есть недавно
+    остановившаяся область не меньше min_area пикселей (в уменьшенном разрешении) —
+    confirm_samples выбранных кадров подряд, чтобы трекер успел подтвердить объект, —
+    на первом кадре и, если задано, не реже чем раз в refresh_samples выбранных кадров.
+    Постепенно фон поглощает оставленный предмет, и он перестает быть передним планом.
+    """
+
+    def __init__(self, method="mog2", scale=0.25, motion_threshold=50, foreground_threshold=25,
+                 background_rate=0.01, static_samples=3, confirm_samples=4, min_area=12, refresh_samples=None):
+        """
+        :param method: "mog2" — cv2.BackgroundSubtractorMOG2, "average" — скользящее среднее.
+        :param scale: Масштаб, в котором ведется модель фона.
+        :param motion_threshold: Порог яркости для маски движения между выбранными кадрами.
+        :param foreground_threshold: Порог отличия от фона (для "average"; для "mog2" — varThreshold).
+        :param background_rate: Скорость обучения фона на каждом выбранном кадре.
+        :param static_samples: Сколько выбранных кадров подряд пиксель должен быть неподвижным.
+        :param confirm_samples: Сколько выбранных кадров подряд запускать модели после остановки
+                                объекта: Sort выдает трек после min_hits + 1 обновлений подряд.
+        :param min_area: Минимальная площадь новой неподвижной области для запуска моделей.
+        :param refresh_samples: Принудительный запуск моделей не реже чем раз в N выбранных кадров.
+        """
+        if method not in ("mog2", "average"):
+            raise ValueError(f"Неизвестный метод модели фона: {method}")
+        self.method = method
+        self.scale = scale
+        self.motion_threshold = motion_threshold
+        self.foreground_threshold = foreground_threshold
+        self.background_rate = background_rate
+        self.static_samples = static_samples
+        self.confirm_samples = confirm_samples
+        self.min_area = min_area
+        self.refresh_samples = refresh_samples
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3))
+        self.reset()
+
+    def reset(self):
+        self.subtractor = None
+        self.background = None
+        self.prev_small = None
+        self.static_age = None
+        self.since_infer = 0
+
+    def _foreground(self, small):
+        if self.method == "mog2":
+            if self.subtractor is None:
+                self.subtractor = cv2.createBackgroundSubtractorMOG2(
+                    varThreshold=self.foreground_threshold, detectShadows=False)
+            return self.subtractor.apply(small, learningRate=self.background_rate)
+
+        if self.background is None:
+            self.background = small.astype(np.float32)
+        diff = cv2.absdiff(small, cv2.convertScaleAbs(self.background))
+        _, foreground = cv2.threshold(diff, self.foreground_threshold, 255, cv2.THRESH_BINARY)
+        cv2.accumulateWeighted(small, self.background, self.background_rate)
+        return foreground
+
+    def update(self, gray, prev_gray=None):
+        """
+        :param gray: Выбранный кадр в оттенках серого.
+        :param prev_gray: Не используется: движение считается между выбранными кадрами.
+        :return: SceneChange с масками в масштабе scale.
+        """
+        small = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        foreground = cv2.morphologyEx(self._foreground(small), cv2.MORPH_OPEN, self.kernel)
+
+        if self.prev_small is None:
+            # Первый кадр: фона еще нет, анализируем сцену целиком. Неподвижность пока
+            # неизвестна — вся маска движения заполнена, а неподвижных областей нет,
+            # поэтому ни одна рамка этого кадра не проходит проверку
+            self.prev_small = small
+            self.static_age = np.zeros(small.shape, dtype=np.uint8)
+            self.since_infer = 0
+            return SceneChange(np.full_like(small, 255), np.full_like(small, 255), np.zeros_like(small), True,
+                               self.scale, frame_diff=None)
+
+        frame_diff = cv2.absdiff(self.prev_small, small)
+        _, motion_mask = cv2.threshold(frame_diff, self.motion_threshold, 255, cv2.THRESH_BINARY)
+        self.prev_small = small
+
+        # Возраст неподвижности: растет, пока пиксель — передний план без движения
+        still = (foreground > 0) & (motion_mask == 0)
+        np.add(self.static_age, 1, out=self.static_age, where=still & (self.static_age < 255))
+        self.static_age[~still] = 0
+
+        static_mask = (self.static_age >= self.static_samples).astype(np.uint8) * 255
+        newly_static = cv2.countNonZero(cv2.inRange(
+            self.static_age, self.static_samples, self.static_samples + self.confirm_samples - 1))
+
+        self.since_infer += 1
+        infer = newly_static >= self.min_area or (
+            self.refresh_samples is not None and self.since_infer >= self.refresh_samples)
+        if infer:
+            self.since_infer = 0
+        return SceneChange(motion_mask, foreground, static_mask, infer, self.scale, frame_diff)
+
+
+def make_scene_stage(scene="diff", motion_threshold=50, scale=0.25, refresh_samples=None):
+    """
+    Этап анализа сцены по названию.
+
+    :param scene: "diff" — разница кадров (FrameDiffStage, создает PlatformStream);
+                  "mog2" или "average" — BackgroundModelStage.
+    :param motion_threshold: Порог маски движения.
+    :param scale: Масштаб модели фона.
+    :param refresh_samples: С моделью фона: запускать модели не реже чем раз в N выбранных кадров.
+    :return: Новый этап для одного потока или None для "diff".
+    """
+    if scene == "diff":
+        return None
+    return BackgroundModelStage(method=scene, scale=scale, motion_threshold=motion_threshold,
+                                refresh_samples=refresh_samples)
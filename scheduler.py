@@ -0,0 +1,156 @@
+import threading
+
+
+class StreamSchedule:
+    """
+    Состояние расписания одного потока: текущий интервал и счетчики для отчета.
+    """
+    __slots__ = ("fps", "interval", "desired", "active", "inferences")
+
+    def __init__(self, fps, interval):
+        self.fps = fps
+        self.interval = interval
+        self.desired = interval
+        self.active = True
+        self.inferences = 0
+
+
+class InferenceScheduler:
+    """
+    Адаптивный интервал инференса для нескольких потоков с общим бюджетом.
+
+    Пока в потоке есть движение, появляются новые неподтвержденные объекты или
+    только что найденные треки, интервал сбрасывается к min_interval. На статичной,
+    уже проанализированной сцене интервал растет в backoff раз за выбранный кадр
+    до max_interval.
+
+    Бюджет — доля времени, которую модели могут занимать (1.0 — одно ядро/ускоритель
+    полностью). Средняя стоимость кадра измеряется по фактическим вызовам моделей;
+    если суммарная частота инференса всех потоков не укладывается в бюджет, интервалы
+    всех потоков увеличиваются пропорционально.
+    """
+
+    def __init__(self, min_interval=5, max_interval=100, budget=0.8, backoff=1.5,
+                 activity_threshold=0.001, cost_smoothing=0.2):
+        """
+        :param min_interval: Минимальный интервал (в кадрах) для активной сцены.
+        :param max_interval: Максимальный интервал для статичной сцены.
+        :param budget: Доля времени, доступная моделям для всех потоков вместе.
+        :param backoff: Во сколько раз растет интервал после выбранного кадра без изменений.
+        :param activity_threshold: Доля пикселей маски движения, начиная с которой сцена активна.
+        :param cost_smoothing: Коэффициент экспоненциального сглаживания стоимости кадра.
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.budget = budget
+        self.backoff = backoff
+        self.activity_threshold = activity_threshold
+        self.cost_smoothing = cost_smoothing
+
+        self.cost = None  # Среднее время инференса одного кадра, с
+        self._schedules = {}
+        self._lock = threading.Lock()
+
+    def register(self, stream, fps=None):
+        """
+        Добавляет поток в расписание. Новая сцена еще не проанализирована,
+        поэтому поток начинает с минимального интервала.
+
+        :param stream: PlatformStream.
+        :param fps: Частота кадров потока; если не известна — 25.
+        """
+        with self._lock:
+            schedule = self._schedules.get(stream)
+            if schedule is None:
+                schedule = self._schedules[stream] = StreamSchedule(fps or 25.0, self.min_interval)
+            else:
+                schedule.fps = fps or schedule.fps
+                schedule.interval = schedule.desired = self.min_interval
+                schedule.active = True
+                schedule.inferences = 0
+        return schedule.interval
+
+    def record_inference(self, seconds, frames=1):
+        """
+        Учитывает время одного вызова моделей.
+
+        :param seconds: Длительность вызова.
+        :param frames: Сколько кадров было в пакете.
+        """
+        if frames <= 0:
+            return
+        cost = seconds / frames
+        with self._lock:
+            if self.cost is None:
+                self.cost = cost
+            else:
+                self.cost += self.cost_smoothing * (cost - self.cost)
+
+    def update(self, stream, activity, candidates, new_tracks):
+        """
+        Пересчитывает интервал потока после обработки выбранного кадра.
+
+        :param stream: PlatformStream.
+        :param activity: Доля пикселей маски движения на кадре.
+        :param candidates: Число детекций, не объясненных уже найденными объектами.
+        :param new_tracks: Число новых объектов на кадре.
+        :return: Новый интервал в кадрах.
+        """
+        with self._lock:
+            schedule = self._schedules[stream]
+            schedule.inferences += 1
+            schedule.active = activity >= self.activity_threshold or candidates > 0 or new_tracks > 0
+            if schedule.active:
+                schedule.desired = self.min_interval
+            else:
+                schedule.desired = min(self.max_interval, schedule.desired * self.backoff)
+
+            factor = self._budget_factor()
+            for other in self._schedules.values():
+                other.interval = int(round(min(self.max_interval, max(self.min_interval, other.desired * factor))))
+            return schedule.interval
+
+    def _budget_factor(self):
+        # Во сколько раз нужно растянуть желаемые интервалы, чтобы уложиться в бюджет
+        if not self.cost:
+            return 1.0
+        demand = sum(s.fps / s.desired for s in self._schedules.values()) * self.cost
+        return max(1.0, demand / self.budget)
+
+    def budget_use(self, stream):
+        """
+        :return: Доля бюджета, которую занимает поток при текущем интервале.
+        """
+        schedule = self._schedules[stream]
+        if not self.cost:
+            return 0.0
+        return schedule.fps / schedule.interval * self.cost / self.budget
+
+    def report(self):
+        """
+        Текущее состояние расписания по потокам.
+
+        :return: Список словарей: платформа, интервал (кадры), частота инференса (кадров/с),
+                 доля бюджета, активность сцены и число выбранных кадров.
+        """
+        with self._lock:
+            return [
+                {
+                    "platform": stream.platform,
+                    "interval": schedule.interval,
+                    "rate": round(schedule.fps / schedule.interval, 3),
+                    "budget_use": round(self.budget_use(stream), 3),
+                    "active": schedule.active,
+                    "inferences": schedule.inferences,
+                }
+                for stream, schedule in self._schedules.items()
+            ]
+
+    def stats(self, stream):
+        """
+        :return: Строка с интервалом и долей бюджета потока для сводки frame_stats.
+        """
+        with self._lock:
+            schedule = self._schedules[stream]
+            return "interval=%d, %.2f inf/s, %.0f%% of budget" % (
+                schedule.interval, schedule.fps / schedule.interval, 100 * self.budget_use(stream))
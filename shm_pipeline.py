@@ -0,0 +1,383 @@
+"""
+Многопроцессный вариант DetectionPipeline.
+
+Каждая камера декодируется и предобрабатывается (CLAHE, маски движения/изменений)
+в собственном процессе. Готовые выборки записываются в кольцевой буфер из заранее
+выделенных массивов NumPy в разделяемой памяти, а процесс инференса читает кадры
+и маски прямо из буфера, без копирования и pickle. Наружу — например, в GUI —
+передаются только небольшие записи о событиях (run_inference_process).
+"""
+import multiprocessing as mp
+import threading
+from multiprocessing import shared_memory
+from queue import Empty
+
+import cv2
+import numpy as np
+
+from pipeline import DetectionPipeline
+from platform_stream import Sample
+
+# Поля метаданных слота
+(_INDEX, _CAPTURED_AT, _SCALE, _MOTION_H, _MOTION_W, _CHANGE_H, _CHANGE_W, _DIFF_H, _DIFF_W,
+ _STATIC_H, _STATIC_W) = range(11)
+_META_FIELDS = 11
+# Поля заголовка кольца: счетчики кадров процесса декодирования
+_COUNTERS = ("frames_total", "frames_decoded", "frames_inferred", "frames_gated", "frames_stale")
+
+
+def probe_frame_size(source):
+    """
+    Определяет размер кадров источника.
+
+    :param source: Путь к видеофайлу или адрес потока.
+    :return: Кортеж (width, height).
+    """
+    cap = cv2.VideoCapture(source)
+    try:
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        if not width or not height:
+            success, frame = cap.read()
+            if not success:
+                raise RuntimeError(f"Не удалось прочитать кадр из источника: {source}")
+            height, width = frame.shape[:2]
+        return width, height
+    finally:
+        cap.release()
+
+
+class FrameRing:
+    """
+    Кольцевой буфер выборок в разделяемой памяти для одного производителя и одного потребителя.
+
+    Слот — кадр (height, width, 3), маски движения, изменений и неподвижных областей,
+    разница кадров (не больше кадра) и метаданные. Свободные и заполненные слоты считают два семафора, поэтому запись
+    и чтение не требуют блокировок, а кадр остается в слоте до release().
+    """
+
+    def __init__(self, height, width, slots=4, ctx=None):
+        """
+        :param height: Высота кадра.
+        :param width: Ширина кадра.
+        :param slots: Число слотов.
+        :param ctx: Контекст multiprocessing (для семафоров).
+        """
+        ctx = ctx or mp.get_context()
+        self.height = height
+        self.width = width
+        self.slots = slots
+        size = self._layout(height, width, slots)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.owner = True
+        self.free = ctx.Semaphore(slots)
+        self.filled = ctx.Semaphore(0)
+        self._attach()
+        self.meta[:] = 0
+        self.header[:] = 0
+
+    @staticmethod
+    def _layout(height, width, slots):
+        frame = height * width * 3
+        mask = height * width
+        return slots * (frame + 4 * mask + _META_FIELDS * 8) + len(_COUNTERS) * 8 + 8
+
+    def _attach(self):
+        height, width, slots = self.height, self.width, self.slots
+        buf = self.shm.buf
+        offset = 0
+
+        def take(shape, dtype):
+            nonlocal offset
+            array = np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+            offset += array.nbytes
+            return array
+
+        # Сначала 8-байтовые поля, чтобы они были выровнены
+        self.meta = take((slots, _META_FIELDS), np.float64)
+        self.header = take((len(_COUNTERS) + 1,), np.int64)
+        self.frames = take((slots, height, width, 3), np.uint8)
+        self.motion = take((slots, height * width), np.uint8)
+        self.change = take((slots, height * width), np.uint8)
+        self.diff = take((slots, height * width), np.uint8)
+        self.static = take((slots, height * width), np.uint8)
+        self._write_pos = 0
+        self._read_pos = 0
+
+    def __getstate__(self):
+        return {"name": self.shm.name, "height": self.height, "width": self.width, "slots": self.slots,
+                "free": self.free, "filled": self.filled}
+
+    def __setstate__(self, state):
+        self.height, self.width, self.slots = state["height"], state["width"], state["slots"]
+        self.free, self.filled = state["free"], state["filled"]
+        self.shm = shared_memory.SharedMemory(name=state["name"])
+        self.owner = False
+        self._attach()
+
+    def acquire(self, timeout=None):
+        """
+        Сторона производителя: ждет свободный слот.
+
+        :return: True, если слот получен.
+        """
+        return self.free.acquire(timeout=timeout)
+
+    def put(self, sample):
+        """
+        Сторона производителя: записывает выборку в слот, полученный через acquire().
+        """
+        slot = self._write_pos % self.slots
+        if sample.frame.shape != (self.height, self.width, 3):
+            raise ValueError(f"Размер кадра {sample.frame.shape} не совпадает с буфером {self.height}x{self.width}")
+        self.frames[slot] = sample.frame
+        meta = self.meta[slot]
+        meta[_INDEX] = sample.frame_index
+        meta[_CAPTURED_AT] = sample.captured_at
+        meta[_SCALE] = sample.mask_scale
+        meta[_MOTION_H], meta[_MOTION_W] = self._put_mask(self.motion[slot], sample.motion_mask)
+        meta[_CHANGE_H], meta[_CHANGE_W] = self._put_mask(self.change[slot], sample.change_mask)
+        # Разница кадров нужна DetectionRecorder: по маске движения нельзя сменить порог при повторе
+        meta[_DIFF_H], meta[_DIFF_W] = self._put_mask(self.diff[slot], sample.frame_diff)
+        meta[_STATIC_H], meta[_STATIC_W] = self._put_mask(self.static[slot], sample.static_mask)
+        self._write_pos += 1
+        self.filled.release()
+
+    @staticmethod
+    def _put_mask(flat, mask):
+        if mask is None:
+            return 0, 0
+        height, width = mask.shape[:2]
+        flat[:height * width] = mask.reshape(-1)
+        return height, width
+
+    def put_end(self, stream):
+        """
+        Сторона производителя: сообщает о конце потока и передает счетчики кадров.
+        Слот для записи должен быть получен через acquire().
+        """
+        for i, name in enumerate(_COUNTERS):
+            self.header[i] = getattr(stream, name)
+        self.meta[self._write_pos % self.slots, _INDEX] = -1
+        self._write_pos += 1
+        self.filled.release()
+
+    def get(self, timeout=None):
+        """
+        Сторона потребителя: следующая выборка. Массивы Sample — представления слота
+        в разделяемой памяти; они действительны до вызова release().
+
+        :return: Sample; None в конце потока; False, если истек timeout.
+        """
+        if not self.filled.acquire(timeout=timeout):
+            return False
+        slot = self._read_pos % self.slots
+        meta = self.meta[slot]
+        if meta[_INDEX] < 0:
+            return None
+        motion_h, motion_w = int(meta[_MOTION_H]), int(meta[_MOTION_W])
+        change_h, change_w = int(meta[_CHANGE_H]), int(meta[_CHANGE_W])
+        diff_h, diff_w = int(meta[_DIFF_H]), int(meta[_DIFF_W])
+        change_mask = self.change[slot, :change_h * change_w].reshape(change_h, change_w) if change_h else None
+        frame_diff = self.diff[slot, :diff_h * diff_w].reshape(diff_h, diff_w) if diff_h else None
+        static_h, static_w = int(meta[_STATIC_H]), int(meta[_STATIC_W])
+        static_mask = self.static[slot, :static_h * static_w].reshape(static_h, static_w) if static_h else None
+        return Sample(self.frames[slot], self.motion[slot, :motion_h * motion_w].reshape(motion_h, motion_w),
+                      change_mask, int(meta[_INDEX]), float(meta[_SCALE]), float(meta[_CAPTURED_AT]), frame_diff,
+                      static_mask)
+
+    def release(self):
+        """
+        Сторона потребителя: возвращает прочитанный слот производителю.
+        """
+        self._read_pos += 1
+        self.free.release()
+
+    def counters(self):
+        """
+        :return: Счетчики кадров, переданные производителем в put_end().
+        """
+        return {name: int(self.header[i]) for i, name in enumerate(_COUNTERS)}
+
+    def close(self):
+        # Представления удерживают буфер, их нужно отпустить до закрытия
+        self.meta = self.header = self.frames = self.motion = self.change = self.diff = self.static = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _decoder_main(stream, ring, stop_event):
+    # Процесс камеры: захват, CLAHE и маски; выборки пишутся в кольцевой буфер.
+    # Слот занимается до чтения кадра, чтобы в live-режиме записывался самый свежий кадр.
+    stream.open()
+    try:
+        while not stop_event.is_set():
+            if not ring.acquire(timeout=0.5):
+                continue
+            sample = stream.next_sample()
+            if sample is None:
+                ring.put_end(stream)
+                return
+            ring.put(sample)
+        # Остановка: конец потока передается, только если есть свободный слот
+        if ring.acquire(timeout=0.5):
+            ring.put_end(stream)
+    finally:
+        stream.release()
+        ring.close()
+
+
+class _RingSource:
+    # Адаптер кольца к интерфейсу источника DetectionPipeline: get() ждет выборку,
+    # пока конвейер работает и процесс камеры жив
+    def __init__(self, pipeline, stream, ring, process):
+        self.pipeline = pipeline
+        self.stream = stream
+        self.ring = ring
+        self.process = process
+        self.ended = False
+
+    def _finish(self):
+        # Конец потока: забираем итоговые счетчики кадров процесса камеры
+        self.ended = True
+        for name, value in self.ring.counters().items():
+            setattr(self.stream, name, value)
+
+    def get(self):
+        while self.pipeline._running and not self.ended:
+            sample = self.ring.get(timeout=0.5)
+            if sample is False:
+                if not self.process.is_alive():
+                    self.ended = True
+                    return None
+                continue
+            if sample is None:
+                self._finish()
+            return sample
+        return None
+
+    def drain(self):
+        # Остановка: освобождаем слоты, пока процесс камеры не передаст конец потока
+        while not self.ended:
+            sample = self.ring.get(timeout=1.0)
+            if sample is False:
+                return
+            if sample is None:
+                self._finish()
+                return
+            self.ring.release()
+
+
+class SharedMemoryPipeline(DetectionPipeline):
+    """
+    DetectionPipeline, в котором каждая камера читается в отдельном процессе,
+    а выборки передаются через FrameRing в разделяемой памяти.
+
+    Трекер, фильтры и модели остаются в текущем процессе; PlatformStream передается
+    в процесс камеры копией до open(), поэтому адаптивный планировщик (общий объект
+    в памяти процесса) в этом режиме не поддерживается.
+    """
+
+    def __init__(self, streams, detector, slots=4, **kwargs):
+        """
+        :param streams: Список PlatformStream (еще не открытых).
+        :param detector: EnsembleDetector.
+        :param slots: Число слотов кольцевого буфера на камеру (для live-камер — 2).
+        :param kwargs: Остальные параметры DetectionPipeline.
+        """
+        if any(stream.scheduler is not None for stream in streams):
+            raise ValueError("SharedMemoryPipeline не поддерживает InferenceScheduler")
+        super().__init__(streams, detector, **kwargs)
+        self.slots = slots
+
+    def _open_sources(self):
+        ctx = mp.get_context("spawn")
+        self._stop_event = ctx.Event()
+        self._rings = {}
+        self._processes = []
+        self._sources = sources = {}
+        try:
+            for stream in self.streams:
+                width, height = probe_frame_size(stream.source)
+                stream.set_frame_size(width, height)
+                # В live-режиме один слот обрабатывается, а во втором ждет самый свежий кадр
+                ring = self._rings[stream] = FrameRing(height, width, 2 if stream.live else self.slots, ctx)
+                process = ctx.Process(target=_decoder_main, args=(stream, ring, self._stop_event), daemon=True)
+                process.start()
+                self._processes.append(process)
+                sources[stream] = _RingSource(self, stream, ring, process)
+        except BaseException:
+            self._close_sources([])
+            raise
+        return sources
+
+    def _release(self, stream, sample):
+        self._rings[stream].release()
+
+    def _close_sources(self, active):
+        self._stop_event.set()
+        for source in self._sources.values():
+            source.drain()
+        for process in self._processes:
+            process.join(timeout=2.0)
+            if process.is_alive():
+                process.terminate()
+        for ring in self._rings.values():
+            ring.close()
+
+
+def run_inference_process(streams, model_path1, model_path2, events, stop_event, threads=None, slots=4,
+                          backend_options=None):
+    """
+    Точка входа процесса инференса: модели, трекеры и SharedMemoryPipeline.
+
+    В очередь events отправляются только небольшие записи:
+    ("first_frame", None), ("detection", make_event(...)), ("stats", [строки]) и None в конце.
+
+    :param streams: Список PlatformStream.
+    :param model_path1: Путь к весам первой модели.
+    :param model_path2: Путь к весам второй модели.
+    :param events: multiprocessing.Queue для событий.
+    :param stop_event: multiprocessing.Event для остановки.
+    :param threads: Число intra-op потоков для каждой модели (n1, n2), см. EnsembleDetector.
+    :param slots: Число слотов кольцевого буфера на камеру.
+    :param backend_options: Аргументы EnsembleDetector backend/int8/calibration.
+    """
+    from ensemble import EnsembleDetector
+
+    detector = EnsembleDetector(model_path1, model_path2, imgsz=640, conf=(0.25, 0.25), threads=threads,
+                                **(backend_options or {}))
+    pipeline = SharedMemoryPipeline(streams, detector, slots=slots,
+                                    on_detection=lambda event: events.put(("detection", event)),
+                                    on_first_frame=lambda _: events.put(("first_frame", None)))
+
+    def watch_stop():
+        stop_event.wait()
+        pipeline.stop()
+
+    threading.Thread(target=watch_stop, daemon=True).start()
+    try:
+        pipeline.run()
+    finally:
+        detector.close()
+        events.put(("stats", [stream.frame_stats() for stream in streams] + [pipeline.latency_summary()]))
+        events.put(None)
+
+
+def iter_events(events, process, poll=0.5):
+    """
+    Читает записи процесса инференса, пока он не завершится.
+
+    :return: Генератор кортежей (kind, payload).
+    """
+    while True:
+        try:
+            message = events.get(timeout=poll)
+        except Empty:
+            if not process.is_alive():
+                return
+            continue
+        if message is None:
+            return
+        yield message
@@ -17,31 +17,45 @@
 """
 from __future__ import print_function
 
-import os
 import numpy as np
-import matplotlib
-matplotlib.use('TkAgg')
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from skimage import io
 
-import glob
-import time
-import argparse
-from filterpy.kalman import KalmanFilter
 
-np.random.seed(0)
+# Above this many detection-track pairs association switches from the dense IOU matrix
+# to spatial-grid pre-gating with a sparse cost graph
+SPARSE_MIN_PAIRS = 4096
+
+_solver = None
+
+
+def _resolve_solver():
+  """
+  Picks the assignment backend once (lap if installed, else scipy) instead of retrying the import on every call.
+  """
+  global _solver
+  if _solver is None:
+    try:
+      import lap
+
+      def solve(cost_matrix):
+        _, x, _ = lap.lapjv(cost_matrix, extend_cost=True)
+        rows = np.flatnonzero(x >= 0)
+        return np.stack((rows, x[rows]), axis=1)
+    except ImportError:
+      from scipy.optimize import linear_sum_assignment
+
+      def solve(cost_matrix):
+        return np.stack(linear_sum_assignment(cost_matrix), axis=1)
+    _solver = solve
+  return _solver
 
 
 def linear_assignment(cost_matrix):
-  try:
-    import lap
-    _, x, y = lap.lapjv(cost_matrix, extend_cost=True)
-    return np.array([[y[i],i] for i in x if i >= 0]) #
-  except ImportError:
-    from scipy.optimize import linear_sum_assignment
-    x, y = linear_sum_assignment(cost_matrix)
-    return np.array(list(zip(x, y)))
+  """
+  Returns an (K,2) int array of [row, col] pairs minimising the total cost.
+  """
+  if cost_matrix.size == 0:
+    return np.empty((0, 2), dtype=int)
+  return _resolve_solver()(cost_matrix)
 
 
 def iou_batch(bb_test, bb_gt):
@@ -100,6 +114,9 @@ class KalmanBoxTracker(object):
     """
     Initialises a tracker using initial bounding box.
     """
+    # filterpy pulls in scipy, so it is only imported once a per-object tracker is created
+    from filterpy.kalman import KalmanFilter
+
     #define constant velocity model
     self.kf = KalmanFilter(dim_x=7, dim_z=4) 
     self.kf.F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]])
@@ -151,49 +168,153 @@ class KalmanBoxTracker(object):
     return convert_x_to_bbox(self.kf.x)
 
 
+def iou_pairs(bb_test, bb_gt):
+  """
+  IOU of bb_test[i] with bb_gt[i] for every row, without building the full matrix.
+  """
+  w = np.maximum(0., np.minimum(bb_test[:, 2], bb_gt[:, 2]) - np.maximum(bb_test[:, 0], bb_gt[:, 0]))
+  h = np.maximum(0., np.minimum(bb_test[:, 3], bb_gt[:, 3]) - np.maximum(bb_test[:, 1], bb_gt[:, 1]))
+  wh = w * h
+  return wh / ((bb_test[:, 2] - bb_test[:, 0]) * (bb_test[:, 3] - bb_test[:, 1])
+    + (bb_gt[:, 2] - bb_gt[:, 0]) * (bb_gt[:, 3] - bb_gt[:, 1]) - wh)
+
+
+def _expand_ranges(starts, counts):
+  """
+  Concatenates arange(start, start + count) for every pair, vectorised.
+  """
+  total = counts.sum()
+  return np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+
+
+def _covered_cells(boxes, cell):
+  """
+  Returns (cell keys, box indices) for every grid cell each box covers.
+  """
+  lo = np.floor(boxes[:, 0:2] / cell)
+  hi = np.floor(boxes[:, 2:4] / cell)
+  valid = np.isfinite(lo).all(1) & np.isfinite(hi).all(1)
+  lo = np.where(valid[:, None], lo, 0).astype(np.int64)
+  hi = np.where(valid[:, None], hi, -1).astype(np.int64)
+  nx = np.maximum(hi[:, 0] - lo[:, 0] + 1, 0)
+  ny = np.maximum(hi[:, 1] - lo[:, 1] + 1, 0)
+  n = nx * ny
+  idx = np.repeat(np.arange(len(boxes)), n)
+  k = _expand_ranges(np.zeros(len(boxes), dtype=np.int64), n)
+  cx = lo[idx, 0] + k % nx[idx]
+  cy = lo[idx, 1] + k // nx[idx]
+  return cx * 4294967296 + cy, idx
+
+
+def candidate_pairs(detections, trackers):
+  """
+  Spatial-grid pre-gating: returns (detection indices, tracker indices) of nearby pairs, including every pair
+    whose boxes overlap.
+
+  Trackers are binned into every cell of a grid (cell size = median tracker size) that their box covers,
+    detections are looked up in the cells they cover, so only nearby pairs are ever scored.
+  """
+  sizes = np.maximum(trackers[:, 2] - trackers[:, 0], trackers[:, 3] - trackers[:, 1])
+  sizes = sizes[np.isfinite(sizes) & (sizes > 0)]
+  cell = max(float(np.median(sizes)), 1.) if len(sizes) else 1.
+  trk_keys, trk_idx = _covered_cells(trackers, cell)
+  det_keys, det_idx = _covered_cells(detections, cell)
+  order = np.argsort(trk_keys, kind='stable')
+  trk_keys, trk_idx = trk_keys[order], trk_idx[order]
+  lo = np.searchsorted(trk_keys, det_keys, 'left')
+  counts = np.searchsorted(trk_keys, det_keys, 'right') - lo
+  keys = np.repeat(det_keys, counts)
+  det_rep = np.repeat(det_idx, counts)
+  trk_rep = trk_idx[_expand_ranges(lo, counts)]
+  # boxes sharing several cells meet more than once: keep a pair only in the cell holding the
+  # top-left corner of the intersection, which both boxes cover if they overlap
+  corner = np.floor(np.maximum(detections[det_rep, 0:2], trackers[trk_rep, 0:2]) / cell).astype(np.int64)
+  first = keys == corner[:, 0] * 4294967296 + corner[:, 1]
+  return det_rep[first], trk_rep[first]
+
+
+def _assign_sparse(det_idx, trk_idx, iou, n_det, n_trk):
+  """
+  Maximum-IOU assignment on a sparse bipartite graph of gated pairs.
+
+  Components made of a single pair are matched directly; every other connected component
+    is solved on its own small dense cost matrix.
+  """
+  det_degree = np.bincount(det_idx, minlength=n_det)
+  trk_degree = np.bincount(trk_idx, minlength=n_trk)
+  single = (det_degree[det_idx] == 1) & (trk_degree[trk_idx] == 1)
+  matches = [np.stack((det_idx[single], trk_idx[single]), axis=1)]
+
+  rest = ~single
+  if rest.any():
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    d, t, w = det_idx[rest], trk_idx[rest], iou[rest]
+    graph = coo_matrix((w, (d, t + n_det)), shape=(n_det + n_trk, n_det + n_trk))
+    _, labels = connected_components(graph, directed=False)
+    order = np.argsort(labels[d], kind='stable')
+    d, t, w = d[order], t[order], w[order]
+    bounds = np.flatnonzero(np.diff(labels[d])) + 1
+    for cd, ct, cw in zip(np.split(d, bounds), np.split(t, bounds), np.split(w, bounds)):
+      rows, ri = np.unique(cd, return_inverse=True)
+      cols, ci = np.unique(ct, return_inverse=True)
+      cost = np.zeros((len(rows), len(cols)))
+      cost[ri, ci] = -cw
+      m = linear_assignment(cost)
+      matches.append(np.stack((rows[m[:, 0]], cols[m[:, 1]]), axis=1))
+
+  matches = np.concatenate(matches).astype(int)
+  # same order as the dense solver: by detection index
+  return matches[np.argsort(matches[:, 0], kind='stable')]
+
+
 def associate_detections_to_trackers(detections,trackers,iou_threshold = 0.3):
   """
   Assigns detections to tracked object (both represented as bounding boxes)
 
   Returns 3 lists of matches, unmatched_detections and unmatched_trackers
+
+  Small problems use the dense IOU matrix. Beyond SPARSE_MIN_PAIRS pairs only nearby pairs found by
+    candidate_pairs are scored, pairs below iou_threshold (which could never be kept as matches) are gated
+    out and the remaining graph is solved per connected component, so the cost grows with the number of
+    boxes rather than with their product.
   """
   if(len(trackers)==0):
     return np.empty((0,2),dtype=int), np.arange(len(detections)), np.empty((0,5),dtype=int)
 
-  iou_matrix = iou_batch(detections, trackers)
+  if len(detections) * len(trackers) <= SPARSE_MIN_PAIRS:
+    iou_matrix = iou_batch(detections, trackers)
 
-  if min(iou_matrix.shape) > 0:
-    a = (iou_matrix > iou_threshold).astype(np.int32)
-    if a.sum(1).max() == 1 and a.sum(0).max() == 1:
-        matched_indices = np.stack(np.where(a), axis=1)
+    if min(iou_matrix.shape) > 0:
+      a = (iou_matrix > iou_threshold).astype(np.int32)
+      if a.sum(1).max() == 1 and a.sum(0).max() == 1:
+          matched_indices = np.stack(np.where(a), axis=1)
+      else:
+        matched_indices = linear_assignment(-iou_matrix)
     else:
-      matched_indices = linear_assignment(-iou_matrix)
+      matched_indices = np.empty((0,2),dtype=int)
+    matched_iou = iou_matrix[matched_indices[:, 0], matched_indices[:, 1]]
   else:
-    matched_indices = np.empty(shape=(0,2))
-
-  unmatched_detections = []
-  for d, det in enumerate(detections):
-    if(d not in matched_indices[:,0]):
-      unmatched_detections.append(d)
-  unmatched_trackers = []
-  for t, trk in enumerate(trackers):
-    if(t not in matched_indices[:,1]):
-      unmatched_trackers.append(t)
+    det_idx, trk_idx = candidate_pairs(detections, trackers)
+    iou = iou_pairs(detections[det_idx], trackers[trk_idx])
+    gated = iou >= iou_threshold
+    det_idx, trk_idx, iou = det_idx[gated], trk_idx[gated], iou[gated]
+    matched_indices = _assign_sparse(det_idx, trk_idx, iou, len(detections), len(trackers))
+    matched_iou = iou_pairs(detections[matched_indices[:, 0]], trackers[matched_indices[:, 1]])
+
+  matched_dets = np.zeros(len(detections), dtype=bool)
+  matched_dets[matched_indices[:, 0]] = True
+  matched_trks = np.zeros(len(trackers), dtype=bool)
+  matched_trks[matched_indices[:, 1]] = True
 
   #filter out matched with low IOU
-  matches = []
-  for m in matched_indices:
-    if(iou_matrix[m[0], m[1]]<iou_threshold):
-      unmatched_detections.append(m[0])
-      unmatched_trackers.append(m[1])
-    else:
-      matches.append(m.reshape(1,2))
-  if(len(matches)==0):
-    matches = np.empty((0,2),dtype=int)
-  else:
-    matches = np.concatenate(matches,axis=0)
+  low = ~(matched_iou >= iou_threshold)
+  matches = matched_indices[~low]
+  unmatched_detections = np.concatenate((np.flatnonzero(~matched_dets), matched_indices[low, 0]))
+  unmatched_trackers = np.concatenate((np.flatnonzero(~matched_trks), matched_indices[low, 1]))
 
-  return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+  return matches, unmatched_detections, unmatched_trackers
 
 
 class Sort(object):
@@ -252,79 +373,161 @@ class Sort(object):
       return np.concatenate(ret)
     return np.empty((0,5))
 
-def parse_args():
-    """Parse input arguments."""
-    parser = argparse.ArgumentParser(description='SORT demo')
-    parser.add_argument('--display', dest='display', help='Display online tracker output (slow) [False]',action='store_true')
-    parser.add_argument("--seq_path", help="Path to detections.", type=str, default='data')
-    parser.add_argument("--phase", help="Subdirectory in seq_path.", type=str, default='train')
-    parser.add_argument("--max_age", 
-                        help="Maximum number of frames to keep alive a track without associated detections.", 
-                        type=int, default=1)
-    parser.add_argument("--min_hits", 
-                        help="Minimum number of associated detections before track is initialised.", 
-                        type=int, default=3)
-    parser.add_argument("--iou_threshold", help="Minimum IOU for match.", type=float, default=0.3)
-    args = parser.parse_args()
-    return args
+def convert_bboxes_to_z(bboxes):
+  """
+  Vectorised convert_bbox_to_z: takes N bounding boxes [x1,y1,x2,y2,...] and returns
+    an (N,4) array of [x,y,s,r]
+  """
+  w = bboxes[:, 2] - bboxes[:, 0]
+  h = bboxes[:, 3] - bboxes[:, 1]
+  return np.stack([bboxes[:, 0] + w/2., bboxes[:, 1] + h/2., w * h, w / h], axis=1)
+
+
+def convert_xs_to_bboxes(xs):
+  """
+  Vectorised convert_x_to_bbox: takes an (N,>=4) array of centre form states [x,y,s,r,...]
+    and returns an (N,4) array of [x1,y1,x2,y2]
+  """
+  with np.errstate(invalid='ignore'):
+    w = np.sqrt(xs[:, 2] * xs[:, 3])
+    h = xs[:, 2] / w
+  return np.stack([xs[:, 0] - w/2., xs[:, 1] - h/2., xs[:, 0] + w/2., xs[:, 1] + h/2.], axis=1)
+
+
+class BatchSort(object):
+  """
+  Drop-in replacement for Sort that keeps every track in stacked arrays instead of one
+    KalmanBoxTracker (and one filterpy KalmanFilter) per object.
+
+  States are stored as an (N,7) array and covariances as an (N,7,7) array, so predict and
+    update run for all tracks in a single vectorised step. The constant velocity model, noise
+    matrices, track ids and birth/death rules are identical to Sort/KalmanBoxTracker.
+  """
+  F = np.array([[1,0,0,0,1,0,0],[0,1,0,0,0,1,0],[0,0,1,0,0,0,1],[0,0,0,1,0,0,0],  [0,0,0,0,1,0,0],[0,0,0,0,0,1,0],[0,0,0,0,0,0,1]], dtype=float)
+  Q = np.diag([1., 1., 1., 1., 0.01, 0.01, 0.0001])
+  R = np.diag([1., 1., 10., 10.])
+  P0 = np.diag([10., 10., 10., 10., 10000., 10000., 10000.])
+
+  def __init__(self, max_age=1, min_hits=3, iou_threshold=0.3):
+    """
+    Sets key parameters for SORT
+    """
+    self.max_age = max_age
+    self.min_hits = min_hits
+    self.iou_threshold = iou_threshold
+    self.frame_count = 0
+    self.x = np.empty((0, 7))
+    self.P = np.empty((0, 7, 7))
+    self.ids = np.empty(0, dtype=int)
+    self.time_since_update = np.empty(0, dtype=int)
+    self.hits = np.empty(0, dtype=int)
+    self.hit_streak = np.empty(0, dtype=int)
+    self.age = np.empty(0, dtype=int)
+
+  def __len__(self):
+    return len(self.ids)
+
+  def _keep(self, mask):
+    self.x = self.x[mask]
+    self.P = self.P[mask]
+    self.ids = self.ids[mask]
+    self.time_since_update = self.time_since_update[mask]
+    self.hits = self.hits[mask]
+    self.hit_streak = self.hit_streak[mask]
+    self.age = self.age[mask]
+
+  def predict(self):
+    """
+    Advances all state vectors and returns the predicted bounding boxes as an (N,4) array.
+    """
+    self.x[(self.x[:, 6] + self.x[:, 2]) <= 0, 6] = 0.
+    self.x = self.x @ self.F.T
+    self.P = self.F @ self.P @ self.F.T + self.Q
+    self.age += 1
+    self.hit_streak[self.time_since_update > 0] = 0
+    self.time_since_update += 1
+    return convert_xs_to_bboxes(self.x)
+
+  def correct(self, idx, bboxes):
+    """
+    Updates the tracks at positions idx with the observed bboxes (Joseph form, as filterpy).
+    """
+    if len(idx) == 0:
+      return
+    x = self.x[idx]
+    P = self.P[idx]
+    y = convert_bboxes_to_z(bboxes) - x[:, :4]
+    # H selects the first four state components, so H P H' and P H' are plain slices
+    S = P[:, :4, :4] + self.R
+    K = P[:, :, :4] @ np.linalg.inv(S)
+    x = x + (K @ y[:, :, None])[:, :, 0]
+    I_KH = np.broadcast_to(np.eye(7), P.shape).copy()
+    I_KH[:, :, :4] -= K
+    P = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(0, 2, 1)
+    self.x[idx] = x
+    self.P[idx] = P
+    self.time_since_update[idx] = 0
+    self.hits[idx] += 1
+    self.hit_streak[idx] += 1
+
+  def spawn(self, bboxes):
+    """
+    Starts new tracks for the given bboxes, numbering them with the shared KalmanBoxTracker counter.
+    """
+    n = len(bboxes)
+    if n == 0:
+      return
+    x = np.zeros((n, 7))
+    x[:, :4] = convert_bboxes_to_z(bboxes)
+    ids = np.arange(KalmanBoxTracker.count, KalmanBoxTracker.count + n)
+    KalmanBoxTracker.count += n
+    self.x = np.concatenate((self.x, x))
+    self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (n, 7, 7))))
+    self.ids = np.concatenate((self.ids, ids))
+    zeros = np.zeros(n, dtype=int)
+    self.time_since_update = np.concatenate((self.time_since_update, zeros))
+    self.hits = np.concatenate((self.hits, zeros))
+    self.hit_streak = np.concatenate((self.hit_streak, zeros))
+    self.age = np.concatenate((self.age, zeros))
+
+  def update(self, dets=np.empty((0, 5))):
+    """
+    Params:
+      dets - a numpy array of detections in the format [[x1,y1,x2,y2,score],[x1,y1,x2,y2,score],...]
+    Requires: this method must be called once for each frame even with empty detections (use np.empty((0, 5)) for frames without detections).
+    Returns the a similar array, where the last column is the object ID.
+
+    NOTE: The number of objects returned may differ from the number of detections provided.
+    """
+    self.frame_count += 1
+    # get predicted locations from existing trackers.
+    trks = self.predict()
+    valid = ~np.any(np.isnan(trks), axis=1)
+    if not valid.all():
+      self._keep(valid)
+      trks = trks[valid]
+    trks = np.hstack((trks, np.zeros((len(trks), 1))))
+    matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(dets,trks, self.iou_threshold)
+
+    # update matched trackers with assigned detections
+    self.correct(matched[:, 1], dets[matched[:, 0], :])
+
+    # create and initialise new trackers for unmatched detections
+    self.spawn(dets[unmatched_dets.astype(int), :])
+
+    # Sort reports tracks newest first
+    d = convert_xs_to_bboxes(self.x)[::-1]
+    tsu = self.time_since_update[::-1]
+    report = (tsu < 1) & ((self.hit_streak[::-1] >= self.min_hits) | (self.frame_count <= self.min_hits))
+    ret = np.hstack((d[report], self.ids[::-1][report, None] + 1)) # +1 as MOT benchmark requires positive
+
+    # remove dead tracklets
+    self._keep(self.time_since_update <= self.max_age)
+    if(len(ret)>0):
+      return ret
+    return np.empty((0,5))
 
 if __name__ == '__main__':
-  # all train
-  args = parse_args()
-  display = args.display
-  phase = args.phase
-  total_time = 0.0
-  total_frames = 0
-  colours = np.random.rand(32, 3) #used only for display
-  if(display):
-    if not os.path.exists('mot_benchmark'):
-      print('\n\tERROR: mot_benchmark link not found!\n\n    Create a symbolic link to the MOT benchmark\n    (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n    $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n')
-      exit()
-    plt.ion()
-    fig = plt.figure()
-    ax1 = fig.add_subplot(111, aspect='equal')
-
-  if not os.path.exists('output'):
-    os.makedirs('output')
-  pattern = os.path.join(args.seq_path, phase, '*', 'det', 'det.txt')
-  for seq_dets_fn in glob.glob(pattern):
-    mot_tracker = Sort(max_age=args.max_age, 
-                       min_hits=args.min_hits,
-                       iou_threshold=args.iou_threshold) #create instance of the SORT tracker
-    seq_dets = np.loadtxt(seq_dets_fn, delimiter=',')
-    seq = seq_dets_fn[pattern.find('*'):].split(os.path.sep)[0]
-    
-    with open(os.path.join('output', '%s.txt'%(seq)),'w') as out_file:
-      print("Processing %s."%(seq))
-      for frame in range(int(seq_dets[:,0].max())):
-        frame += 1 #detection and frame numbers begin at 1
-        dets = seq_dets[seq_dets[:, 0]==frame, 2:7]
-        dets[:, 2:4] += dets[:, 0:2] #convert to [x1,y1,w,h] to [x1,y1,x2,y2]
-        total_frames += 1
-
-        if(display):
-          fn = os.path.join('mot_benchmark', phase, seq, 'img1', '%06d.jpg'%(frame))
-          im =io.imread(fn)
-          ax1.imshow(im)
-          plt.title(seq + ' Tracked Targets')
-
-        start_time = time.time()
-        trackers = mot_tracker.update(dets)
-        cycle_time = time.time() - start_time
-        total_time += cycle_time
-
-        for d in trackers:
-          print('%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1'%(frame,d[4],d[0],d[1],d[2]-d[0],d[3]-d[1]),file=out_file)
-          if(display):
-            d = d.astype(np.int32)
-            ax1.add_patch(patches.Rectangle((d[0],d[1]),d[2]-d[0],d[3]-d[1],fill=False,lw=3,ec=colours[d[4]%32,:]))
-
-        if(display):
-          fig.canvas.flush_events()
-          plt.draw()
-          ax1.cla()
-
-  print("Total Tracking took: %.3f seconds for %d frames or %.1f FPS" % (total_time, total_frames, total_frames / total_time))
-
-  if(display):
-    print("Note: to get real runtime results run without the option: --display")
+  # the MOT demo/evaluation runner lives in mot_demo.py so that importing the tracker stays lightweight
+  from mot_demo import main
+  main()
@@ -0,0 +1,330 @@
+import math
+from collections import OrderedDict, deque
+
+import numpy as np
+
+
+class RegistryEntry:
+    """
+    Один объект в реестре: последние позиции (фиксированное число), счетчик наблюдений
+    и номер кадра, на котором объект видели в последний раз.
+    """
+    __slots__ = ("entry_id", "positions", "hits", "first_seen", "last_seen", "cell")
+
+    def __init__(self, entry_id, box, frame_index, history):
+        self.entry_id = entry_id
+        self.positions = deque([box], maxlen=history)
+        self.hits = 1
+        self.first_seen = frame_index
+        self.last_seen = frame_index
+        self.cell = None
+
+    @property
+    def box(self):
+        return self.positions[-1]
+
+
+class StationaryRegistry:
+    """
+    Реестр неподвижных объектов с пространственным индексом.
+
+    Объекты хранятся в хэш-сетке по центру рамки с шагом tolerance, поэтому поиск
+    совпадения смотрит только 3x3 соседние ячейки, а не все сохраненные позиции.
+    Рамка сопоставляется с ближайшим объектом, если евклидово расстояние между
+    векторами (x1, y1, x2, y2) меньше tolerance. Для каждого объекта хранится не
+    больше history позиций; объекты, которых не видели дольше max_idle кадров,
+    удаляются, а общее число объектов ограничено max_entries.
+    """
+
+    def __init__(self, tolerance=200, history=2, stationary_hits=3, max_idle=300, max_entries=10000):
+        """
+        :param tolerance: Допустимое смещение рамки (в пикселях) для того же объекта.
+        :param history: Сколько последних позиций хранить для объекта.
+        :param stationary_hits: Сколько наблюдений нужно, чтобы считать объект неподвижным.
+        :param max_idle: Через сколько кадров без наблюдений объект удаляется.
+        :param max_entries: Максимальное число объектов в реестре.
+        """
+        self.tolerance = float(tolerance)
+        self.history = history
+        self.stationary_hits = stationary_hits
+        self.max_idle = max_idle
+        self.max_entries = max_entries
+
+        self._grid = {}
+        # Порядок вставки = порядок последнего наблюдения: устаревшие объекты всегда в начале
+        self._entries = OrderedDict()
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _cell(self, box):
+        cx = (box[0] + box[2]) / 2.0
+        cy = (box[1] + box[3]) / 2.0
+        return int(cx // self.tolerance), int(cy // self.tolerance)
+
+    def _place(self, entry):
+        cell = self._cell(entry.box)
+        if cell == entry.cell:
+            return
+        if entry.cell is not None:
+            self._unplace(entry)
+        self._grid.setdefault(cell, set()).add(entry.entry_id)
+        entry.cell = cell
+
+    def _unplace(self, entry):
+        ids = self._grid.get(entry.cell)
+        if ids is not None:
+            ids.discard(entry.entry_id)
+            if not ids:
+                del self._grid[entry.cell]
+        entry.cell = None
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id)
+        self._unplace(entry)
+
+    def evict(self, frame_index):
+        """
+        Удаляет объекты, которых не видели дольше max_idle кадров, и самые старые
+        объекты сверх max_entries.
+        """
+        while self._entries:
+            entry_id, entry = next(iter(self._entries.items()))
+            if frame_index - entry.last_seen <= self.max_idle and len(self._entries) <= self.max_entries:
+                break
+            self._remove(entry_id)
+
+    def match(self, box, frame_index=None):
+        """
+        Ищет ближайший объект в пределах tolerance. При таком смещении центр рамки
+        сдвигается меньше чем на tolerance, поэтому достаточно соседних ячеек.
+
+        :param box: Рамка (x1, y1, x2, y2).
+        :param frame_index: Если задан, объекты, уже обновленные на этом кадре, пропускаются.
+        :return: RegistryEntry или None.
+        """
+        cx, cy = self._cell(box)
+        best, best_distance = None, self.tolerance
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for entry_id in self._grid.get((cx + dx, cy + dy), ()):
+                    entry = self._entries[entry_id]
+                    if frame_index is not None and entry.last_seen == frame_index:
+                        continue
+                    distance = math.dist(box, entry.box)
+                    if distance < best_distance:
+                        best, best_distance = entry, distance
+        return best
+
+    def observe(self, box, frame_index):
+        """
+        Регистрирует наблюдение рамки на кадре.
+
+        :param box: Рамка (x1, y1, x2, y2).
+        :param frame_index: Номер кадра.
+        :return: Кортеж (entry, stationary).
+        """
+        box = tuple(float(v) for v in box[:4])
+        entry = self.match(box, frame_index)
+        if entry is None:
+            entry = RegistryEntry(self._next_id, box, frame_index, self.history)
+            self._next_id += 1
+            self._entries[entry.entry_id] = entry
+        else:
+            entry.positions.append(box)
+            entry.hits += 1
+            entry.last_seen = frame_index
+            self._entries.move_to_end(entry.entry_id)
+        self._place(entry)
+        self.evict(frame_index)
+        return entry, self.is_stationary(entry)
+
+    def is_stationary(self, entry):
+        # Объект неподвижен, если его видели достаточно раз и среднее смещение
+        # последних позиций относительно первой из них меньше tolerance
+        if entry.hits < self.stationary_hits:
+            return False
+        positions = np.asarray(entry.positions)
+        avg_position_change = np.linalg.norm(positions - positions[0], axis=1).mean()
+        return avg_position_change < self.tolerance
+
+
+class StaticObject:
+    """
+    Подтвержденный неподвижный объект: последнее место, число наблюдений, кадры
+    первого и последнего наблюдения и id треков, связанных с ним.
+    """
+    __slots__ = ("object_id", "box", "hits", "first_seen", "last_seen", "cells", "tracks")
+
+    def __init__(self, object_id, box, frame_index):
+        self.object_id = object_id
+        self.box = box
+        self.hits = 0
+        self.first_seen = frame_index
+        self.last_seen = frame_index
+        self.cells = ()
+        self.tracks = set()
+
+
+class StaticObjectRegistry:
+    """
+    Долгоживущие идентификаторы мусора поверх трекера.
+
+    Трек SORT умирает после max_age пропусков и возвращается с новым id, хотя мусор
+    лежит на месте. Реестр хранит подтвержденные места объектов в хэш-сетке (объект
+    записан во все ячейки, которые покрывает его рамка), и трек с незнакомым id сначала
+    сопоставляется с известным объектом по IoU или расстоянию между центрами — тогда
+    повторного уведомления нет. Объекты, которых не видели дольше ttl кадров, и связи
+    id треков с объектами удаляются; размер реестра ограничен max_objects, число связей —
+    max_tracks. Связи удаляются вместе с объектом.
+    """
+
+    def __init__(self, iou_threshold=0.3, centroid_tolerance=20, ttl=45000, max_objects=10000, cell_size=64,
+                 max_tracks=None):
+        """
+        :param iou_threshold: Минимальный IoU рамки трека с местом объекта.
+        :param centroid_tolerance: Максимальное расстояние между центрами рамок, в пикселях.
+        :param ttl: Через сколько кадров без наблюдений объект забывается.
+        :param max_objects: Максимальное число объектов в реестре.
+        :param cell_size: Шаг сетки пространственного индекса, в пикселях.
+        :param max_tracks: Максимальное число связей id трека с объектом (по умолчанию 4 * max_objects).
+        """
+        self.iou_threshold = iou_threshold
+        self.centroid_tolerance = float(centroid_tolerance)
+        self.ttl = ttl
+        self.max_objects = max_objects
+        self.max_tracks = 4 * max_objects if max_tracks is None else max_tracks
+        self.cell_size = float(cell_size)
+
+        self._grid = {}
+        # Порядок вставки = порядок последнего наблюдения: устаревшие записи всегда в начале
+        self._objects = OrderedDict()
+        self._tracks = OrderedDict()  # id трека -> (id объекта, кадр последнего наблюдения)
+        self._next_id = 0
+        self.reidentified = 0  # Треков, сопоставленных с уже известным объектом
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __contains__(self, object_id):
+        return object_id in self._objects
+
+    def _cells(self, box, margin=0.0):
+        size = self.cell_size
+        x1, y1 = int((box[0] - margin) // size), int((box[1] - margin) // size)
+        x2, y2 = int((box[2] + margin) // size), int((box[3] + margin) // size)
+        return [(cx, cy) for cx in range(x1, x2 + 1) for cy in range(y1, y2 + 1)]
+
+    def _place(self, obj):
+        cells = self._cells(obj.box)
+        if cells == obj.cells:
+            return
+        self._unplace(obj)
+        for cell in cells:
+            self._grid.setdefault(cell, set()).add(obj.object_id)
+        obj.cells = cells
+
+    def _unplace(self, obj):
+        for cell in obj.cells:
+            ids = self._grid.get(cell)
+            if ids is not None:
+                ids.discard(obj.object_id)
+                if not ids:
+                    del self._grid[cell]
+        obj.cells = ()
+
+    def _unlink(self, track_id):
+        object_id, _ = self._tracks.pop(track_id)
+        obj = self._objects.get(object_id)
+        if obj is not None:
+            obj.tracks.discard(track_id)
+
+    def evict(self, frame_index):
+        """
+        Удаляет объекты и связи треков, не наблюдавшиеся дольше ttl кадров,
+        самые старые объекты сверх max_objects и самые старые связи сверх max_tracks.
+        """
+        while self._objects:
+            object_id, obj = next(iter(self._objects.items()))
+            if frame_index - obj.last_seen <= self.ttl and len(self._objects) <= self.max_objects:
+                break
+            self._unplace(self._objects.pop(object_id))
+            # Связи удаленного объекта могут стоять в очереди за живыми — убираем их сразу
+            for track_id in obj.tracks:
+                del self._tracks[track_id]
+        while self._tracks:
+            track_id, (_, last_seen) = next(iter(self._tracks.items()))
+            if frame_index - last_seen <= self.ttl and len(self._tracks) <= self.max_tracks:
+                break
+            self._unlink(track_id)
+
+    def match(self, box):
+        """
+        Ищет известный объект для рамки: наибольший IoU не ниже iou_threshold или,
+        если такого нет, ближайший центр в пределах centroid_tolerance.
+
+        :param box: Рамка (x1, y1, x2, y2).
+        :return: StaticObject или None.
+        """
+        candidates = set()
+        # Центр объекта в пределах centroid_tolerance лежит в расширенной рамке,
+        # а объект записан во все ячейки своей рамки — значит, он найдется в этих ячейках
+        for cell in self._cells(box, self.centroid_tolerance):
+            candidates.update(self._grid.get(cell, ()))
+        if not candidates:
+            return None
+        objects = [self._objects[object_id] for object_id in candidates]
+        boxes = np.array([obj.box for obj in objects])
+        query = np.asarray(box, dtype=float)
+
+        w = np.maximum(0., np.minimum(boxes[:, 2], query[2]) - np.maximum(boxes[:, 0], query[0]))
+        h = np.maximum(0., np.minimum(boxes[:, 3], query[3]) - np.maximum(boxes[:, 1], query[1]))
+        inter = w * h
+        union = ((boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+                 + (query[2] - query[0]) * (query[3] - query[1]) - inter)
+        iou = inter / np.maximum(union, 1e-9)
+        best = int(np.argmax(iou))
+        if iou[best] >= self.iou_threshold:
+            return objects[best]
+
+        centers = (boxes[:, :2] + boxes[:, 2:4]) / 2.0
+        distance = np.linalg.norm(centers - (query[:2] + query[2:4]) / 2.0, axis=1)
+        best = int(np.argmin(distance))
+        return objects[best] if distance[best] <= self.centroid_tolerance else None
+
+    def observe(self, track_id, box, frame_index):
+        """
+        Регистрирует подтвержденный трек на кадре.
+
+        :param track_id: Id трека SORT.
+        :param box: Рамка трека (x1, y1, x2, y2).
+        :param frame_index: Номер кадра.
+        :return: Кортеж (object_id, is_new): is_new — объект раньше не встречался,
+                 и о нем нужно уведомить.
+        """
+        box = tuple(float(v) for v in box[:4])
+        link = self._tracks.get(track_id)
+        obj = self._objects.get(link[0]) if link is not None else None
+        if link is not None and obj is None:
+            del self._tracks[track_id]
+        is_new = False
+        if obj is None:
+            obj = self.match(box)
+            if obj is None:
+                obj = StaticObject(self._next_id, box, frame_index)
+                self._next_id += 1
+                self._objects[obj.object_id] = obj
+                is_new = True
+            else:
+                self.reidentified += 1
+        obj.box = box
+        obj.hits += 1
+        obj.last_seen = frame_index
+        self._objects.move_to_end(obj.object_id)
+        self._place(obj)
+        self._tracks[track_id] = (obj.object_id, frame_index)
+        self._tracks.move_to_end(track_id)
+        obj.tracks.add(track_id)
+        self.evict(frame_index)
+        return obj.object_id, is_new